@@ -0,0 +1,180 @@
+import json
+import threading
+import time
+import urllib.parse
+import soupsieve
+
+
+# site adapters
+# every adapter has extraction plans tried in order until one finds a name, ingredients and steps; plans are compiled
+# once when the module is imported, and every adapter counts pages, failures, time spent, and which plans matched
+# ADAPTERS maps a host to its adapter, pages of other hosts (or without a URL) use DEFAULT_ADAPTER
+
+
+# extraction plan reading page elements through CSS selectors
+# fields: dictionary of 'name', 'ingredients', 'steps' to (selector, inner selector or None, how to read the text)
+# 'name' reads the first match, the others every match; the inner selector picks an element inside each match
+# text is read as 'string' (the element's only string), 'first' (its first child), or 'text' (all of its text)
+
+class SelectorPlan:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = {field: (soupsieve.compile(selector), soupsieve.compile(inner) if inner else None, how)
+                       for field, (selector, inner, how) in fields.items()}
+
+    def extract(self, soup):
+        extracted = {}
+        for field, (selector, inner, how) in self.fields.items():
+            elements = [selector.select_one(soup)] if field == 'name' else selector.select(soup)
+            if inner:
+                elements = [inner.select_one(element) if element else None for element in elements]
+            texts = [element_text(element, how) for element in elements if element is not None]
+            extracted[field] = [text for text in texts if text]  # i.e. a step span with nested tags has no string
+        if not all(extracted.values()):
+            return None
+        extracted['name'] = extracted['name'][0]
+        return extracted
+
+
+# read the text of an element, as a plain string (a NavigableString would keep the whole parse tree alive)
+def element_text(element, how):
+    if how == 'first':
+        text = element.contents[0] if element.contents else None
+    elif how == 'text':
+        text = element.get_text(' ', strip=True)
+    else:
+        text = element.string
+    return str(text) if text is not None else None
+
+
+# extraction plan reading the schema.org Recipe of a page's JSON-LD script blocks
+
+class JsonLdPlan:
+    def __init__(self, name):
+        self.name = name
+        self.scripts = soupsieve.compile('script[type="application/ld+json"]')
+
+    def extract(self, soup):
+        for script in self.scripts.select(soup):
+            try:
+                data = json.loads(script.string or '')
+            except ValueError:
+                continue
+            for item in json_ld_items(data):
+                types = item.get('@type')
+                if 'Recipe' not in (types if isinstance(types, list) else [types]):
+                    continue
+                steps = list(instruction_texts(item.get('recipeInstructions')))
+                ingredients = [text for text in item.get('recipeIngredient') or [] if isinstance(text, str)]
+                if item.get('name') and ingredients and steps:
+                    return {'name': item['name'], 'ingredients': ingredients, 'steps': steps}
+        return None
+
+
+# walk the objects of a JSON-LD document (top level lists and @graph)
+def json_ld_items(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from json_ld_items(item)
+    elif isinstance(data, dict):
+        yield data
+        if '@graph' in data:
+            yield from json_ld_items(data['@graph'])
+
+
+# get the step texts of JSON-LD recipeInstructions (a string, HowToStep objects, or HowToSection objects of them)
+def instruction_texts(instructions):
+    if isinstance(instructions, str):
+        yield from (line.strip() for line in instructions.splitlines() if line.strip())
+    elif isinstance(instructions, list):
+        for instruction in instructions:
+            yield from instruction_texts(instruction)
+    elif isinstance(instructions, dict):
+        if 'itemListElement' in instructions:
+            yield from instruction_texts(instructions['itemListElement'])
+        elif instructions.get('text'):
+            yield instructions['text'].strip()
+
+
+# adapter of a site: its extraction plans, in the order they are tried, and its counters
+
+class Adapter:
+    def __init__(self, name, plans):
+        self.name = name
+        self.plans = plans
+        self.lock = threading.Lock()
+        # pages: pages extracted, failures: pages no plan matched, seconds: time spent extracting,
+        # plans: how many pages each plan matched
+        self.metrics = {'pages': 0, 'failures': 0, 'seconds': 0.0, 'plans': {plan.name: 0 for plan in plans}}
+
+    def extract(self, soup):
+        # get {'name', 'ingredients', 'steps'} of a page from the first plan that finds them all
+        start = time.perf_counter()
+        extracted = None
+        for plan in self.plans:
+            extracted = plan.extract(soup)
+            if extracted:
+                break
+        with self.lock:
+            self.metrics['pages'] += 1
+            self.metrics['seconds'] += time.perf_counter() - start
+            if extracted:
+                self.metrics['plans'][plan.name] += 1
+            else:
+                self.metrics['failures'] += 1
+        if not extracted:
+            raise ValueError('No extraction plan of the ' + self.name + ' adapter matched the page')
+        return extracted
+
+    def stats(self):
+        with self.lock:
+            return dict(self.metrics, plans=dict(self.metrics['plans']))
+
+
+# extraction plans
+
+# allrecipes layout the parser was written for
+ALLRECIPES_LEGACY = SelectorPlan('allrecipes legacy', {
+    'name': ('h1#recipe-main-content', None, 'string'),
+    'ingredients': ('span.recipe-ingred_txt.added', None, 'first'),
+    'steps': ('ol.list-numbers.recipe-directions__list > li', 'span', 'string'),
+})
+
+# current allrecipes (Dotdash Meredith) layout
+ALLRECIPES_CURRENT = SelectorPlan('allrecipes current', {
+    'name': ('h1.article-heading, h1#article-heading_1-0', None, 'text'),
+    'ingredients': ('ul.mntl-structured-ingredients__list > li', None, 'text'),
+    'steps': ('ol.mntl-sc-block-group--OL > li', 'p', 'text'),
+})
+
+# schema.org Recipe metadata, published by most recipe sites
+JSON_LD = JsonLdPlan('json-ld')
+
+
+# adapters by host
+ALLRECIPES_ADAPTER = Adapter('allrecipes', [ALLRECIPES_LEGACY, ALLRECIPES_CURRENT, JSON_LD])
+ADAPTERS = {'www.allrecipes.com': ALLRECIPES_ADAPTER, 'allrecipes.com': ALLRECIPES_ADAPTER}
+DEFAULT_ADAPTER = Adapter('default', [ALLRECIPES_LEGACY, JSON_LD, ALLRECIPES_CURRENT])
+
+
+# get the adapter of a URL's host, None if the host has none
+def adapter_for(url):
+    return ADAPTERS.get((urllib.parse.urlsplit(url).hostname or '').lower())
+
+
+# register an adapter for one or more hosts
+def register(adapter, *hosts):
+    for host in hosts:
+        ADAPTERS[host.lower()] = adapter
+
+
+# get {'name', 'ingredients', 'steps'} of a parsed page, using the adapter of its URL's host if known
+def extract(soup, url=None):
+    adapter = (adapter_for(url) if url else None) or DEFAULT_ADAPTER
+    return adapter.extract(soup)
+
+
+# counters of every adapter, keyed on adapter name
+def stats():
+    adapters = {id(adapter): adapter for adapter in list(ADAPTERS.values()) + [DEFAULT_ADAPTER]}
+    return {adapter.name: adapter.stats() for adapter in adapters.values()}
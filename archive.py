@@ -0,0 +1,240 @@
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import recipe_transform
+
+
+# compact archive of parsed recipes, read through a memory map
+# file layout (little-endian):
+#   header: magic, format version, recipe count, string count, and the offsets of the string blob, string index and
+#           recipe index
+#   recipe records, one after another
+#   string blob: every distinct string (names, adjectives, categories, units, methods, tools, step text) once, utf-8
+#   string index (8 byte aligned): string count + 1 offsets into the blob, string i is blob[index[i]:index[i + 1]]
+#   recipe index: recipe count + 1 offsets of the recipe records, so any recipe is found in O(1)
+# a recipe record is RECIPE_HEADER, its tool and other method string ids, its ingredients (INGREDIENT each), then its
+# steps (STEP each, followed by the step's ingredient positions in the recipe, method string ids, and spans)
+# string id -1 stands for None, amount nan for no amount
+
+ARCHIVE_MAGIC = b'RTARCH'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct('<6sHIIQQQ')
+RECIPE_HEADER = struct.Struct('<iiHHHH?')  # name, primary method, ingredient/step/tool/other method counts, bake
+INGREDIENT = struct.Struct('<iiiid')  # name, adjective, category, unit, amount
+STEP = struct.Struct('<iHHH')  # text, ingredient/method/span counts
+SPAN = struct.Struct('<IIBi')  # start, end, kind (0 ingredient, 1 method), ingredient position or method string id
+
+
+# write recipes (any iterable of Recipe objects, consumed one at a time) to an archive at path
+def write_archive(recipes, path):
+    strings = {}
+    recipe_offsets = []
+    temporary_path = path + '.tmp'
+
+    def string_id(value):
+        if value is None:
+            return -1
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    with open(temporary_path, 'wb') as archive_file:
+        archive_file.write(bytes(ARCHIVE_HEADER.size))
+        for recipe in recipes:
+            recipe_offsets.append(archive_file.tell())
+            archive_file.write(recipe_record(recipe, string_id))
+        # string blob and index
+        blob_offset = archive_file.tell()
+        recipe_offsets.append(blob_offset)  # end of the last record
+        string_offsets = [0]
+        for value in strings:  # dictionaries keep insertion order, so string i is the ith written
+            encoded = value.encode('utf-8')
+            archive_file.write(encoded)
+            string_offsets.append(string_offsets[-1] + len(encoded))
+        archive_file.write(bytes(-archive_file.tell() % 8))  # align the offset tables
+        string_index_offset = archive_file.tell()
+        archive_file.write(struct.pack('<{0}Q'.format(len(string_offsets)), *string_offsets))
+        recipe_index_offset = archive_file.tell()
+        archive_file.write(struct.pack('<{0}Q'.format(len(recipe_offsets)), *recipe_offsets))
+        archive_file.seek(0)
+        archive_file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, len(recipe_offsets) - 1, len(strings),
+                                               blob_offset, string_index_offset, recipe_index_offset))
+    os.replace(temporary_path, path)
+    return len(recipe_offsets) - 1
+
+
+# encode one recipe record, string_id maps a string (or None) to its id
+def recipe_record(recipe, string_id):
+    positions = {id(ingredient): position for position, ingredient in enumerate(recipe.ingredients)}
+    parts = [RECIPE_HEADER.pack(string_id(recipe.name), string_id(recipe.primary_method), len(recipe.ingredients),
+                                len(recipe.steps), len(recipe.tools), len(recipe.other_methods), bool(recipe.bake))]
+    parts.append(struct.pack('<{0}i'.format(len(recipe.tools) + len(recipe.other_methods)),
+                             *[string_id(value) for value in list(recipe.tools) + list(recipe.other_methods)]))
+    for ingredient in recipe.ingredients:
+        amount = float(ingredient.amount) if isinstance(ingredient.amount, (int, float)) else math.nan
+        parts.append(INGREDIENT.pack(string_id(ingredient.name), string_id(ingredient.adjective),
+                                     string_id(ingredient.category), string_id(ingredient.unit), amount))
+    for step in recipe.steps:
+        # steps only link ingredients of their recipe, anything else (none in parsed recipes) is left out
+        linked = [positions[id(ingredient)] for ingredient in step.ingredients if id(ingredient) in positions]
+        methods = list(step.methods or [])
+        spans = [(span.start, span.end, 0, positions[id(span.ref)]) if span.kind == 'ingredient'
+                 else (span.start, span.end, 1, string_id(span.ref))
+                 for span in step.spans if span.kind != 'ingredient' or id(span.ref) in positions]
+        parts.append(STEP.pack(string_id(step.text), len(linked), len(methods), len(spans)))
+        parts.append(struct.pack('<{0}H{1}i'.format(len(linked), len(methods)), *linked,
+                                 *[string_id(method) for method in methods]))
+        parts.extend(SPAN.pack(*span) for span in spans)
+    return b''.join(parts)
+
+
+# archive opened through a memory map
+# recipes are only decoded when asked for, so opening an archive of any size costs the same; strings are decoded
+# once and cached
+
+class Archive:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.recipe_count, self.string_count, self.blob_offset, string_index_offset,
+         recipe_index_offset) = ARCHIVE_HEADER.unpack_from(self.mapped)
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+            raise ValueError('Not a recipe archive (or an unsupported version): ' + str(path))
+        # offset tables, viewed in place rather than copied
+        self.view = memoryview(self.mapped)
+        self.string_index = self.view[string_index_offset:string_index_offset + 8 * (self.string_count + 1)].cast('Q')
+        self.recipe_index = self.view[recipe_index_offset:recipe_index_offset + 8 * (self.recipe_count + 1)].cast('Q')
+        self.strings = {}
+
+    def __len__(self):
+        return self.recipe_count
+
+    def __getitem__(self, index):
+        return self.recipe(index)
+
+    def __iter__(self):
+        for index in range(self.recipe_count):
+            yield self.recipe(index)
+
+    def string(self, string_id):
+        # decode a string of the string dictionary, None for -1
+        if string_id < 0:
+            return None
+        value = self.strings.get(string_id)
+        if value is None:
+            start = self.blob_offset + self.string_index[string_id]
+            end = self.blob_offset + self.string_index[string_id + 1]
+            value = self.strings[string_id] = str(self.view[start:end], 'utf-8')
+        return value
+
+    def record(self, index):
+        # decode recipe index into plain values: (name, primary method, bake, tools, other methods, ingredients as
+        # (name, adjective, category, amount, unit) tuples, steps as (text, ingredient positions, methods, spans))
+        if not 0 <= index < self.recipe_count:
+            raise IndexError('recipe index out of range')
+        offset = self.recipe_index[index]
+        (name_id, primary_id, ingredient_count, step_count, tool_count, other_count,
+         bake) = RECIPE_HEADER.unpack_from(self.mapped, offset)
+        offset += RECIPE_HEADER.size
+        ids = struct.unpack_from('<{0}i'.format(tool_count + other_count), self.mapped, offset)
+        offset += 4 * len(ids)
+        ingredients = []
+        for _ in range(ingredient_count):
+            name, adjective, category, unit, amount = INGREDIENT.unpack_from(self.mapped, offset)
+            offset += INGREDIENT.size
+            ingredients.append((self.string(name), self.string(adjective), self.string(category),
+                                None if math.isnan(amount) else amount, self.string(unit)))
+        steps = []
+        for _ in range(step_count):
+            text, linked_count, method_count, span_count = STEP.unpack_from(self.mapped, offset)
+            offset += STEP.size
+            links = struct.unpack_from('<{0}H{1}i'.format(linked_count, method_count), self.mapped, offset)
+            offset += 2 * linked_count + 4 * method_count
+            spans = []
+            for _ in range(span_count):
+                start, end, kind, ref = SPAN.unpack_from(self.mapped, offset)
+                offset += SPAN.size
+                spans.append((start, end, 'method', self.string(ref)) if kind else (start, end, 'ingredient', ref))
+            steps.append((self.string(text), list(links[:linked_count]),
+                          [self.string(method) for method in links[linked_count:]], spans))
+        tools = [self.string(value) for value in ids[:tool_count]]
+        other_methods = [self.string(value) for value in ids[tool_count:]]
+        return self.string(name_id), self.string(primary_id), bake, tools, other_methods, ingredients, steps
+
+    def recipe(self, index):
+        # rebuild recipe index as a Recipe, with its steps linked to its Ingredient objects as when it was parsed
+        name, primary_method, bake, tools, other_methods, ingredient_values, step_values = self.record(index)
+        ingredients = [recipe_transform.Ingredient(*values) for values in ingredient_values]
+        steps = []
+        for text, positions, methods, spans in step_values:
+            steps.append(recipe_transform.Step.from_parts(
+                text, [ingredients[position] for position in positions], methods,
+                [recipe_transform.Span(start, end, kind, ingredients[ref] if kind == 'ingredient' else ref)
+                 for start, end, kind, ref in spans]))
+        return recipe_transform.Recipe.from_parts(name, ingredients, steps, tools, primary_method, other_methods, bake)
+
+    def close(self):
+        self.string_index.release()
+        self.recipe_index.release()
+        self.view.release()
+        self.mapped.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# time writing, opening, and reading an archive of recipe_count recipes (100 parsed synthetic recipes, repeated)
+# the archive is written to path, or to a temporary directory removed afterwards if None
+def benchmark(recipe_count=100000, path=None):
+    import random
+    import synthetic
+    from bs4 import BeautifulSoup
+    recipe_transform.VERBOSE.set(False)
+    parsed = [recipe_transform.Recipe(BeautifulSoup(page, 'html.parser')) for page in synthetic.generate_corpus(100)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = path or os.path.join(directory, 'benchmark.rtar')
+        start = time.perf_counter()
+        write_archive((parsed[index % len(parsed)] for index in range(recipe_count)), path)
+        print('write: {0:.2f}s, {1:.1f} MB'.format(time.perf_counter() - start, os.path.getsize(path) / 1e6))
+        start = time.perf_counter()
+        with Archive(path) as archive:
+            print('open: {0:.2f}ms for {1} recipes'.format((time.perf_counter() - start) * 1000, len(archive)))
+            indexes = [random.randrange(len(archive)) for _ in range(1000)]
+            start = time.perf_counter()
+            for index in indexes:
+                archive.recipe(index)
+            print('random access: {0:.1f}us per recipe'.format((time.perf_counter() - start) * 1000))
+
+
+if __name__ == '__main__':
+    # usage: python archive.py write ARCHIVE.rtar PAGE.html [PAGE.html ...]
+    #        python archive.py list ARCHIVE.rtar
+    #        python archive.py benchmark [RECIPE_COUNT]
+    if len(sys.argv) > 3 and sys.argv[1] == 'write':
+        from bs4 import BeautifulSoup
+        recipe_transform.VERBOSE.set(False)
+
+        def parse_pages(paths):
+            for page_path in paths:
+                with open(page_path) as page_file:
+                    yield recipe_transform.Recipe(BeautifulSoup(page_file.read(), 'html.parser'))
+
+        print(write_archive(parse_pages(sys.argv[3:]), sys.argv[2]), 'recipes written')
+    elif len(sys.argv) > 2 and sys.argv[1] == 'list':
+        with Archive(sys.argv[2]) as recipe_archive:
+            for recipe_index in range(len(recipe_archive)):
+                print(recipe_index, recipe_archive.record(recipe_index)[0])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    else:
+        print('usage: python archive.py write ARCHIVE.rtar PAGE.html [PAGE.html ...] | list ARCHIVE.rtar | '
+              'benchmark [RECIPE_COUNT]')
+        sys.exit(1)
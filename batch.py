@@ -0,0 +1,57 @@
+import concurrent.futures
+import os
+import sys
+import sysconfig
+import time
+from bs4 import BeautifulSoup
+import recipe_transform
+
+
+# parse a recipe page and transform a copy of it, without printing
+def parse_and_transform(html, transformations):
+    recipe_transform.VERBOSE.set(False)
+    recipe = recipe_transform.Recipe(BeautifulSoup(html, 'html.parser'))
+    return recipe_transform.transform_recipe(recipe, *transformations)
+
+
+# transform a shared parsed recipe, without printing
+def transform_quietly(recipe, transformations):
+    recipe_transform.VERBOSE.set(False)
+    return recipe_transform.transform_recipe(recipe, *transformations)
+
+
+# parse and transform many recipe pages on a thread pool, results are in the order of pages
+def transform_many(pages, transformations, max_workers=None):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(parse_and_transform, pages, [transformations] * len(pages)))
+
+
+# time transform_many with increasing thread counts and print the speedup over one thread
+def benchmark_threads(pages, transformations, thread_counts=(1, 2, 4, 8), repeat=3):
+    gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('Free-threaded build: {0}, GIL enabled: {1}, CPUs: {2}'.format(
+        bool(sysconfig.get_config_var('Py_GIL_DISABLED')), gil_enabled, os.cpu_count()))
+    results = {}
+    for thread_count in thread_counts:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            transform_many(pages, transformations, thread_count)
+            timings.append(time.perf_counter() - start)
+        results[thread_count] = min(timings)
+        print('{0:>3} threads: {1:.3f}s, {2:.1f} recipes/s, speedup {3:.2f}x'.format(
+            thread_count, results[thread_count], len(pages) / results[thread_count],
+            results[thread_counts[0]] / results[thread_count]))
+    return results
+
+
+if __name__ == '__main__':
+    # usage: python batch.py TRANSFORMATION[,TRANSFORMATION...] PAGE.html [PAGE.html ...]
+    if len(sys.argv) < 3:
+        print('usage: python batch.py TRANSFORMATION[,TRANSFORMATION...] PAGE.html [PAGE.html ...]')
+        sys.exit(1)
+    html_pages = []
+    for page_path in sys.argv[2:]:
+        with open(page_path) as page_file:
+            html_pages.append(page_file.read())
+    benchmark_threads(html_pages, sys.argv[1].split(','))
@@ -0,0 +1,208 @@
+import collections
+import contextlib
+import contextvars
+import sys
+import threading
+import time
+
+
+# latency budgets
+# a request runs its parsing and transforming inside a Budget; stages check it as they go (see stage and checkpoint),
+# and once the budget is nearly used up the rest of the request uses cheap fallbacks instead of the precise but slow
+# lookups: POS tags and lemmas from the lexicon tables (and suffix heuristics) instead of wordnet, and a regular
+# expression instead of the NLTK tokenizer
+# a recipe parsed or transformed with fallbacks is marked degraded (recipe.degraded lists the fallbacks that fired)
+# the budget is kept per thread (and asyncio task), so concurrent requests each have their own
+
+BUDGET = contextvars.ContextVar('budget', default=None)
+
+# share of a budget left when the request switches to the fallbacks
+RESERVE = 0.25
+
+# fallbacks, each counted when it is used instead of the precise lookup
+FALLBACKS = ['pos', 'lemma', 'tokenize']
+
+# most request latencies kept for the distributions of stats()
+LATENCY_WINDOW = 10000
+
+
+# deadline of one request
+# use as a context manager: with Budget(0.2): recipe = Recipe(soup) ...
+# a request whose stages run apart (i.e. in a pipeline, see pipeline.py) enters its budget once per stage, stages
+# times: each stage goes on from the time the ones before it spent, and the request is recorded when the last one
+# closes (or one raises); the budget pickles, so its stages can run in other processes
+
+class Budget:
+    def __init__(self, seconds, reserve=RESERVE, stages=1):
+        self.seconds = seconds
+        self.reserve = reserve
+        self.stages = stages  # stages still to run
+        self.elapsed = 0.0  # seconds spent in the stages closed so far
+        self.start = None
+        self.switch_at = None
+        self.deadline = None
+        self.cheap = False
+        self.switched = None  # stage the request switched to the fallbacks in
+        self.fallbacks = collections.Counter()
+        self.token = None
+
+    def __enter__(self):
+        self.start = time.perf_counter() - self.elapsed
+        self.switch_at = self.start + self.seconds * (1 - self.reserve)
+        self.deadline = self.start + self.seconds
+        self.token = BUDGET.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        BUDGET.reset(self.token)
+        self.token = None
+        self.elapsed = time.perf_counter() - self.start
+        self.stages -= 1
+        if self.stages <= 0 or exc_type is not None:
+            record(self.elapsed, self)
+
+    def checkpoint(self, stage):
+        # switch to the fallbacks if the budget is nearly used up
+        if not self.cheap and time.perf_counter() >= self.switch_at:
+            self.cheap = True
+            self.switched = stage
+
+    def remaining(self):
+        return self.deadline - time.perf_counter()
+
+
+# check the budget of the current request (if any) between stages
+def checkpoint(stage):
+    budget = BUDGET.get()
+    if budget is not None:
+        budget.checkpoint(stage)
+
+
+# iterate over the items of a stage, checking the budget of the current request (if any) before each
+def stage(name, items):
+    budget = BUDGET.get()
+    for item in items:
+        if budget is not None:
+            budget.checkpoint(name)
+        yield item
+
+
+# check if a fallback should be used instead of a precise lookup, counting it if so
+def cheap(fallback):
+    budget = BUDGET.get()
+    if budget is None or not budget.cheap:
+        return False
+    budget.fallbacks[fallback] += 1
+    return True
+
+
+# get the fallbacks used so far by the current request, sorted
+def fired():
+    budget = BUDGET.get()
+    return sorted(budget.fallbacks) if budget is not None else []
+
+
+# metrics
+# requests: budgeted requests finished, degraded: requests that used a fallback, overruns: requests that took longer
+# than their budget, switches: stage requests switched to the fallbacks in, fallbacks: how often each fallback was
+# used; latencies of the latest requests with and without fallbacks
+
+METRICS = {'requests': 0, 'degraded': 0, 'overruns': 0, 'switches': collections.Counter(),
+           'fallbacks': collections.Counter()}
+LATENCIES = {'full': collections.deque(maxlen=LATENCY_WINDOW), 'degraded': collections.deque(maxlen=LATENCY_WINDOW)}
+METRICS_LOCK = threading.Lock()
+
+# records of the requests finished while collecting (see collect), None to add them to METRICS
+RECORDS = contextvars.ContextVar('budget_records', default=None)
+
+
+# record a finished request, as (latency, budget seconds, stage switched in, fallbacks)
+def record(seconds, budget):
+    entry = (seconds, budget.seconds, budget.switched, dict(budget.fallbacks))
+    records = RECORDS.get()
+    if records is not None:
+        records.append(entry)
+    else:
+        merge([entry])
+
+
+# add records of finished requests to the metrics (i.e. ones collected in another process)
+def merge(records):
+    with METRICS_LOCK:
+        for seconds, budget_seconds, switched, fallbacks in records:
+            METRICS['requests'] += 1
+            METRICS['overruns'] += seconds > budget_seconds
+            if switched:
+                METRICS['switches'][switched] += 1
+            METRICS['fallbacks'].update(fallbacks)
+            if fallbacks:
+                METRICS['degraded'] += 1
+            LATENCIES['degraded' if fallbacks else 'full'].append(seconds)
+
+
+# collect the records of the requests finished inside into a list instead of adding them to the metrics, so a process
+# pool worker can send them back with its result for merge
+@contextlib.contextmanager
+def collect():
+    records = []
+    token = RECORDS.set(records)
+    try:
+        yield records
+    finally:
+        RECORDS.reset(token)
+
+
+# get percentiles (0 to 100) of a list of latencies, None if there are none
+def percentiles(latencies, points=(50, 90, 99)):
+    if not latencies:
+        return None
+    ordered = sorted(latencies)
+    return {point: ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] for point in points}
+
+
+# snapshot of the metrics, with latency percentiles of full and degraded requests
+def stats():
+    with METRICS_LOCK:
+        snapshot = dict(METRICS, switches=dict(METRICS['switches']), fallbacks=dict(METRICS['fallbacks']))
+        snapshot['latencies'] = {kind: percentiles(list(latencies)) for kind, latencies in LATENCIES.items()}
+    return snapshot
+
+
+# parse and transform count synthetic pages with wordnet lookups not cached yet, without a budget and then with a
+# budget of seconds per request, and print the latency distribution of both and how often each fallback fired
+# (pages whose transformation raises are timed up to the error and counted as failed)
+def benchmark(count=200, seconds=0.01, transformation='healthy'):
+    import lexicon
+    import recipe_transform
+    import synthetic
+    from bs4 import BeautifulSoup
+    recipe_transform.VERBOSE.set(False)
+    pages = list(synthetic.generate_corpus(count))
+    results = {}
+    for mode in ('unbudgeted', 'budgeted'):
+        lexicon.POS_LEXICON.clear()  # start both runs from the same cold caches
+        lexicon.LEMMAS.clear()
+        latencies = []
+        degraded = failed = 0
+        for page in pages:
+            start = time.perf_counter()
+            try:
+                with Budget(seconds if mode == 'budgeted' else float('inf')):
+                    recipe = recipe_transform.Recipe(BeautifulSoup(page, 'html.parser'))
+                    recipe.transform(transformation)
+                degraded += bool(recipe.degraded)
+            except Exception:
+                failed += 1
+            latencies.append(time.perf_counter() - start)
+        results[mode] = percentiles(latencies, (50, 90, 99, 100))
+        print('{0:>11}: p50 {1:.1f}ms, p90 {2:.1f}ms, p99 {3:.1f}ms, max {4:.1f}ms, {5} of {6} degraded, {7} '
+              'failed'.format(mode, *[value * 1000 for value in results[mode].values()], degraded, count, failed))
+    print('fallbacks:', dict(METRICS['fallbacks']), 'switched in:', dict(METRICS['switches']))
+    return results
+
+
+if __name__ == '__main__':
+    # usage: python budget.py [COUNT] [SECONDS]  (latency with and without a budget on synthetic pages)
+    # run through the imported module, whose budget recipe_transform checks (this script is a separate __main__)
+    import budget
+    budget.benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200, float(sys.argv[2]) if len(sys.argv) > 2 else 0.01)
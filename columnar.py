@@ -0,0 +1,286 @@
+import sys
+import time
+import types
+import numpy as np
+import lexicon
+import recipe_transform
+import units
+
+
+# columnar ingredient table for a batch of recipes
+# every ingredient of every recipe is a row: amount (nan if none), and ids into the unit, name, adjective, and
+# category vocabularies (-1 if none); the ingredients of recipe i are rows offsets[i] to offsets[i + 1]
+
+class IngredientTable:
+    def __init__(self, amounts, unit_ids, name_ids, adjective_ids, category_ids, offsets, vocabularies):
+        self.amounts = amounts
+        self.unit_ids = unit_ids
+        self.name_ids = name_ids
+        self.adjective_ids = adjective_ids
+        self.category_ids = category_ids
+        self.offsets = offsets
+        # vocabularies: dictionary of 'units', 'names', 'adjectives', 'categories' lists of strings
+        self.vocabularies = vocabularies
+
+    @classmethod
+    def from_recipes(cls, recipes):
+        # build a table from Recipe objects (or anything with an ingredients list)
+        vocabularies = {'units': [], 'names': [], 'adjectives': [], 'categories': []}
+        indexes = {field: {} for field in vocabularies}
+        columns = {field: [] for field in vocabularies}
+        amounts = []
+        offsets = [0]
+        for recipe in recipes:
+            for ingredient in recipe.ingredients:
+                amounts.append(amount_value(ingredient.amount))
+                for field, value in [('units', ingredient.unit), ('names', ingredient.name),
+                                     ('adjectives', ingredient.adjective), ('categories', ingredient.category)]:
+                    columns[field].append(vocabulary_id(value, vocabularies[field], indexes[field]))
+            offsets.append(len(amounts))
+        return cls(np.array(amounts, dtype=np.float64),
+                   np.array(columns['units'], dtype=np.int32),
+                   np.array(columns['names'], dtype=np.int32),
+                   np.array(columns['adjectives'], dtype=np.int32),
+                   np.array(columns['categories'], dtype=np.int32),
+                   np.array(offsets, dtype=np.int64),
+                   vocabularies)
+
+    def __len__(self):
+        # number of recipes
+        return len(self.offsets) - 1
+
+    def counts(self):
+        # number of ingredients in each recipe
+        return np.diff(self.offsets)
+
+    def recipe_ids(self):
+        # recipe index of every row
+        return np.repeat(np.arange(len(self), dtype=np.int64), self.counts())
+
+    def with_amounts(self, amounts):
+        # make a table with new amounts, sharing every other column
+        return IngredientTable(amounts, self.unit_ids, self.name_ids, self.adjective_ids, self.category_ids,
+                               self.offsets, self.vocabularies)
+
+    def scale(self, factors):
+        # scale amounts by one factor for every recipe (i.e. new servings / old servings) or one for all recipes
+        factors = np.asarray(factors, dtype=np.float64)
+        if factors.ndim:
+            factors = np.repeat(factors, self.counts())
+        return self.with_amounts(self.amounts * factors)
+
+    def apply_deltas(self, deltas):
+        # multiply amounts by a delta per ingredient name, i.e. {'butter': 0.5}, names are matched normalized
+        normalized = {lexicon.normalize(name): delta for name, delta in deltas.items()}
+        lookup = np.array([normalized.get(lexicon.normalize(name), 1.0) for name in self.vocabularies['names']] +
+                          [1.0], dtype=np.float64)  # the extra entry is used for rows without a name (-1)
+        return self.with_amounts(self.amounts * lookup[self.name_ids])
+
+    def apply_transformation(self, transformation, bake=False):
+        # apply a transformation's ingredient rules as Recipe.transform applies them to the ingredients of a step
+        # (see recipe_transform.make_substitutions_with): exception, name, adjective and category rules rename,
+        # rescale, remove and add rows, and added rows merge into rows of the same name; every row is taken to be used
+        # by one step (a parsed recipe only changes the ingredients its steps use, once for every step using them)
+        # a row whose rules add nothing changes the same way in every recipe, so the rules are run once for each
+        # distinct (unit, name, adjective, category) on an amount of 1 and the outcomes applied to every row at once;
+        # recipes with a row whose rules add ingredients (which can merge into other rows) are run through the rules
+        # as Ingredient objects
+        # bake: use the baking rules if the transformation has them
+        rules = transformation_rules(transformation, bake)
+        vocabularies = {field: list(values) for field, values in self.vocabularies.items()}
+        indexes = {field: {value: value_id for value_id, value in enumerate(values)}
+                   for field, values in vocabularies.items()}
+        fields = [('units', 'unit'), ('names', 'name'), ('adjectives', 'adjective'), ('categories', 'category')]
+        keys = np.stack([self.unit_ids, self.name_ids, self.adjective_ids, self.category_ids], axis=1)
+        distinct, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # outcome of every distinct key: kept, amount factor, new ids (units, names, adjectives, categories), adds
+        outcomes = np.zeros((len(distinct), 7))
+        for position, (unit_id, name_id, adjective_id, category_id) in enumerate(distinct.tolist()):
+            if name_id < 0:  # rows without a name match no rule
+                outcomes[position] = [True, 1.0, unit_id, name_id, adjective_id, category_id, False]
+                continue
+            ingredient = recipe_transform.Ingredient(self.value('names', name_id),
+                                                     self.value('adjectives', adjective_id),
+                                                     self.value('categories', category_id), 1.0,
+                                                     self.value('units', unit_id))
+            ingredients = AddedIngredients([ingredient])
+            apply_rules(ingredients, rules)
+            outcomes[position] = [ingredient in ingredients, ingredient.amount] + [
+                vocabulary_id(getattr(ingredient, attribute), vocabularies[field], indexes[field])
+                for field, attribute in fields] + [bool(ingredients.added)]
+        rows = outcomes[inverse]
+        recipe_ids = self.recipe_ids()
+        slow = np.bincount(recipe_ids, weights=rows[:, 6], minlength=len(self)) > 0
+        kept = (rows[:, 0] > 0) & ~slow[recipe_ids]
+        amounts = [self.amounts[kept] * rows[kept, 1]]
+        ids = [rows[kept, 2:6].astype(np.int32)]
+        owners = [recipe_ids[kept]]
+        for index in np.flatnonzero(slow).tolist():
+            ingredients = recipe_transform.IngredientList(self.to_ingredients(index))
+            apply_rules(ingredients, rules)
+            amounts.append(np.array([amount_value(ingredient.amount) for ingredient in ingredients], dtype=np.float64))
+            ids.append(np.array([[vocabulary_id(getattr(ingredient, attribute), vocabularies[field], indexes[field])
+                                  for field, attribute in fields] for ingredient in ingredients],
+                                dtype=np.int32).reshape(-1, 4))
+            owners.append(np.full(len(ingredients), index, dtype=np.int64))
+        owners = np.concatenate(owners)
+        order = np.argsort(owners, kind='stable')  # back in recipe order, rows of a recipe in their own order
+        amounts, ids = np.concatenate(amounts)[order], np.concatenate(ids)[order]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(owners, minlength=len(self)))]).astype(np.int64)
+        return IngredientTable(amounts, ids[:, 0].copy(), ids[:, 1].copy(), ids[:, 2].copy(), ids[:, 3].copy(), offsets,
+                               vocabularies)
+
+    def unit_codes(self):
+        # canonical unit code (see units.UNIT_CODES) of every row, -1 for rows without a known unit
+        lookup = [units.UNIT_CODES[units.canonical_unit(unit)] if units.canonical_unit(unit) else -1
+                  for unit in self.vocabularies['units']]
+        return np.array(lookup + [-1], dtype=np.int32)[self.unit_ids]
+
+    def convert_units(self, target_codes):
+        # convert every row to a unit code in one vectorized operation, rows that cannot be converted keep their
+        # amount and unit
+        source_codes = self.unit_codes()
+        converted = units.convert_array(self.amounts, source_codes, target_codes)
+        convertible = ~np.isnan(converted)
+        vocabulary = list(self.vocabularies['units'])
+        vocabulary_ids = {unit: unit_id for unit_id, unit in enumerate(vocabulary)}
+        code_ids = np.array([vocabulary_id(unit, vocabulary, vocabulary_ids) for unit in units.UNITS] + [-1],
+                            dtype=np.int32)  # vocabulary id of every unit code
+        return IngredientTable(np.where(convertible, converted, self.amounts),
+                               np.where(convertible, code_ids[target_codes], self.unit_ids).astype(np.int32),
+                               self.name_ids, self.adjective_ids, self.category_ids, self.offsets,
+                               dict(self.vocabularies, units=vocabulary))
+
+    def normalize_units(self):
+        # convert every row to the base unit of its dimension (teaspoons, ounces), so totals_by_name adds cups
+        # and tablespoons of the same ingredient together
+        codes = self.unit_codes()
+        return self.convert_units(np.array(units.base_codes() + [-1], dtype=np.int32)[codes])
+
+    def rows_named(self, name, unit=None):
+        # boolean mask of rows with an ingredient name (normalized) and optionally a unit
+        normal_name = lexicon.normalize(name)
+        name_mask = np.array([lexicon.normalize(known) == normal_name for known in self.vocabularies['names']] +
+                             [False], dtype=bool)
+        mask = name_mask[self.name_ids]
+        if unit is not None:
+            unit_id = self.vocabularies['units'].index(unit) if unit in self.vocabularies['units'] else -2
+            mask &= self.unit_ids == unit_id
+        return mask
+
+    def total(self, name, unit=None):
+        # total amount of an ingredient across every recipe, ingredients without an amount count as zero
+        return float(np.nansum(self.amounts[self.rows_named(name, unit)]))
+
+    def recipe_totals(self, name, unit=None):
+        # total amount of an ingredient in each recipe
+        weights = np.where(self.rows_named(name, unit), np.nan_to_num(self.amounts), 0.0)
+        return np.bincount(self.recipe_ids(), weights=weights, minlength=len(self))
+
+    def totals_by_name(self):
+        # total amount of every (name, unit) pair across every recipe
+        keys = self.name_ids.astype(np.int64) * (len(self.vocabularies['units']) + 1) + (self.unit_ids + 1)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=np.nan_to_num(self.amounts))
+        totals = {}
+        for key, total in zip(unique_keys.tolist(), sums.tolist()):
+            name_id, unit_id = divmod(key, len(self.vocabularies['units']) + 1)
+            if name_id < len(self.vocabularies['names']):
+                unit = self.vocabularies['units'][unit_id - 1] if unit_id else None
+                totals[(self.vocabularies['names'][name_id], unit)] = total
+        return totals
+
+    def to_ingredients(self, index):
+        # make Ingredient objects for the recipe at index
+        ingredients = []
+        for row in range(self.offsets[index], self.offsets[index + 1]):
+            amount = None if np.isnan(self.amounts[row]) else float(self.amounts[row])
+            ingredients.append(recipe_transform.Ingredient(self.value('names', self.name_ids[row]),
+                                                           self.value('adjectives', self.adjective_ids[row]),
+                                                           self.value('categories', self.category_ids[row]),
+                                                           amount,
+                                                           self.value('units', self.unit_ids[row])))
+        return ingredients
+
+    def value(self, field, value_id):
+        # look up a vocabulary id, None for -1
+        return self.vocabularies[field][value_id] if value_id >= 0 else None
+
+
+# get the id of a value in a vocabulary, adding it if new, -1 for None
+def vocabulary_id(value, vocabulary, index):
+    if value is None:
+        return -1
+    value_id = index.get(value)
+    if value_id is None:
+        value_id = index[value] = len(vocabulary)
+        vocabulary.append(value)
+    return value_id
+
+
+# get an ingredient amount as a float, nan if it has none or it is not a number
+def amount_value(amount):
+    if amount is None:
+        return np.nan
+    try:
+        return float(amount)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# run a set of rules over an ingredient list, as Recipe.transform does over the ingredients of a step
+def apply_rules(ingredients, rules):
+    recipe_transform.make_substitutions_with(ingredients, {}, rules['names'], rules['adjectives'], rules['categories'],
+                                             rules['exceptions'], rules['vegetarian'])
+
+
+# ingredient list recording the ingredients substitutions add to it (make_substitutions_with merges every one in)
+class AddedIngredients(recipe_transform.IngredientList):
+    def __init__(self, ingredients=()):
+        self.added = []
+        super().__init__(ingredients)
+
+    def merge(self, added_ingredient):
+        self.added.append(added_ingredient)
+        return super().merge(added_ingredient)
+
+
+# get the ingredient rules of a transformation (the rule version in use), its baking rules if bake and it has them
+def transformation_rules(transformation, bake=False):
+    entries = recipe_transform.TRANSFORMATIONS
+    if transformation not in entries:
+        raise ValueError('Unknown transformation: ' + str(transformation))
+    entry = entries[transformation]
+    return entry['baking_rules'] if bake and entry['baking_rules'] else entry['rules']
+
+
+# time building a table from synthetic recipes and scaling/aggregating it
+def benchmark(recipe_count=10000, seed=0):
+    import synthetic
+    # parse the ingredient lines of 100 synthetic recipes and repeat them, steps are not needed here
+    lines = [synthetic.generate_recipe(seed + index)['ingredients'] for index in range(100)]
+    parsed = [types.SimpleNamespace(ingredients=[recipe_transform.add_ingredient(line)
+                                                 for line in lines[index % 100]])
+              for index in range(recipe_count)]
+    start = time.perf_counter()
+    table = IngredientTable.from_recipes(parsed)
+    print('build: {0:.3f}s for {1} recipes, {2} rows'.format(time.perf_counter() - start, len(table),
+                                                             len(table.amounts)))
+    start = time.perf_counter()
+    scaled = table.scale(np.full(len(table), 2.0)).apply_transformation('healthy')
+    print('scale + healthy: {0:.4f}s'.format(time.perf_counter() - start))
+    start = time.perf_counter()
+    totals = scaled.totals_by_name()
+    print('totals by name: {0:.4f}s, {1} (name, unit) pairs'.format(time.perf_counter() - start, len(totals)))
+    start = time.perf_counter()
+    for parsed_recipe in parsed:
+        for ingredient in parsed_recipe.ingredients:
+            if isinstance(ingredient.amount, float):
+                ingredient.amount * 2.0
+    print('object loop for comparison: {0:.4f}s'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    # usage: python columnar.py [RECIPE_COUNT]
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,204 @@
+import concurrent.futures
+import http.server
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from bs4 import BeautifulSoup
+import memory
+import recipe_transform
+
+
+# query parameters that do not change which recipe a URL points at
+TRACKING_PARAMETERS = ('utm_', 'fbclid', 'gclid', 'internalsource', 'referringid', 'referringcontentid', 'clickid')
+
+
+# normalize a recipe URL so every spelling of the same page is one key
+# lowercases the scheme and host, drops default ports, fragments, tracking parameters and trailing slashes, and
+# sorts the remaining query parameters
+def normalize_url(url):
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host += ':' + str(parts.port)
+    query = sorted((key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith(TRACKING_PARAMETERS))
+    return urllib.parse.urlunsplit((scheme, host, parts.path.rstrip('/') or '/', urllib.parse.urlencode(query), ''))
+
+
+# single-flight call coalescing
+# concurrent calls with the same key share one execution: the first caller runs the function and every caller that
+# arrives while it is running waits for and gets the same result (or exception); nothing is kept afterwards
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key: [Future of the call in flight, number of callers waiting on it]
+        self.flights = {}
+        # calls: every call, executions: calls that ran the function, coalesced: calls that waited on another,
+        # errors: executions that raised, saved_seconds: run time the coalesced calls did not spend
+        self.metrics = {'calls': 0, 'executions': 0, 'coalesced': 0, 'errors': 0, 'saved_seconds': 0.0}
+
+    def do(self, key, function, *args):
+        with self.lock:
+            self.metrics['calls'] += 1
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = [concurrent.futures.Future(), 0]
+                self.metrics['executions'] += 1
+            else:
+                flight[1] += 1
+                self.metrics['coalesced'] += 1
+        if not leader:
+            return flight[0].result()
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+        except BaseException as e:
+            self.finish(key, flight, start, error=True)
+            flight[0].set_exception(e)
+            raise
+        self.finish(key, flight, start)
+        flight[0].set_result(result)
+        return result
+
+    def finish(self, key, flight, start, error=False):
+        # end a flight, later calls with its key run the function again
+        with self.lock:
+            del self.flights[key]
+            self.metrics['saved_seconds'] += flight[1] * (time.perf_counter() - start)
+            if error:
+                self.metrics['errors'] += 1
+
+    def stats(self):
+        # copy of the metrics, with the share of calls that did not run the function
+        with self.lock:
+            stats = dict(self.metrics)
+        stats['saved_ratio'] = stats['coalesced'] / stats['calls'] if stats['calls'] else 0.0
+        return stats
+
+
+# fetch and parse a recipe page
+# inside a memory profile with a ceiling, no more of the body is read than fits under it (see memory.check_size)
+def fetch_page(url, timeout=30):
+    with memory.section('fetch'):
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            limit = memory.remaining()
+            html = response.read() if limit is None else response.read(limit + 1)
+        if limit is not None and len(html) > limit:
+            memory.check_size('fetch', len(html))
+    return parse_page(html, url)
+
+
+# parse a recipe page (the recipe does not keep the parse tree, which is freed on the next garbage collection)
+# inside a memory profile with a ceiling, a page larger than the memory left is not parsed (see memory.check_size)
+def parse_page(html, url=None):
+    memory.check_size('parse', len(html))
+    with memory.section('parse'):
+        soup = BeautifulSoup(html, 'html.parser')
+    memory.check('parse')
+    return recipe_transform.Recipe(soup, url)
+
+
+# recipe fetcher with one fetch and parse in flight per normalized URL
+# the parsed recipe is shared by every concurrent caller, so it is never transformed in place: callers transform
+# their own copy (see transform)
+# the normalized URL is only the coalescing key, the page is loaded from the URL as the first caller spelled it
+# given a search.SearchIndex, the name and ingredient names of every recipe fetched are added to it (see search), once
+# per normalized URL however often it is fetched again
+
+class RecipeFetcher:
+    def __init__(self, load=fetch_page, search_index=None):
+        self.load = load
+        self.flight = SingleFlight()
+        self.search_index = search_index
+        self.indexed = set()  # normalized URLs whose recipe was added to the search index
+
+    def fetch(self, url):
+        # get the shared parsed recipe of a URL
+        key = normalize_url(url)
+        return self.flight.do(key, self.load_and_index, key, url)
+
+    def load_and_index(self, key, url):
+        recipe = self.load(url)
+        if self.search_index is not None and key not in self.indexed:
+            self.search_index.add_recipe(recipe)
+            self.indexed.add(key)
+        return recipe
+
+    def search(self, query, k=10, kind=None):
+        # fuzzy search the recipe and ingredient names fetched so far, see search.SearchIndex.search
+        if self.search_index is None:
+            raise ValueError('The fetcher has no search index')
+        return self.search_index.search(query, k, kind)
+
+    def transform(self, url, *transformations):
+        # get a transformed copy of the recipe of a URL
+        return recipe_transform.transform_recipe(self.fetch(url), *transformations)
+
+    def stats(self):
+        return self.flight.stats()
+
+
+# local stub server for testing: serves the same page at every path after a delay, counting requests
+# returns the server (stop it with server.shutdown()) and its base URL
+
+def stub_server(page, delay=0.2):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            with server.lock:
+                server.hits += 1
+            time.sleep(delay)
+            body = page.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.lock = threading.Lock()
+    server.hits = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{0}'.format(server.server_address[1])
+
+
+# send clients concurrent requests for one recipe (spelled a few different ways) to a stub server, each applying
+# its own transformation, and print how many fetches reached the server
+def demo(page, clients=32, delay=0.2):
+    server, base_url = stub_server(page, delay)
+    spellings = [base_url + '/recipe/173906/cajun-roasted-pork-loin/',
+                 base_url.replace('http://', 'HTTP://') + '/recipe/173906/cajun-roasted-pork-loin',
+                 base_url + '/recipe/173906/cajun-roasted-pork-loin/?utm_source=feed#reviews']
+    transformations = list(recipe_transform.TRANSFORMATIONS)
+    fetcher = RecipeFetcher()
+
+    def request(client):
+        recipe_transform.VERBOSE.set(False)
+        return fetcher.transform(spellings[client % len(spellings)], transformations[client % len(transformations)])
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as executor:
+            results = list(executor.map(request, range(clients)))
+    finally:
+        server.shutdown()
+    stats = fetcher.stats()
+    print('{0} requests, {1} reached the server, {2} fetches in flight were shared ({3:.0%}), '
+          '{4:.2f}s of fetching saved'.format(stats['calls'], server.hits, stats['coalesced'], stats['saved_ratio'],
+                                              stats['saved_seconds']))
+    return results, stats, server.hits
+
+
+if __name__ == '__main__':
+    # usage: python fetch.py PAGE.html [CLIENTS]  (coalescing demo against a local stub server)
+    if len(sys.argv) < 2:
+        print('usage: python fetch.py PAGE.html [CLIENTS]')
+        sys.exit(1)
+    with open(sys.argv[1]) as page_file:
+        demo(page_file.read(), int(sys.argv[2]) if len(sys.argv) > 2 else 32)
@@ -0,0 +1,392 @@
+import contextlib
+import functools
+import glob
+import importlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+import nltk
+from bs4 import BeautifulSoup
+import lexicon
+import recipe_transform
+import units
+
+
+# committed golden corpus: saved pages, the outputs the baseline engine gave for them (expected.json) and the
+# differences from those that were made on purpose (accepted.json)
+GOLDEN_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden_pages')
+EXPECTED_PATH = os.path.join(GOLDEN_DIRECTORY, 'expected.json')
+ACCEPTED_PATH = os.path.join(GOLDEN_DIRECTORY, 'accepted.json')
+
+# the six Recipe.make_* methods and the transformation each one makes
+MAKE_METHODS = {'make_healthy': 'healthy', 'make_unhealthy': 'unhealthy', 'make_vegetarian': 'vegetarian',
+                'make_non_vegetarian': 'meatify', 'make_thai': 'thai', 'make_mediterranean': 'mediterranean'}
+
+# recipe fields compared between engines
+FIELDS = ['name', 'ingredients', 'tools', 'primary_method', 'other_methods', 'bake', 'steps']
+
+
+# engines
+# an engine takes a page's html and a make_* method name, and returns the transformed recipe as Recipe.to_dict()
+
+# reference engine: parse the page and call the make_* method on it, as the app does
+def reference_engine(html, method):
+    recipe = recipe_transform.Recipe(BeautifulSoup(html, 'html.parser'))
+    getattr(recipe, method)()
+    return recipe.to_dict()
+
+
+# shared engine: parse every page once and transform copies of it
+def shared_engine(html, method):
+    return recipe_transform.transform_recipe(parse_once(html), MAKE_METHODS[method]).to_dict()
+
+
+@functools.lru_cache(maxsize=64)
+def parse_once(html):
+    return recipe_transform.Recipe(BeautifulSoup(html, 'html.parser'))
+
+
+ENGINES = {'reference': reference_engine, 'shared': shared_engine}
+
+
+# baseline engine: recipe_transform.py as it was before any of the performance work (the first commit, or the
+# revision in RECIPE_BASELINE), loaded from git as a module of its own; the expected outputs of the golden corpus are
+# recorded with it, so they pin the original behavior rather than whatever the current code does
+def baseline_engine(html, method):
+    baseline = baseline_module(os.environ.get('RECIPE_BASELINE') or first_revision())
+    with contextlib.redirect_stdout(io.StringIO()):  # the baseline prints as it goes
+        recipe = baseline.Recipe(BeautifulSoup(html, 'html.parser'))
+        getattr(recipe, method)()
+    return {'name': str(recipe.name),
+            'ingredients': [{'name': ingredient.name, 'adjective': ingredient.adjective,
+                             'category': ingredient.category, 'amount': ingredient.amount, 'unit': ingredient.unit}
+                            for ingredient in recipe.ingredients],
+            'tools': list(recipe.tools),
+            'primary_method': recipe.primary_method,
+            'other_methods': list(recipe.other_methods),
+            'bake': recipe.bake,
+            'steps': [step.text for step in recipe.steps]}
+
+
+# get the first commit of the repository
+def first_revision():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.check_output(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=directory,
+                                   universal_newlines=True).split()[0]
+
+
+# load recipe_transform.py of a git revision as a module
+@functools.lru_cache(maxsize=4)
+def baseline_module(revision):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    source = subprocess.check_output(['git', 'show', revision + ':recipe_transform.py'], cwd=directory)
+    module = types.ModuleType('baseline_recipe_transform')
+    module.debugging = False  # only set when the baseline runs as a script
+    exec(compile(source, revision + ':recipe_transform.py', 'exec'), module.__dict__)
+    return module
+
+
+# pinned NLTK data
+# the parser asks wordnet for the POS tags and noun lemmas of words, drops NLTK's English stopwords from the tokens
+# NLTK's tokenizer splits steps into, so outputs depend on the NLTK data installed
+# recording keeps every answer NLTK gave (the POS tags of the synsets named after a word, its noun lemma, the
+# stopwords, and the tokens of every text tokenized), and checking serves those answers instead of NLTK, so expected
+# outputs hold on any install, even one without the NLTK data; words and texts asked about that were not recorded go
+# to NLTK and are counted as misses
+
+class PinnedNltk:
+    def __init__(self, pos=None, lemmas=None, stopwords=None, tokens=None, recording=False):
+        self.pos = dict(pos or {})  # word: sorted POS tags of the synsets named after it
+        self.lemmas = dict(lemmas or {})  # word: noun lemma, None if wordnet has none
+        self.stopwords = stopwords  # NLTK's English stopwords, read from NLTK when recording
+        self.tokens = dict(tokens or {})  # text: its tokens
+        self.recording = recording
+        self.misses = set()
+        self.wordnet = None
+
+    def synsets(self, word):
+        if word not in self.pos:
+            if not self.recording:
+                self.misses.add(word)
+            self.pos[word] = sorted(set(synset.pos() for synset in self.wordnet.synsets(word)
+                                        if synset.name().split('.')[0] == word))
+        return [PinnedSynset(word, pos) for pos in self.pos[word]]
+
+    def morphy(self, word, pos=None):
+        if word not in self.lemmas:
+            if not self.recording:
+                self.misses.add(word)
+            self.lemmas[word] = self.wordnet.morphy(word, 'n')
+        return self.lemmas[word]
+
+    def words(self, language):
+        # stand-in for nltk.corpus.stopwords (only English is pinned)
+        return list(self.stopwords)
+
+    def word_tokenize(self, text, *args, **options):
+        if text not in self.tokens:
+            if not self.recording:
+                self.misses.add(text)
+            self.tokens[text] = self.tokenize(text, *args, **options)
+        return list(self.tokens[text])
+
+    def __enter__(self):
+        # swap wordnet, the stopwords and the tokenizer out and start from empty lexicon tables, so every lookup goes
+        # through the pinned answers
+        if self.stopwords is None:
+            self.stopwords = nltk.corpus.stopwords.words('english')
+        self.wordnet, self.stopword_corpus = nltk.corpus.wordnet, nltk.corpus.stopwords
+        self.tokenize = nltk.word_tokenize
+        self.tables = (dict(lexicon.POS_LEXICON), dict(lexicon.LEMMAS), recipe_transform.STOPWORDS)
+        nltk.corpus.wordnet = self
+        nltk.corpus.stopwords = self
+        nltk.word_tokenize = self.word_tokenize
+        recipe_transform.STOPWORDS = frozenset(self.stopwords + recipe_transform.PUNCTUATION)
+        lexicon.POS_LEXICON.clear()
+        lexicon.LEMMAS.clear()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        nltk.corpus.wordnet, nltk.corpus.stopwords = self.wordnet, self.stopword_corpus
+        nltk.word_tokenize = self.tokenize
+        recipe_transform.STOPWORDS = self.tables[2]
+        lexicon.POS_LEXICON.clear()
+        lexicon.LEMMAS.clear()
+        lexicon.POS_LEXICON.update(self.tables[0])
+        lexicon.LEMMAS.update(self.tables[1])
+
+    def answers(self):
+        return {'pos': self.pos, 'lemmas': self.lemmas, 'stopwords': self.stopwords, 'tokens': self.tokens}
+
+
+# synset named after a word, only its name and POS tag are used
+class PinnedSynset:
+    def __init__(self, word, pos):
+        self.word = word
+        self.tag = pos
+
+    def name(self):
+        return '{0}.{1}.01'.format(self.word, self.tag)
+
+    def pos(self):
+        return self.tag
+
+
+# load an engine given as 'module:function'
+def load_engine(spec):
+    module, function = spec.split(':')
+    return getattr(importlib.import_module(module), function)
+
+
+# get a recipe dictionary as it reads back from json, with units by their canonical name and numeric amounts as
+# numbers, so outputs only differ where the recipe does (the baseline kept the unit word of the page, 'cups', and
+# some amounts as text, '3')
+def normalize_output(output):
+    output = json.loads(json.dumps(output))
+    for ingredient in output.get('ingredients') or []:
+        ingredient['unit'] = units.canonical_unit(ingredient['unit']) or ingredient['unit']
+        if isinstance(ingredient['amount'], str) and units.parse_number(ingredient['amount']) is not None:
+            ingredient['amount'] = units.parse_number(ingredient['amount'])
+    return output
+
+
+# write count synthetic pages to a corpus directory, to freeze them as golden pages
+def freeze_corpus(directory, count=50, seed=0):
+    import synthetic
+    os.makedirs(directory, exist_ok=True)
+    for index, page in enumerate(synthetic.generate_corpus(count, seed)):
+        with open(os.path.join(directory, 'golden_{0:04d}.html'.format(index)), 'w') as page_file:
+            page_file.write(page)
+
+
+# read the pages of a corpus directory, keyed on file name
+def read_corpus(directory):
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path) as page_file:
+            pages[os.path.basename(path)] = page_file.read()
+    return pages
+
+
+# run an engine on every page and make_* method
+# returns {(page, method): recipe dictionary, or {'error': message} if it raised} and the seconds spent per method
+def run_engine(engine, pages):
+    verbose = recipe_transform.VERBOSE.set(False)
+    outputs = {}
+    timings = dict.fromkeys(MAKE_METHODS, 0.0)
+    try:
+        for page, html in pages.items():
+            for method in MAKE_METHODS:
+                start = time.perf_counter()
+                try:
+                    outputs[(page, method)] = engine(html, method)
+                except Exception as e:
+                    outputs[(page, method)] = {'error': type(e).__name__ + ': ' + str(e)}
+                timings[method] += time.perf_counter() - start
+    finally:
+        recipe_transform.VERBOSE.reset(verbose)
+    return outputs, timings
+
+
+# get the fields of a recipe dictionary that are compared, tools sorted
+def compared_fields(output):
+    fields = {field: output.get(field) for field in FIELDS}
+    fields['tools'] = sorted(fields['tools'] or [])
+    return fields
+
+
+# compare two recipe dictionaries field by field
+# returns a list of (field, expected, actual), ingredients and steps are compared item by item
+def diff_recipes(expected, actual):
+    if 'error' in expected or 'error' in actual:
+        # a page that raised on one side differs as a whole, the other side is given by its compared fields
+        if expected == actual:
+            return []
+        return [('error', expected.get('error') or compared_fields(expected),
+                 actual.get('error') or compared_fields(actual))]
+    differences = []
+    for field in FIELDS:
+        expected_value, actual_value = expected.get(field), actual.get(field)
+        if field == 'tools':  # tools are collected in a set, their order is arbitrary (see compared_fields)
+            expected_value, actual_value = sorted(expected_value or []), sorted(actual_value or [])
+        if field in ('ingredients', 'steps') and isinstance(expected_value, list) and isinstance(actual_value, list):
+            for position in range(max(len(expected_value), len(actual_value))):
+                expected_item = expected_value[position] if position < len(expected_value) else None
+                actual_item = actual_value[position] if position < len(actual_value) else None
+                if expected_item != actual_item:
+                    differences.append(('{0}[{1}]'.format(field, position), expected_item, actual_item))
+        elif expected_value != actual_value:
+            differences.append((field, expected_value, actual_value))
+    return differences
+
+
+# save the baseline outputs of a corpus with the NLTK answers they were made with (see PinnedNltk)
+# the reference engine runs as well, only to record the answers for the lookups the current parser makes
+def record_expected(pages, path, engine=baseline_engine):
+    with PinnedNltk(recording=True) as pinned:
+        outputs = run_engine(engine, pages)[0]
+        run_engine(reference_engine, pages)
+    with open(path, 'w') as expected_file:
+        json.dump({'baseline': os.environ.get('RECIPE_BASELINE') or first_revision(),
+                   'nltk': pinned.answers(),
+                   'outputs': {page + ' ' + method: normalize_output(output)
+                               for (page, method), output in outputs.items()}},
+                  expected_file, indent=1, sort_keys=True)
+
+
+# read outputs saved by record_expected, as {(page, method): output} and the NLTK answers
+def read_expected(path):
+    with open(path) as expected_file:
+        saved = json.load(expected_file)
+    return {tuple(key.rsplit(' ', 1)): output for key, output in saved['outputs'].items()}, saved['nltk']
+
+
+# read the accepted differences, as {(page, method): {field: accepted value}}
+# accepted.json lists the requests that changed outputs on purpose, each with its reason and the values it changed
+def read_accepted(path):
+    accepted = {}
+    if not os.path.exists(path):
+        return accepted
+    with open(path) as accepted_file:
+        for change in json.load(accepted_file):
+            for key, fields in change['outputs'].items():
+                accepted.setdefault(tuple(key.rsplit(' ', 1)), {}).update(fields)
+    return accepted
+
+
+# add the differences of an engine from the expected outputs that are not accepted yet to accepted.json, as the
+# changes of a request, returns the number added
+def accept_differences(pages, path, accepted_path, request, reason, engine=reference_engine):
+    expected, answers = read_expected(path)
+    accepted = read_accepted(accepted_path)
+    with PinnedNltk(**answers):
+        outputs = run_engine(engine, pages)[0]
+    changed = {}
+    for key in sorted(expected):
+        actual = normalize_output(outputs[key])
+        for field, _, actual_value in diff_recipes(expected[key], actual):
+            if field not in accepted.get(key, {}) or accepted[key][field] != actual_value:
+                changed.setdefault(' '.join(key), {})[field] = actual_value
+    if changed:
+        changes = []
+        if os.path.exists(accepted_path):
+            with open(accepted_path) as accepted_file:
+                changes = json.load(accepted_file)
+        changes.append({'request': request, 'reason': reason, 'outputs': changed})
+        with open(accepted_path, 'w') as accepted_file:
+            json.dump(changes, accepted_file, indent=1, sort_keys=True)
+    return sum(len(fields) for fields in changed.values())
+
+
+# run every engine on a corpus and diff each against the reference engine, or against the saved outputs (and NLTK
+# answers) of read_expected if given, leaving out the accepted differences of read_accepted
+# prints every difference and the time per engine and method side by side, returns the number of differences
+def check(pages, engines=None, expected=None, accepted=None):
+    engines = engines or ENGINES
+    accepted = accepted or {}
+    if expected is not None:
+        expected, answers = expected
+        with PinnedNltk(**answers) as pinned:
+            results = {name: run_engine(engine, pages) for name, engine in engines.items()}
+        baseline_name, baseline = 'expected', expected
+    else:
+        pinned = None
+        results = {name: run_engine(engine, pages) for name, engine in engines.items()}
+        baseline_name, baseline = 'reference', results['reference'][0]
+    difference_count = accepted_count = 0
+    for name, (outputs, _) in results.items():
+        if outputs is baseline:
+            continue
+        for key in sorted(baseline):
+            actual = normalize_output(outputs.get(key, {'error': 'missing'}))
+            for field, expected_value, actual_value in diff_recipes(normalize_output(baseline[key]), actual):
+                if field in accepted.get(key, {}) and accepted[key][field] == actual_value:
+                    accepted_count += 1
+                    continue
+                difference_count += 1
+                print('{0} {1} {2} {3}:\n    {4}: {5!r}\n    {6}: {7!r}'.format(
+                    name, key[0], key[1], field, baseline_name, expected_value, name, actual_value))
+    print('\n{0:>20}'.format('method') + ''.join('{0:>12}'.format(name) for name in results))
+    for method in list(MAKE_METHODS) + ['total']:
+        print('{0:>20}'.format(method) + ''.join(
+            '{0:>11.3f}s'.format(sum(timings.values()) if method == 'total' else timings[method])
+            for _, timings in results.values()))
+    print('\n{0} pages, {1} differences, {2} accepted'.format(len(pages), difference_count, accepted_count))
+    if pinned is not None and pinned.misses:
+        print('{0} words and texts not in the recorded NLTK answers, record again: {1}'.format(
+            len(pinned.misses), ', '.join(repr(miss) for miss in sorted(pinned.misses))))
+    return difference_count
+
+
+if __name__ == '__main__':
+    # usage: python golden.py check  (the committed corpus against its expected outputs and accepted differences)
+    #        python golden.py check CORPUS_DIRECTORY [EXPECTED.json [ACCEPTED.json]] [module:engine ...]
+    #        python golden.py record [CORPUS_DIRECTORY EXPECTED.json]  (save the baseline outputs)
+    #        python golden.py accept REQUEST REASON  (accept the current differences of the committed corpus)
+    #        python golden.py freeze CORPUS_DIRECTORY [COUNT]  (write synthetic golden pages)
+    if len(sys.argv) > 2 and sys.argv[1] == 'freeze':
+        freeze_corpus(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 50)
+    elif len(sys.argv) in (2, 4) and sys.argv[1] == 'record':
+        record_expected(read_corpus(sys.argv[2] if len(sys.argv) > 2 else GOLDEN_DIRECTORY),
+                        sys.argv[3] if len(sys.argv) > 3 else EXPECTED_PATH)
+    elif len(sys.argv) == 4 and sys.argv[1] == 'accept':
+        print(accept_differences(read_corpus(GOLDEN_DIRECTORY), EXPECTED_PATH, ACCEPTED_PATH, sys.argv[2],
+                                 sys.argv[3]), 'differences accepted')
+    elif len(sys.argv) == 2 and sys.argv[1] == 'check':
+        sys.exit(1 if check(read_corpus(GOLDEN_DIRECTORY), ENGINES, read_expected(EXPECTED_PATH),
+                            read_accepted(ACCEPTED_PATH)) else 0)
+    elif len(sys.argv) > 2 and sys.argv[1] == 'check':
+        arguments = sys.argv[3:]
+        saved = read_expected(arguments.pop(0)) if arguments and arguments[0].endswith('.json') else None
+        accepted = read_accepted(arguments.pop(0)) if arguments and arguments[0].endswith('.json') else None
+        all_engines = dict(ENGINES)
+        all_engines.update((spec, load_engine(spec)) for spec in arguments)
+        sys.exit(1 if check(read_corpus(sys.argv[2]), all_engines, saved, accepted) else 0)
+    else:
+        print('usage: python golden.py check [CORPUS_DIRECTORY [EXPECTED.json [ACCEPTED.json]] [module:engine ...]] | '
+              'record [CORPUS_DIRECTORY EXPECTED.json] | accept REQUEST REASON | freeze CORPUS_DIRECTORY [COUNT]')
+        sys.exit(1)
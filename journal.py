@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+import time
+import recipe_transform
+
+
+# append-only checkpoint journal of a batch run
+# every line is a JSON record of one completed unit: {"url", "transformation", "offset", "length"}, where offset and
+# length locate its result in the output file; a torn last line (the run died while writing it) is ignored
+# records are buffered and written (and fsynced if fsync is True) every sync_every records or sync_seconds seconds,
+# so at most that much finished work is redone after a crash
+
+class Journal:
+    def __init__(self, path, sync_every=100, sync_seconds=1.0, fsync=True):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_seconds = sync_seconds
+        self.fsync = fsync
+        # key: (url, transformation), value: (offset, length)
+        self.completed, valid = read_journal(path)
+        # end of the last journaled result in the output file
+        self.end = max([offset + length for offset, length in self.completed.values()] + [0])
+        self.file = open(path, 'a')
+        if self.file.tell() > valid:  # cut off a torn last line, so new records start on a line of their own
+            self.file.truncate(valid)
+            self.file.seek(valid)
+        self.buffer = []
+        self.last_sync = time.monotonic()
+        self.output = None
+
+    def done(self, url, transformation):
+        return (url, transformation) in self.completed
+
+    def record(self, url, transformation, offset, length):
+        # mark a unit complete, its result must already be written to the output file
+        self.completed[(url, transformation)] = (offset, length)
+        self.end = max(self.end, offset + length)
+        self.buffer.append(json.dumps({'url': url, 'transformation': transformation, 'offset': offset,
+                                       'length': length}) + '\n')
+        if len(self.buffer) >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_seconds:
+            self.sync()
+
+    def sync(self):
+        # write buffered records, after making sure the results they point at are on disk
+        if self.buffer:
+            if self.output:
+                sync_file(self.output, self.fsync)
+            self.file.write(''.join(self.buffer))
+            sync_file(self.file, self.fsync)
+            self.buffer = []
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+# read the completed units of a journal
+# returns a dictionary of (url, transformation) to (offset, length), and the length of the journal up to a torn line
+def read_journal(path):
+    completed = {}
+    valid = 0
+    if not os.path.exists(path):
+        return completed, valid
+    with open(path, 'rb') as journal_file:
+        for line in journal_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            completed[(entry['url'], entry['transformation'])] = (entry['offset'], entry['length'])
+            valid += len(line)
+    return completed, valid
+
+
+# flush a file to the operating system, and to disk if fsync is True
+def sync_file(file, fsync):
+    file.flush()
+    if fsync:
+        os.fsync(file.fileno())
+
+
+# open the output file of a journaled run, cutting off results written after the last journaled one (the run died
+# before journaling them, so they are redone)
+def open_output(path, journal):
+    output = open(path, 'ab')
+    if output.tell() > journal.end:
+        output.truncate(journal.end)
+        output.seek(journal.end)
+    journal.output = output
+    return output
+
+
+# fetch and parse a recipe page
+def fetch_recipe(url):
+    import fetch
+    return fetch.fetch_page(url)
+
+
+# run (url, transformation) units, writing every transformed recipe as a JSON line to output_path and journaling it
+# units already in the journal are skipped, so a run that died is resumed by running it again with the same paths
+# transformation may combine transformations with commas, i.e. 'vegetarian,healthy'
+# returns the number of units run, skipped, and failed (failed units are not journaled and are retried next run), and
+# how many of the units run had nothing to change (see Recipe.applicable)
+def run_batch(units, output_path, journal_path, load=fetch_recipe, sync_every=100, sync_seconds=1.0, fsync=True):
+    recipe_transform.VERBOSE.set(False)
+    journal = Journal(journal_path, sync_every, sync_seconds, fsync)
+    output = open_output(output_path, journal)
+    counts = {'run': 0, 'skipped': 0, 'failed': 0, 'unchanged': 0}
+    # units of the same URL share one fetch and parse
+    pending = {}
+    for url, transformation in units:
+        if journal.done(url, transformation):
+            counts['skipped'] += 1
+        else:
+            pending.setdefault(url, []).append(transformation)
+    try:
+        for url, transformations in pending.items():
+            try:
+                recipe = load(url)
+            except Exception as e:
+                print('Failed to load', url + ':', e)
+                counts['failed'] += len(transformations)
+                continue
+            for transformation in transformations:
+                try:
+                    parts = recipe_transform.check_transformations(transformation.split(','))
+                    if recipe.applicable(*parts):
+                        transformed = recipe_transform.transform_recipe(recipe, *parts)
+                    else:  # nothing to change, write the parsed recipe without copying it
+                        transformed = recipe
+                        counts['unchanged'] += 1
+                except Exception as e:
+                    print('Failed to make', transformation, 'from', url + ':', e)
+                    counts['failed'] += 1
+                    continue
+                line = (json.dumps({'url': url, 'transformation': transformation,
+                                    'recipe': transformed.to_dict()}) + '\n').encode('utf-8')
+                offset = output.tell()
+                output.write(line)
+                journal.record(url, transformation, offset, len(line))
+                counts['run'] += 1
+    finally:
+        journal.close()
+        output.close()
+    return counts
+
+
+# read the journaled results of a run, in journal order
+def read_results(output_path, journal_path):
+    with open(output_path, 'rb') as output:
+        for offset, length in read_journal(journal_path)[0].values():
+            output.seek(offset)
+            yield json.loads(output.read(length))
+
+
+if __name__ == '__main__':
+    # usage: python journal.py OUTPUT.jsonl JOURNAL.jsonl TRANSFORMATION[,TRANSFORMATION...] URL [URL ...]
+    #        (every URL gets the transformation, rerun the same command to resume)
+    if len(sys.argv) < 5:
+        print('usage: python journal.py OUTPUT.jsonl JOURNAL.jsonl TRANSFORMATION[,TRANSFORMATION...] URL [URL ...]')
+        sys.exit(1)
+    print(run_batch([(url, sys.argv[3]) for url in sys.argv[4:]], sys.argv[1], sys.argv[2]))
@@ -0,0 +1,94 @@
+import threading
+import nltk
+import budget
+
+
+# wordnet loads its corpus on the first lookup, which is not thread-safe (concurrent first lookups can find it half
+# loaded), so lookups go through the lock until one has finished
+WORDNET = {'loaded': False}
+WORDNET_LOCK = threading.Lock()
+
+
+# call a wordnet method ('synsets', 'morphy'), the first calls one at a time
+def wordnet(method, *args):
+    if WORDNET['loaded']:
+        return getattr(nltk.corpus.wordnet, method)(*args)
+    with WORDNET_LOCK:
+        result = getattr(nltk.corpus.wordnet, method)(*args)
+        WORDNET['loaded'] = True
+    return result
+
+
+# part of speech lexicon
+# key: word
+# value: frozenset of wordnet POS tags whose synset lemma is the word itself
+# filled lazily from wordnet, or up front from a runtime snapshot (see snapshot.py)
+
+POS_LEXICON = {}
+
+
+# get the wordnet POS tags of a word, only asking wordnet once per word
+# past a request's latency budget (see budget.py), words wordnet was not asked about yet are guessed instead
+def pos_tags(word):
+    global POS_LEXICON
+    pos = POS_LEXICON.get(word)
+    if pos is None:
+        if budget.cheap('pos'):
+            return guess_pos_tags(word)
+        pos = frozenset(synset.pos() for synset in wordnet('synsets', word)
+                        if synset.name().split('.')[0] == word)
+        POS_LEXICON[word] = pos
+    return pos
+
+
+# adjectives common in ingredient lines, and adjective suffixes, for guessing POS tags without wordnet
+COMMON_ADJECTIVES = frozenset(['large', 'small', 'medium', 'big', 'fresh', 'whole', 'thin', 'thick', 'lean', 'extra',
+                               'ripe', 'hot', 'cold', 'warm', 'dry', 'fine', 'coarse', 'light', 'dark', 'sweet',
+                               'sour', 'raw', 'soft', 'firm', 'heavy', 'plain', 'red', 'green', 'yellow', 'white',
+                               'black', 'brown', 'low', 'reduced', 'free', 'virgin', 'instant', 'frozen'])
+ADJECTIVE_SUFFIXES = ('ed', 'less', 'ous', 'ful', 'ive', 'ish', 'able')
+
+
+# guess the POS tags of a word from the lexicon tables alone: adjective ('a') if it is a common adjective or ends like
+# one, none (as for words wordnet does not know) otherwise
+def guess_pos_tags(word):
+    if word in COMMON_ADJECTIVES or word.endswith(ADJECTIVE_SUFFIXES):
+        return frozenset(['a'])
+    return frozenset()
+
+
+# lemma table
+# key: word
+# value: its wordnet noun lemma (the word itself if wordnet has none), so 'eggs' and 'egg' both map to 'egg'
+# filled lazily from wordnet, or up front from a runtime snapshot (see snapshot.py)
+
+LEMMAS = {}
+
+
+# get the lemma of a word, only asking wordnet once per word
+# past a request's latency budget (see budget.py), words wordnet was not asked about yet are lemmatized by suffix
+def lemma(word):
+    global LEMMAS
+    base = LEMMAS.get(word)
+    if base is None:
+        if budget.cheap('lemma'):
+            return guess_lemma(word)
+        base = wordnet('morphy', word, 'n') or word
+        LEMMAS[word] = base
+    return base
+
+
+# strip a plural suffix from a word without wordnet: berries -> berry, tomatoes -> tomato, dishes -> dish, eggs -> egg
+def guess_lemma(word):
+    if len(word) > 3 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith(('oes', 'ses', 'xes', 'ches', 'shes')):
+        return word[:-2]
+    if len(word) > 2 and word.endswith('s') and not word.endswith(('ss', 'us')):
+        return word[:-1]
+    return word
+
+
+# normalize a name, rule key, or phrase for matching: lowercase and lemmatize each word
+def normalize(phrase):
+    return ' '.join(lemma(word) for word in phrase.lower().split())
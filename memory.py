@@ -0,0 +1,307 @@
+import collections
+import contextlib
+import contextvars
+import gc
+import sys
+import threading
+import tracemalloc
+import budget
+
+
+# memory profiling
+# a recipe fetched, parsed and transformed inside a MemoryProfile has the memory allocated by each stage traced with
+# tracemalloc: fetch and parse (see fetch.parse_page), ingredients (add_ingredient), steps (Step construction),
+# tools, applicability and transform; profile.report() gives the bytes each stage allocated and kept, the peak each
+# reached, and the peak of the whole recipe, all above the memory in use when the profile started
+# given a ceiling, the ingredient, step and transform stages check the memory in use between items, and a recipe
+# going over it raises MemoryCeilingExceeded ('abort') or has the rest of those stages cut short ('degrade', keeping
+# at least the first ingredient and step); a degraded recipe lists 'memory' in recipe.degraded
+# a page is checked against the ceiling before it is read or parsed (see check_size), since its body and parse tree
+# cannot be cut short: a page that does not fit raises MemoryCeilingExceeded in either mode
+# tracemalloc traces the whole process, so stages are only attributed right with one profiled recipe per process at a
+# time (i.e. process pool workers), and tracing slows allocations down, so only profile when asked to
+
+PROFILE = contextvars.ContextVar('memory_profile', default=None)
+
+# what to do with a recipe going over its ceiling
+MODES = ['abort', 'degrade']
+
+# frames kept per traced allocation (see top_allocations), more is more precise but slower
+TRACE_FRAMES = 1
+
+# most recipe peaks kept for the distribution of stats()
+PEAK_WINDOW = 10000
+
+# profiles open in this process, tracing runs while there are any (unless it was started elsewhere)
+TRACING = {'profiles': 0, 'started': False}
+TRACING_LOCK = threading.Lock()
+
+
+class MemoryCeilingExceeded(MemoryError):
+    pass
+
+
+# memory profile of one recipe
+# use as a context manager: with MemoryProfile(50 * 2 ** 20) as profile: recipe = fetch.parse_page(html) ...
+
+class MemoryProfile:
+    def __init__(self, ceiling=None, mode='abort'):
+        if mode not in MODES:
+            raise ValueError('Unknown memory ceiling mode: ' + str(mode))
+        self.ceiling = ceiling
+        self.mode = mode
+        self.baseline = 0
+        self.peak = 0  # highest memory in use above the baseline
+        self.kept = 0  # memory still in use above the baseline when the profile closed, after collecting garbage
+        self.stages = {}  # stage: {'allocated': bytes allocated and not freed, 'peak': peak above its start}
+        self.exceeded = None  # stage the recipe went over its ceiling in
+        self.token = None
+
+    def __enter__(self):
+        with TRACING_LOCK:
+            if not TRACING['profiles'] and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACE_FRAMES)
+                TRACING['started'] = True
+            TRACING['profiles'] += 1
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self.token = PROFILE.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.update_peak()
+        gc.collect()  # free the parse tree and other garbage with reference cycles, so kept is what is held on to
+        self.kept = tracemalloc.get_traced_memory()[0] - self.baseline
+        PROFILE.reset(self.token)
+        with TRACING_LOCK:
+            TRACING['profiles'] -= 1
+            if not TRACING['profiles'] and TRACING['started']:
+                tracemalloc.stop()
+                TRACING['started'] = False
+        record(self, exc_type is not None and issubclass(exc_type, MemoryCeilingExceeded))
+
+    def update_peak(self):
+        # fold the peak traced since the last reset into the recipe's peak
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1] - self.baseline)
+        tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def section(self, name):
+        # attribute the memory allocated inside to a stage (sections do not nest)
+        self.update_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            stage = self.stages.setdefault(name, {'allocated': 0, 'peak': 0})
+            stage['allocated'] += current - start
+            stage['peak'] = max(stage['peak'], peak - start)
+            self.update_peak()
+
+    def remaining(self):
+        # bytes the recipe can still allocate under its ceiling (None without one)
+        if self.ceiling is None:
+            return None
+        return max(0, self.ceiling - (tracemalloc.get_traced_memory()[0] - self.baseline))
+
+    def check_size(self, stage, size):
+        # check that size more bytes (i.e. a page about to be parsed) fit under the ceiling, raising
+        # MemoryCeilingExceeded in either mode if not
+        remaining = self.remaining()
+        if remaining is not None and size > remaining:
+            self.exceeded = stage
+            raise MemoryCeilingExceeded('Recipe needed {0} more bytes in {1} with {2} left under its ceiling of '
+                                        '{3}'.format(size, stage, remaining, self.ceiling))
+
+    def check(self, stage):
+        # check the memory in use against the ceiling, False once the recipe should be cut short
+        if self.exceeded is None and self.ceiling is not None:
+            used = tracemalloc.get_traced_memory()[0] - self.baseline
+            if used > self.ceiling:
+                self.exceeded = stage
+                if self.mode == 'abort':
+                    raise MemoryCeilingExceeded('Recipe used {0} bytes in {1}, over its ceiling of {2}'.format(
+                        used, stage, self.ceiling))
+        return self.exceeded is None
+
+    def report(self):
+        # peak and kept bytes of the recipe, the stage it went over its ceiling in, and the bytes of each stage
+        return {'peak': self.peak, 'kept': self.kept, 'exceeded': self.exceeded,
+                'stages': {name: dict(stage) for name, stage in self.stages.items()}}
+
+
+# attribute the memory allocated inside to a stage of the current recipe (if profiled)
+def section(name):
+    profile = PROFILE.get()
+    return profile.section(name) if profile is not None else contextlib.nullcontext()
+
+
+# iterate over the items of a stage of the current recipe (if profiled), checking its ceiling before every item after
+# the first and stopping early once a degraded recipe is over it
+def stage(name, items):
+    profile = PROFILE.get()
+    if profile is None:
+        yield from items
+        return
+    with profile.section(name):
+        for count, item in enumerate(items):
+            if count and not profile.check(name):
+                return
+            yield item
+
+
+# check the ceiling of the current recipe (if profiled), False once a degraded recipe is over it
+def check(stage_name):
+    profile = PROFILE.get()
+    return profile is None or profile.check(stage_name)
+
+
+# get the bytes the current recipe can still allocate under its ceiling, None if it is not profiled or has no ceiling
+def remaining():
+    profile = PROFILE.get()
+    return profile.remaining() if profile is not None else None
+
+
+# check that size more bytes fit under the ceiling of the current recipe (if profiled), see MemoryProfile.check_size
+def check_size(stage_name, size):
+    profile = PROFILE.get()
+    if profile is not None:
+        profile.check_size(stage_name, size)
+
+
+# get ['memory'] if the current recipe was cut short to stay within its ceiling, like budget.fired
+def fired():
+    profile = PROFILE.get()
+    return ['memory'] if profile is not None and profile.exceeded else []
+
+
+# get the lines allocating the most memory still in use while tracing, as (file:line, bytes, allocations)
+def top_allocations(limit=10):
+    statistics = tracemalloc.take_snapshot().statistics('lineno')
+    return [(str(statistic.traceback), statistic.size, statistic.count) for statistic in statistics[:limit]]
+
+
+# metrics
+# recipes: profiles closed, aborted: recipes that raised MemoryCeilingExceeded, degraded: recipes cut short,
+# exceeded: stage recipes went over their ceiling in; peaks of the latest recipes
+
+METRICS = {'recipes': 0, 'aborted': 0, 'degraded': 0, 'exceeded': collections.Counter()}
+PEAKS = collections.deque(maxlen=PEAK_WINDOW)
+METRICS_LOCK = threading.Lock()
+
+# records of the profiles closed while collecting (see collect), None to add them to METRICS
+RECORDS = contextvars.ContextVar('memory_records', default=None)
+
+
+# record a closed profile, as (aborted, stage exceeded in, peak)
+def record(profile, aborted):
+    entry = (aborted, profile.exceeded, profile.peak)
+    records = RECORDS.get()
+    if records is not None:
+        records.append(entry)
+    else:
+        merge([entry])
+
+
+# add records of closed profiles to the metrics (i.e. ones collected in another process)
+def merge(records):
+    with METRICS_LOCK:
+        for aborted, exceeded, peak in records:
+            METRICS['recipes'] += 1
+            METRICS['aborted'] += aborted
+            METRICS['degraded'] += bool(exceeded) and not aborted
+            if exceeded:
+                METRICS['exceeded'][exceeded] += 1
+            PEAKS.append(peak)
+
+
+# collect the records of the profiles closed inside into a list instead of adding them to the metrics, like
+# budget.collect
+@contextlib.contextmanager
+def collect():
+    records = []
+    token = RECORDS.set(records)
+    try:
+        yield records
+    finally:
+        RECORDS.reset(token)
+
+
+# snapshot of the metrics, with percentiles of recipe peaks
+def stats():
+    with METRICS_LOCK:
+        snapshot = dict(METRICS, exceeded=dict(METRICS['exceeded']))
+        snapshot['peaks'] = budget.percentiles(list(PEAKS))
+    return snapshot
+
+
+# fetch (URL) or parse (html) a page and apply transformations inside a MemoryProfile
+# returns the recipe and the profile; raises MemoryCeilingExceeded if an aborting ceiling is passed
+def profile_recipe(page, *transformations, ceiling=None, mode='abort'):
+    import fetch
+    import recipe_transform
+    recipe_transform.VERBOSE.set(False)
+    with MemoryProfile(ceiling, mode) as profile:
+        if page.startswith(('http://', 'https://', 'file://')):
+            recipe = fetch.fetch_page(page)
+        else:
+            recipe = fetch.parse_page(page)
+        if transformations:
+            recipe.transform(*transformations)
+    return recipe, profile
+
+
+# print a profile's stages and peak
+def print_profile(profile, title):
+    print(title)
+    for name, stage in profile.stages.items():
+        print('  {0:>13}: {1:>10,} bytes kept, {2:>10,} bytes peak'.format(name, stage['allocated'], stage['peak']))
+    print('  {0:>13}: {1:>10,} bytes kept, {2:>10,} bytes peak{3}'.format(
+        'recipe', profile.kept, profile.peak, ', over the ceiling in ' + profile.exceeded if profile.exceeded else ''))
+
+
+# profile synthetic pages of growing size, then the largest one under a ceiling of half its peak in both modes
+def benchmark(sizes=(10, 100, 1000), transformation='healthy'):
+    import synthetic
+    profile = None
+    for size in sizes:
+        page = synthetic.recipe_html(synthetic.generate_recipe(0, ingredient_count=size, step_count=size))
+        recipe, profile = profile_recipe(page, transformation)
+        print_profile(profile, '{0} ingredients and steps, {1:,} bytes of html:'.format(size, len(page)))
+    ceiling = profile.peak // 2
+    for mode in MODES:
+        try:
+            recipe, limited = profile_recipe(page, transformation, ceiling=ceiling, mode=mode)
+            print_profile(limited, 'ceiling {0:,} bytes, {1}: {2} of {3} ingredients and {4} of {3} steps kept, '
+                          'degraded {5}'.format(ceiling, mode, len(recipe.ingredients), sizes[-1], len(recipe.steps),
+                                                recipe.degraded))
+        except MemoryCeilingExceeded as e:
+            print('ceiling {0:,} bytes, {1}: {2}'.format(ceiling, mode, e))
+    print(stats())
+
+
+if __name__ == '__main__':
+    # usage: python memory.py benchmark
+    #        python memory.py PAGE.html|URL [TRANSFORMATION[,TRANSFORMATION...]] [CEILING_BYTES] [abort|degrade]
+    if len(sys.argv) < 2:
+        print('usage: python memory.py benchmark | PAGE.html|URL [TRANSFORMATIONS] [CEILING_BYTES] [abort|degrade]')
+        sys.exit(1)
+    # run through the imported module, whose profile recipe_transform checks (this script is a separate __main__)
+    import memory
+    if sys.argv[1] == 'benchmark':
+        memory.benchmark()
+    else:
+        source = sys.argv[1]
+        if '://' not in source:
+            with open(source) as page_file:
+                source = page_file.read()
+        transformations = sys.argv[2].split(',') if len(sys.argv) > 2 else []
+        try:
+            recipe, profile = memory.profile_recipe(source, *transformations,
+                                                    ceiling=int(sys.argv[3]) if len(sys.argv) > 3 else None,
+                                                    mode=sys.argv[4] if len(sys.argv) > 4 else 'abort')
+            memory.print_profile(profile, recipe.name + ':')
+        except memory.MemoryCeilingExceeded as e:
+            print(e)
+            sys.exit(1)
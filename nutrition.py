@@ -0,0 +1,254 @@
+import sys
+import time
+import types
+import numpy as np
+from bs4 import BeautifulSoup
+import columnar
+import lexicon
+import recipe_transform
+import units
+
+
+# nutrients reported for every recipe
+NUTRIENTS = ['calories', 'fat', 'sodium', 'sugar']
+
+# approximate nutrition of ingredients
+# key: ingredient name (matched normalized, adjective and name first, then name)
+# value: (reference unit, calories, fat in grams, sodium in milligrams, sugar in grams) per one reference unit
+#        a reference unit of None means per item (i.e. one egg)
+
+NUTRITION = {
+    'butter': ('cup', 1628, 184, 1309, 0.1),
+    'shortening': ('tablespoon', 113, 12.8, 0, 0),
+    'lard': ('tablespoon', 115, 12.8, 0, 0),
+    'margarine': ('tablespoon', 102, 11.4, 94, 0),
+    'oil': ('tablespoon', 120, 13.6, 0, 0),
+    'olive oil': ('tablespoon', 119, 13.5, 0.3, 0),
+    'coconut oil': ('tablespoon', 121, 13.5, 0, 0),
+    'applesauce': ('cup', 102, 0.2, 5, 23),
+    'sugar': ('cup', 774, 0, 2, 200),
+    'white sugar': ('cup', 774, 0, 2, 200),
+    'brown sugar': ('cup', 836, 0, 61, 213),
+    'palm sugar': ('cup', 720, 0, 30, 180),
+    'stevia': ('teaspoon', 0, 0, 0, 0),
+    'honey': ('cup', 1031, 0, 14, 279),
+    'maple syrup': ('cup', 819, 0.2, 27, 191),
+    'corn syrup': ('cup', 925, 0, 203, 100),
+    'salt': ('teaspoon', 0, 0, 2325, 0),
+    'sea salt': ('teaspoon', 0, 0, 2120, 0),
+    'kosher salt': ('teaspoon', 0, 0, 1120, 0),
+    'himalayan salt': ('teaspoon', 0, 0, 2200, 0),
+    'table salt': ('teaspoon', 0, 0, 2325, 0),
+    'soy sauce': ('tablespoon', 9, 0.1, 879, 0.1),
+    'low sodium soy sauce': ('tablespoon', 9, 0.1, 533, 0.1),
+    'fish sauce': ('tablespoon', 6, 0, 1413, 0.7),
+    'milk': ('cup', 149, 7.9, 105, 12),
+    'whole milk': ('cup', 149, 7.9, 105, 12),
+    'almond milk': ('cup', 39, 2.5, 170, 0),
+    'coconut milk': ('cup', 552, 57, 36, 8),
+    'cream': ('cup', 821, 88, 89, 7),
+    'sour cream': ('cup', 444, 45, 184, 8),
+    'greek yogurt': ('cup', 146, 3.8, 80, 8),
+    'yogurt': ('cup', 149, 8, 113, 11),
+    'cheese': ('cup', 455, 37, 702, 0.4),
+    'cream cheese': ('cup', 794, 79, 746, 6),
+    'egg': (None, 72, 4.8, 71, 0.2),
+    'substitute egg': ('cup', 96, 0, 320, 1),
+    'flour': ('cup', 455, 1.2, 3, 0.3),
+    'whole-wheat flour': ('cup', 408, 3, 6, 0.5),
+    'rice': ('cup', 675, 1.2, 9, 0.2),
+    'white rice': ('cup', 675, 1.2, 9, 0.2),
+    'wild rice': ('cup', 571, 1.7, 11, 4),
+    'quinoa': ('cup', 626, 10, 9, 0),
+    'pasta': ('pound', 1683, 7, 27, 12),
+    'whole-wheat pasta': ('pound', 1588, 6.7, 36, 0),
+    'noodles': ('pound', 1746, 20, 95, 0),
+    'bread': ('slice', 79, 1, 147, 1.4),
+    'pita': (None, 165, 0.7, 322, 0.8),
+    'chocolate': ('ounce', 155, 9, 7, 14),
+    'cocoa nibs': ('ounce', 130, 12, 0, 0),
+    'frosting': ('cup', 1200, 52, 560, 150),
+    'chicken': ('pound', 544, 12, 204, 0),
+    'beef': ('pound', 1152, 91, 304, 0),
+    'steak': ('pound', 1000, 68, 240, 0),
+    'pork': ('pound', 653, 32, 222, 0),
+    'bacon': ('pound', 2209, 191, 3751, 0),
+    'turkey bacon': ('pound', 1030, 71, 5600, 4),
+    'sausage': ('pound', 1370, 120, 3200, 3),
+    'turkey': ('pound', 472, 8, 500, 0),
+    'lamb': ('pound', 1280, 105, 270, 0),
+    'fish': ('pound', 400, 5, 250, 0),
+    'salmon': ('pound', 940, 60, 270, 0),
+    'tuna': ('pound', 490, 4, 170, 0),
+    'trout': ('pound', 540, 24, 230, 0),
+    'shrimp': ('pound', 385, 2, 540, 0),
+    'crab': ('pound', 390, 4, 1300, 0),
+    'tofu': ('pound', 345, 21, 32, 3),
+    'seitan': ('pound', 560, 8, 1300, 0),
+    'tempeh': ('pound', 870, 49, 40, 0),
+    'lentils': ('cup', 678, 2, 12, 4),
+    'beans': ('cup', 225, 0.9, 2, 0.6),
+    'eggplant': ('pound', 113, 0.8, 9, 16),
+    'mushroom': ('pound', 100, 1.5, 23, 9),
+    'broth': ('cup', 15, 0.5, 860, 1),
+    'vegetable broth': ('cup', 12, 0.2, 940, 2),
+    'onion': (None, 44, 0.1, 4, 4.7),
+    'shallot': (None, 7, 0, 1, 0.8),
+    'garlic': ('clove', 4, 0, 1, 0),
+}
+
+# fallback nutrition by ingredient category, for ingredients not named in NUTRITION
+CATEGORY_NUTRITION = {
+    'healthy_fats': NUTRITION['olive oil'],
+    'unhealthy_fats': NUTRITION['butter'],
+    'healthy_protein': NUTRITION['chicken'],
+    'unhealthy_protein': NUTRITION['beef'],
+    'meat': NUTRITION['pork'],
+    'healthy_dairy': NUTRITION['yogurt'],
+    'unhealthy_dairy': NUTRITION['cheese'],
+    'healthy_salts': NUTRITION['sea salt'],
+    'unhealthy_salts': NUTRITION['salt'],
+    'healthy_grains': NUTRITION['quinoa'],
+    'unhealthy_grains': NUTRITION['pasta'],
+    'healthy_sugars': NUTRITION['honey'],
+    'unhealthy_sugars': NUTRITION['sugar'],
+    'vegetable': ('pound', 100, 0.5, 50, 10),
+    'curd': NUTRITION['tofu'],
+    'spice': ('teaspoon', 6, 0.2, 1, 0.1),
+    'herb': ('teaspoon', 1, 0, 0, 0),
+}
+
+# ounces per teaspoon of water, used to convert between volume and mass when an ingredient has no better guess
+OUNCES_PER_TEASPOON = 0.1739
+
+
+# nutrition lookup table: food names, their reference unit codes, and a foods x nutrients matrix
+# keyed on normalized names (and 'category:' + category for the category fallbacks)
+
+def build_foods():
+    foods = {}
+    for name, entry in NUTRITION.items():
+        foods.setdefault(lexicon.normalize(name), entry)
+    for category, entry in CATEGORY_NUTRITION.items():
+        foods.setdefault('category:' + category, entry)
+    keys = list(foods)
+    unit_codes = np.array([units.UNIT_CODES[foods[key][0]] if foods[key][0] else -1 for key in keys], dtype=np.int32)
+    matrix = np.array([foods[key][1:] for key in keys], dtype=np.float64)
+    return {key: food_id for food_id, key in enumerate(keys)}, unit_codes, matrix
+
+
+FOOD_IDS, FOOD_UNIT_CODES, FOOD_MATRIX = build_foods()
+
+
+# get the food id of an ingredient: adjective and name, then name, then category, -1 if unknown
+def food_id(name, adjective, category):
+    keys = []
+    if name and adjective:
+        keys.append(lexicon.normalize(adjective + ' ' + name))
+    if name:
+        keys.append(lexicon.normalize(name))
+    if category:
+        keys.append(lexicon.normalize(category))
+        keys.append('category:' + category)
+    for key in keys:
+        if key in FOOD_IDS:
+            return FOOD_IDS[key]
+    return -1
+
+
+# get the food id of every row of an ingredient table, looking up each distinct ingredient once
+def row_food_ids(table):
+    keys = np.stack([table.name_ids, table.adjective_ids, table.category_ids], axis=1)
+    distinct, inverse = np.unique(keys, axis=0, return_inverse=True)
+    ids = np.array([food_id(table.value('names', name), table.value('adjectives', adjective),
+                            table.value('categories', category)) for name, adjective, category in distinct.tolist()],
+                   dtype=np.int32)
+    return ids[inverse.reshape(-1)] if len(ids) else np.zeros(0, dtype=np.int32)
+
+
+# get the quantity of every row in the reference unit of its food, nan where it cannot be worked out
+def row_quantities(table, food_ids):
+    source_codes = table.unit_codes()
+    target_codes = np.where(food_ids >= 0, FOOD_UNIT_CODES[food_ids], -1)
+    quantities = units.convert_array(table.amounts, source_codes, target_codes)
+    # items counted without a unit against foods measured per item
+    per_item = (source_codes == -1) & (target_codes == -1) & (food_ids >= 0)
+    quantities = np.where(per_item, table.amounts, quantities)
+    # volume against mass and back, at the density of water
+    teaspoon, ounce = units.UNIT_CODES['teaspoon'], units.UNIT_CODES['ounce']
+    as_mass = units.convert_array(units.convert_array(table.amounts, source_codes, teaspoon) * OUNCES_PER_TEASPOON,
+                                  ounce, target_codes)
+    as_volume = units.convert_array(units.convert_array(table.amounts, source_codes, ounce) / OUNCES_PER_TEASPOON,
+                                    teaspoon, target_codes)
+    quantities = np.where(np.isnan(quantities), as_mass, quantities)
+    return np.where(np.isnan(quantities), as_volume, quantities)
+
+
+# estimate the nutrition of every recipe in an ingredient table as a recipes x nutrients matrix product
+# returns the totals (recipes x NUTRIENTS) and the share of each recipe's ingredients that could be estimated
+def recipe_nutrition(table):
+    food_ids = row_food_ids(table)
+    quantities = row_quantities(table, food_ids)
+    known = (food_ids >= 0) & ~np.isnan(quantities)
+    # recipes x foods quantity matrix, then one product with the foods x nutrients matrix
+    food_count = len(FOOD_MATRIX)
+    cells = table.recipe_ids() * food_count + np.where(known, food_ids, 0)
+    weights = np.bincount(cells, weights=np.where(known, quantities, 0.0), minlength=len(table) * food_count)
+    totals = weights.reshape(len(table), food_count) @ FOOD_MATRIX
+    counts = table.counts()
+    estimated = np.bincount(table.recipe_ids(), weights=known.astype(np.float64), minlength=len(table))
+    coverage = np.divide(estimated, counts, out=np.ones(len(table)), where=counts > 0)
+    return totals, coverage
+
+
+# transform a copy of a parsed recipe and get the ingredients it uses afterwards
+# substitutions swap, remove and add the ingredients of its steps only (recipe.ingredients keeps the removed ones and
+# misses the added ones), so these are the ingredients of its steps, the ones no step used (which no substitution
+# touches), and the ones finishes added (i.e. unhealthy's salt)
+def transformed_ingredients(recipe, *transformations):
+    transformed = recipe.copy()
+    listed = {id(ingredient): ingredient for ingredient in transformed.ingredients}
+    used = {id(ingredient) for step in transformed.steps for ingredient in step.ingredients}
+    transformed.transform(*transformations)
+    ingredients = {key: ingredient for key, ingredient in listed.items() if key not in used}
+    for step in transformed.steps:
+        ingredients.update((id(ingredient), ingredient) for ingredient in step.ingredients)
+    ingredients.update((id(ingredient), ingredient) for ingredient in transformed.ingredients
+                       if id(ingredient) not in listed)
+    return list(ingredients.values())
+
+
+# estimate the nutrition of recipes before and after a transformation (applied to copies)
+# returns a dictionary of before, after, and delta totals (recipes x NUTRIENTS), plus coverage before and after
+def nutrition_deltas(recipes, *transformations):
+    verbose = recipe_transform.VERBOSE.set(False)
+    try:
+        transformed = [types.SimpleNamespace(ingredients=transformed_ingredients(recipe, *transformations))
+                       for recipe in recipes]
+    finally:
+        recipe_transform.VERBOSE.reset(verbose)
+    before, before_coverage = recipe_nutrition(columnar.IngredientTable.from_recipes(recipes))
+    after, after_coverage = recipe_nutrition(columnar.IngredientTable.from_recipes(transformed))
+    return {'before': before, 'after': after, 'delta': after - before,
+            'before_coverage': before_coverage, 'after_coverage': after_coverage}
+
+
+# print the average nutrition change of every transformation across recipes
+def report(recipes):
+    print('{0:>14}'.format('transformation') + ''.join('{0:>12}'.format(nutrient) for nutrient in NUTRIENTS) +
+          '{0:>10}'.format('seconds'))
+    for transformation in recipe_transform.TRANSFORMATIONS:
+        start = time.perf_counter()
+        deltas = nutrition_deltas(recipes, transformation)
+        print('{0:>14}'.format(transformation) +
+              ''.join('{0:>+12.1f}'.format(delta) for delta in deltas['delta'].mean(axis=0)) +
+              '{0:>10.2f}'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    # usage: python nutrition.py [RECIPE_COUNT]  (average change per transformation over synthetic recipes)
+    import synthetic
+    recipe_transform.VERBOSE.set(False)
+    corpus = [recipe_transform.Recipe(BeautifulSoup(page, 'html.parser'))
+              for page in synthetic.generate_corpus(int(sys.argv[1]) if len(sys.argv) > 1 else 200)]
+    report(corpus)
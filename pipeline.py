@@ -0,0 +1,271 @@
+import concurrent.futures
+import contextlib
+import functools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.request
+import budget
+import fetch
+import memory
+import recipe_transform
+
+
+# end of a stage's input
+DONE = object()
+
+
+# stage of a pipeline: function applied to every item by workers threads
+# kind 'thread' runs the function on the worker threads (for I/O), kind 'process' runs it in a process pool with one
+# task in flight per worker thread (for CPU work, function and items must pickle)
+# queue_size bounds the stage's input queue (the pipeline's queue_size if None)
+
+class Stage:
+    def __init__(self, name, function, workers=1, kind='thread', queue_size=None):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.kind = kind
+        self.queue_size = queue_size
+        # items: items processed, errors: items whose function raised, busy: seconds spent running the function,
+        # starved: seconds waiting for input, blocked: seconds waiting for room in the next stage's queue,
+        # max_queue: largest input queue length seen
+        self.metrics = {'items': 0, 'errors': 0, 'busy': 0.0, 'starved': 0.0, 'blocked': 0.0, 'max_queue': 0}
+        self.lock = threading.Lock()
+
+    def count(self, **amounts):
+        with self.lock:
+            for metric, amount in amounts.items():
+                self.metrics[metric] += amount
+
+
+# staged pipeline with bounded queues between stages
+# every stage reads from its own bounded queue and writes to the next stage's, so a slow stage blocks the stages
+# before it (backpressure) and at most about queue_size + workers items per stage are held at any time, however
+# many inputs there are; items move on as (index, value) pairs, out of input order
+# an item whose function raises is passed on as a StageError and skipped by later stages
+
+class Pipeline:
+    def __init__(self, stages, queue_size=16):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.wall = 0.0
+
+    def run(self, inputs):
+        # feed inputs (any iterable, consumed lazily) through every stage
+        # yields the outputs of the last stage as (index, value), in completion order; if iterating over the inputs
+        # raises, the items fed so far still finish and the error is raised once the stages have shut down
+        queues = [queue.Queue(stage.queue_size or self.queue_size) for stage in self.stages]
+        queues.append(queue.Queue())  # output of the last stage, drained by run
+        pools = {}
+        threads = []
+        failure = []  # error raised by the inputs, if any
+        start = time.perf_counter()
+        try:
+            for position, stage in enumerate(self.stages):
+                if stage.kind == 'process':
+                    pools[position] = concurrent.futures.ProcessPoolExecutor(stage.workers)
+                remaining = [stage.workers]
+                for _ in range(stage.workers):
+                    thread = threading.Thread(target=self.work, daemon=True,
+                                              args=(stage, queues[position], queues[position + 1],
+                                                    pools.get(position), remaining))
+                    thread.start()
+                    threads.append(thread)
+            feeder = threading.Thread(target=self.feed, args=(inputs, queues[0], failure), daemon=True)
+            feeder.start()
+            while True:
+                item = queues[-1].get()
+                if item is DONE:
+                    break
+                yield item
+            feeder.join()
+            for thread in threads:
+                thread.join()
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+        self.wall = time.perf_counter() - start
+        if failure:
+            raise failure[0]
+
+    def feed(self, inputs, first_queue, failure):
+        try:
+            for index, value in enumerate(inputs):
+                first_queue.put((index, value))
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            first_queue.put(DONE)  # end the stages however the inputs ended
+
+    def work(self, stage, input_queue, output_queue, pool, remaining):
+        while True:
+            wait = time.perf_counter()
+            item = input_queue.get()
+            stage.count(starved=time.perf_counter() - wait)
+            if item is DONE:
+                input_queue.put(DONE)  # let the stage's other workers see it too
+                with stage.lock:
+                    remaining[0] -= 1
+                    last = not remaining[0]
+                if last:
+                    output_queue.put(DONE)
+                return
+            with stage.lock:
+                stage.metrics['max_queue'] = max(stage.metrics['max_queue'], input_queue.qsize() + 1)
+            index, value = item
+            if not isinstance(value, StageError):
+                busy = time.perf_counter()
+                try:
+                    if pool:
+                        value, error, budget_records, memory_records = pool.submit(
+                            run_collecting, stage.function, value).result()
+                        budget.merge(budget_records)
+                        memory.merge(memory_records)
+                        if error is not None:
+                            raise error
+                    else:
+                        value = stage.function(value)
+                    stage.count(items=1, busy=time.perf_counter() - busy)
+                except Exception as e:
+                    value = StageError(stage.name, e)
+                    stage.count(items=1, errors=1, busy=time.perf_counter() - busy)
+            wait = time.perf_counter()
+            output_queue.put((index, value))
+            stage.count(blocked=time.perf_counter() - wait)
+
+    def report(self):
+        # print every stage's metrics, utilization is the share of its workers' time spent running the function
+        print('{0:>10}{1:>8}{2:>8}{3:>8}{4:>12}{5:>10}{6:>10}{7:>10}'.format(
+            'stage', 'workers', 'items', 'errors', 'utilization', 'starved', 'blocked', 'max queue'))
+        for stage in self.stages:
+            metrics = stage.metrics
+            utilization = metrics['busy'] / (stage.workers * self.wall) if self.wall else 0.0
+            print('{0:>10}{1:>8}{2:>8}{3:>8}{4:>12.0%}{5:>9.2f}s{6:>9.2f}s{7:>10}'.format(
+                stage.name, stage.workers, metrics['items'], metrics['errors'], utilization, metrics['starved'],
+                metrics['blocked'], metrics['max_queue']))
+        print('wall time: {0:.2f}s'.format(self.wall))
+
+
+# run a process stage's function on an item in a pool worker, returning its result (None if it raised), the exception
+# it raised (if any), and the budget and memory records it made there, so the pipeline's process can merge them into
+# its own budget.stats() and memory.stats()
+def run_collecting(function, value):
+    with budget.collect() as budget_records, memory.collect() as memory_records:
+        try:
+            return function(value), None, budget_records, memory_records
+        except Exception as e:
+            return None, e, budget_records, memory_records
+
+
+# an item that failed in a stage
+class StageError:
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+    def __repr__(self):
+        return 'StageError({0!r}, {1!r})'.format(self.stage, self.error)
+
+
+# recipe pipeline stage functions (module level, so process pools can pickle them)
+
+# fetch a recipe page (http(s) or file URL), returns the URL with the page, so parsing can pick the site's adapter
+def fetch_html(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return url, response.read()
+
+
+# parse a fetched (url, html) recipe page, returns the recipe and the budget of its URL (None without budget_seconds)
+# parsing and transforming a URL share a budget of budget_seconds (see budget.Budget), and raise
+# memory.MemoryCeilingExceeded past memory_ceiling bytes if given
+def parse_html(page, memory_ceiling=None, budget_seconds=None):
+    url, html = page
+    recipe_transform.VERBOSE.set(False)
+    page_budget = budget.Budget(budget_seconds, stages=2) if budget_seconds is not None else None
+    with limits(page_budget, memory_ceiling):
+        return fetch.parse_page(html, url), page_budget
+
+
+# transform a parsed (recipe, budget) (no copy is needed, nothing else holds the recipe), going on with the budget
+# the recipe was parsed with
+def transform_parsed(transformations, parsed, memory_ceiling=None):
+    recipe, page_budget = parsed
+    recipe_transform.VERBOSE.set(False)
+    with limits(page_budget, memory_ceiling):
+        recipe.transform(*transformations)
+    return recipe.to_dict()
+
+
+# run inside a URL's budget (if any) and a memory profile with a ceiling of memory_ceiling bytes (if given)
+def limits(page_budget, memory_ceiling):
+    stack = contextlib.ExitStack()
+    if page_budget is not None:
+        stack.enter_context(page_budget)
+    if memory_ceiling is not None:
+        stack.enter_context(memory.MemoryProfile(memory_ceiling))
+    return stack
+
+
+# JSON lines writer stage, appending every transformed recipe to a file
+class JsonLinesWriter:
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def __call__(self, recipe):
+        self.file.write(json.dumps(recipe) + '\n')
+        return recipe['name']
+
+    def close(self):
+        self.file.close()
+
+
+# fetch, parse, transform, and write recipes with overlapping stages
+# fetching runs on fetch_workers threads, parsing and transforming on parse_workers/transform_workers processes
+# (threads if processes is False), and writing on one thread
+# given a memory_ceiling in bytes, parsing or transforming a recipe that allocates more fails its URL rather than
+# running its worker out of memory (memory is traced while it runs, see memory.py); tracing covers the whole process,
+# so a ceiling needs processes, where every worker process holds one recipe at a time
+# given budget_seconds, parsing and transforming a URL get a latency budget of that many seconds, past which they
+# switch to cheap fallbacks (see budget.py); time spent waiting in queues between the stages is not counted
+# returns the pipeline (see Pipeline.report), the number of recipes written, and the (index, StageError) of every
+# URL that failed
+def recipe_pipeline(urls, output_path, transformations, fetch_workers=8, parse_workers=None, transform_workers=None,
+                    queue_size=16, processes=True, memory_ceiling=None, budget_seconds=None):
+    recipe_transform.check_transformations(transformations)
+    if memory_ceiling is not None and not processes:
+        raise ValueError('A memory ceiling needs processes=True, recipes on threads share the traced memory')
+    cpu_kind = 'process' if processes else 'thread'
+    cpus = os.cpu_count() or 1
+    writer = JsonLinesWriter(output_path)
+    pipeline = Pipeline([Stage('fetch', fetch_html, fetch_workers),
+                         Stage('parse', functools.partial(parse_html, memory_ceiling=memory_ceiling,
+                                                          budget_seconds=budget_seconds),
+                               parse_workers or cpus, cpu_kind),
+                         Stage('transform', functools.partial(transform_parsed, list(transformations),
+                                                              memory_ceiling=memory_ceiling),
+                               transform_workers or cpus, cpu_kind),
+                         Stage('write', writer)], queue_size)
+    written = 0
+    failures = []
+    try:
+        for index, result in pipeline.run(urls):
+            if isinstance(result, StageError):
+                failures.append((index, result))
+            else:
+                written += 1
+    finally:
+        writer.close()
+    return pipeline, written, failures
+
+
+if __name__ == '__main__':
+    # usage: python pipeline.py OUTPUT.jsonl TRANSFORMATION[,TRANSFORMATION...] URL [URL ...]
+    #        (local pages can be given as file:///path/page.html)
+    if len(sys.argv) < 4:
+        print('usage: python pipeline.py OUTPUT.jsonl TRANSFORMATION[,TRANSFORMATION...] URL [URL ...]')
+        sys.exit(1)
+    recipe_pipeline(sys.argv[3:], sys.argv[1], sys.argv[2].split(','))[0].report()
@@ -1,9 +1,23 @@
 import collections
+import contextvars
+import copy
 import functools
+import hashlib
 import json
+import os
+import re
+import threading
+import types
+import weakref
 import nltk
 import urllib.request
 from bs4 import BeautifulSoup
+import adapters
+import budget
+import lexicon
+import memory
+import snapshot
+import units
 # from pprint import pprint
 
 
@@ -17,14 +31,35 @@ except LookupError:
     nltk.download('wordnet')
 
 
+# output flags, kept per thread (and asyncio task) so concurrent callers do not affect each other
+# DEBUGGING: print parsing details and step ingredients/methods, set to True when run as a script
+# VERBOSE: print recipes as they are parsed and transformed, turn off with VERBOSE.set(False) for batch work
+
+DEBUGGING = contextvars.ContextVar('debugging', default=False)
+VERBOSE = contextvars.ContextVar('verbose', default=True)
+
+
+# load prebuilt runtime state if a snapshot is given (see snapshot.py), None if missing or stale
+
+SNAPSHOT = snapshot.load_snapshot(os.environ.get('RECIPE_SNAPSHOT'))
+
+
 # global variables for stopwords, custom methods/tools/units arrays
 
-STOPWORDS = nltk.corpus.stopwords.words('english')
 PUNCTUATION = [',', '.', '!', '?', '(', ')']
-STOPWORDS.extend(PUNCTUATION)
 METHODS = ['blend', 'cut', 'strain', 'roast', 'slice', 'flip', 'baste', 'simmer', 'grate', 'drain', 'saute', 'broil', 'boil', 'poach', 'bake', 'grill', 'fry', 'bake', 'heat', 'mix', 'chop', 'grate', 'stir', 'shake', 'mince', 'crush', 'squeeze', 'dice', 'rub', 'cook']
 TOOLS = ['pan', 'grater', 'whisk', 'pot', 'spatula', 'tong', 'oven', 'knife']
-UNITS = ['tablespoon', 'teaspoon', 'cup', 'clove', 'pound']
+UNITS = units.UNITS
+if SNAPSHOT:
+    STOPWORDS = SNAPSHOT['stopwords']
+    METHOD_SET = SNAPSHOT['methods']
+    TOOL_SET = SNAPSHOT['tools']
+    lexicon.POS_LEXICON.update(SNAPSHOT['pos_lexicon'])
+    lexicon.LEMMAS.update(SNAPSHOT['lemmas'])
+else:
+    STOPWORDS = frozenset(nltk.corpus.stopwords.words('english') + PUNCTUATION)
+    METHOD_SET = frozenset(METHODS)
+    TOOL_SET = frozenset(TOOLS)
 
 
 # categorized ingredients dictionary (found at https://github.com/olivergoodman/food-recipes/blob/master/transforms.py)
@@ -68,24 +103,40 @@ SYNONYMS = {
 }
 
 
+# reverse index of INGREDIENT_CATEGORIES
+# key: normalized ingredient name (see lexicon.normalize)
+# value: (position of the first category listing it, category)
+
+if SNAPSHOT:
+    CATEGORY_INDEX = SNAPSHOT['category_index']
+else:
+    CATEGORY_INDEX = {}
+    for position, (key, val) in enumerate(INGREDIENT_CATEGORIES.items()):
+        for item in val:
+            CATEGORY_INDEX.setdefault(lexicon.normalize(item), (position, key))
+
+
 # recipe class definition
 
 class Recipe:
-    def __init__(self, soup):
-        self.soup = soup
-        # get recipe name
-        name = self.soup.find('h1', id='recipe-main-content')
-        self.name = name.string
-        # get recipe ingredients
-        ingredients = self.soup.find_all('span', class_='recipe-ingred_txt added')
-        self.ingredients = [add_ingredient(ingredient.contents[0]) for ingredient in ingredients]
+    def __init__(self, soup, url=None):
+        # get recipe name, ingredient lines and step texts with the site adapter of the url (see adapters.py)
+        # the parse tree is not kept, so the caller can free it as soon as the recipe is made
+        extracted = adapters.extract(soup, url)
+        self.name = extracted['name']
+        # get recipe ingredients, checking the latency budget and memory ceiling of the request (if any) between
+        # stages and items
+        self.ingredients = IngredientList(
+            add_ingredient(ingredient)
+            for ingredient in memory.stage('ingredients', budget.stage('ingredients', extracted['ingredients'])))
         # get recipe steps
-        self.steps = self.get_steps()
+        self.steps = self.get_steps(extracted['steps'])
         # get recipe tools
-        self.tools, methods_counter = self.get_tools_methods()
-        # get primary method and any other methods
-        self.primary_method = methods_counter.most_common(1)[0][0]
-        del methods_counter[self.primary_method]
+        with memory.section('tools'):
+            self.tools, methods_counter = self.get_tools_methods()
+        # get primary method (None if no step names a known method) and any other methods
+        self.primary_method = methods_counter.most_common(1)[0][0] if methods_counter else None
+        methods_counter.pop(self.primary_method, None)
         self.other_methods = list(methods_counter)
         # check to see if recipe is for baking or not
         if self.primary_method == 'bake' or 'bake' in self.other_methods:
@@ -95,17 +146,45 @@ class Recipe:
         # initialize ingredient and method switches dictionaries
         self.ingredient_switches = {}
         self.method_switches = {}
+        self.switch_rules = {}  # ingredient switch: rule that made it ('names:chicken'), see make_substitutions_with
+        # find which transformations would change the recipe, and which of their rule keys match
+        budget.checkpoint('applicability')
+        rules = RULES
+        with memory.section('applicability'):
+            self.applicability = rule_applicability(self, rules)
+        self.applicability_rules = rules['hash']  # hash of the rule version the applicability was found with
+        self.rules_hash = None  # hash of the rule version of the last transformation
+        # fallbacks used to stay within the latency budget and memory ceiling, empty if parsed with full precision
+        self.degraded = budget.fired() + memory.fired()
         # print recipe
         self.print_recipe()
 
-    def get_steps(self):
+    @classmethod
+    def from_parts(cls, name, ingredients, steps, tools, primary_method, other_methods, bake):
+        # make a recipe from parts parsed earlier (i.e. read back from an archive), without a page to parse
+        recipe = cls.__new__(cls)
+        recipe.name = name
+        recipe.ingredients = IngredientList(ingredients)
+        recipe.steps = steps
+        recipe.tools = tools
+        recipe.primary_method = primary_method
+        recipe.other_methods = other_methods
+        recipe.bake = bake
+        recipe.ingredient_switches = {}
+        recipe.method_switches = {}
+        recipe.switch_rules = {}
+        recipe.applicability = None
+        recipe.applicability_rules = None
+        recipe.rules_hash = None
+        recipe.degraded = []
+        return recipe
+
+    def get_steps(self, step_texts):
         global SYNONYMS
-        # get steps from soup
-        steps_elements = self.soup.find('ol', class_='list-numbers recipe-directions__list')('li')
         steps = []
         # format steps to be numbered
-        for count, step_element in enumerate(steps_elements):
-            step_text = str(count+1) + '. ' + step_element.find('span').string.strip()
+        for count, step_text in enumerate(memory.stage('steps', budget.stage('steps', step_texts))):
+            step_text = str(count+1) + '. ' + step_text.strip()
             # account for ingredient synonyms
             for synonym in SYNONYMS:
                 step_text = step_text.replace(synonym, SYNONYMS[synonym])
@@ -115,152 +194,134 @@ class Recipe:
     def get_tools_methods(self):
         # get tools and methods from a recipe
         global STOPWORDS
-        global METHODS
-        global TOOLS
+        global METHOD_SET
+        global TOOL_SET
         tools = set()  # unique set
         methods_counter = collections.Counter()  # frequency mapping
-        for step in self.steps:
-            # tokenize each step
-            tokens = nltk.word_tokenize(step.text)
+        for step in budget.stage('tools', self.steps):
+            # tokenize each step (with a regular expression past the latency budget)
+            tokens = TOKEN.findall(step.text) if budget.cheap('tokenize') else nltk.word_tokenize(step.text)
             tokens = [token.lower() for token in tokens if token not in STOPWORDS]
             bigrams = nltk.bigrams(tokens)
             step_methods = set()
             # check unigrams for tools and methods
             for token in tokens:
-                if token in TOOLS:
+                if token in TOOL_SET:
                     tools.add(token)
-                if token in METHODS:
+                if token in METHOD_SET:
                     methods_counter.update([token])
                     step_methods.add(token)
             # check bigrams for tools and methods
             for token in bigrams:
-                if token in TOOLS:
+                if token in TOOL_SET:
                     tools.add(token)
-                if token in METHODS:
+                if token in METHOD_SET:
                     methods_counter.update([token])
                     step_methods.add(token)
             step.methods = list(step_methods)
+            # annotate where each method is mentioned
+            lowered = step.text.lower()
+            for method in step_methods:
+                for match in re.finditer(r'\b' + re.escape(method) + r'\b', lowered):
+                    step.spans.append(Span(match.start(), match.end(), 'method', method))
         return list(tools), methods_counter
 
     def alter_steps(self):
-        # alter the step text with the ingredient and method substitutions made
-        word_ends = [' ', '.', ',']
+        # alter the step text with the ingredient and method substitutions made, recorded as span edits
+        # switch: (replacement, kind, rule that made it), in the order the switches are tried (see switch_pattern)
+        # switches replacing a name with itself change nothing, so they do not keep later ones from matching
+        switches = {switch: (self.ingredient_switches[switch], 'ingredient', self.switch_rules.get(switch))
+                    for switch in self.ingredient_switches if self.ingredient_switches[switch] != switch}
+        for switch in self.method_switches:  # ingredient substitutions win over methods
+            if switch not in self.ingredient_switches and self.method_switches[switch] != switch:
+                switches[switch] = (self.method_switches[switch], 'method', 'methods:' + switch)
+        pattern = switch_pattern(switches)
+        if pattern is None:
+            return
+        ranks = {switch: rank for rank, switch in enumerate(switches)}
         for step in self.steps:
-            # replace ingredients
-            for switch in self.ingredient_switches:
-                for word_end in word_ends:
-                    step.text = step.text.replace(switch + word_end, self.ingredient_switches[switch] + word_end)
-            # replace methods
-            for switch in self.method_switches:
-                for word_end in word_ends:
-                    step.text = step.text.replace(switch + word_end, self.method_switches[switch] + word_end)
-            tokens = nltk.word_tokenize(step.text)
-            tokens = [token.lower() for token in tokens if token not in STOPWORDS]
-            tokens = [token for i, token in enumerate(tokens) if i != 0 and token == tokens[i-1]]
-            for token in tokens:
-                step.text = step.text.replace(token + ' ' + token, token)
-
-    def make_healthy(self):
-        # change recipe from unhealthy to healthy
-        print('\nMaking healthy...')
-        # baking substitutions
-        if self.bake:
-            # substitution dictionaries
-            global healthy_baking_substitutions_names
-            global healthy_baking_substitutions_adjectives
-            global healthy_baking_substitutions_categories
-            global healthy_baking_substitutions_exceptions
-            global healthy_baking_substitutions_methods
-            for step in self.steps:
+            step.edit(pattern, switches, ranks)
+
+    def diff(self):
+        # get every span edit made to the steps, with the step number it belongs to
+        return [dict(edit, step=count + 1) for count, step in enumerate(self.steps) for edit in step.diff()]
+
+    def transform(self, *transformations):
+        # apply one or more transformations (keys of TRANSFORMATIONS) with a single ingredient pass and a single
+        # step rewrite, no matter how many are combined
+        # the rule version in use when it starts is used throughout, even if another is installed meanwhile
+        global RULES
+        version = RULES
+        transformations = check_transformations(dict.fromkeys(transformations), version)  # drop repeats, keep order
+        entries = version['transformations']
+        labels = ' and '.join(entries[transformation]['label'] for transformation in transformations)
+        if not self.applicable(*transformations, version=version):
+            report('\nNothing to change, the recipe has no ' + labels + ' substitutions.')
+            return
+        rules = fuse_rules([self.get_rules(transformation, version) for transformation in transformations])
+        report('\nMaking ' + labels + '...')
+        with memory.section('transform'):
+            for step in budget.stage('substitutions', self.steps):
+                if not memory.check('transform'):  # over the memory ceiling, leave the other steps as they are
+                    break
                 # look through each ingredient substitution dictionary and make the changes
                 make_substitutions_with(step.ingredients,
                                         self.ingredient_switches,
-                                        healthy_baking_substitutions_names,
-                                        healthy_baking_substitutions_adjectives,
-                                        healthy_baking_substitutions_categories,
-                                        healthy_baking_substitutions_exceptions,
-                                        False)
+                                        rules['names'],
+                                        rules['adjectives'],
+                                        rules['categories'],
+                                        rules['exceptions'],
+                                        rules['vegetarian'],
+                                        self.switch_rules)
                 # look through the method substitution dictionary
                 for method in step.methods:
-                    if method in healthy_baking_substitutions_methods:
+                    if method in rules['methods']:
                         # find substitutions to be made
-                        self.method_switches[method] = healthy_baking_substitutions_methods[method]
+                        self.method_switches[method] = rules['methods'][method]
                 # make the substitution in the step's method list
                 step.methods = [self.method_switches[x] if x in self.method_switches else x for x in step.methods]
-        else:  # non-baking substitutions
-            # substitution dictionaries
-            global healthy_substitutions_names
-            global healthy_substitutions_adjectives
-            global healthy_substitutions_categories
-            global healthy_substitutions_exceptions
-            global healthy_substitutions_methods
-            # look through each ingredient substitution dictionary and make the changes
-            for step in self.steps:
-                make_substitutions_with(step.ingredients,
-                                        self.ingredient_switches,
-                                        healthy_substitutions_names,
-                                        healthy_substitutions_adjectives,
-                                        healthy_substitutions_categories,
-                                        healthy_substitutions_exceptions,
-                                        False)
-                # look through the method substitution dictionary
-                for method in step.methods:
-                    if method in healthy_substitutions_methods:
-                        # find substitutions to be made
-                        self.method_switches[method] = healthy_substitutions_methods[method]
-                # make the substitution in the step's method list
-                step.methods = [self.method_switches[x] if x in self.method_switches else x for x in step.methods]
-        self.alter_steps()
-        print('\nAltered Steps:')
+            budget.checkpoint('alter_steps')
+            self.alter_steps()
+            # finish off transformations that add to the recipe once its steps are altered
+            finishes = [entries[transformation]['finish'] for transformation in transformations
+                        if entries[transformation]['finish']]
+            for finish in finishes:
+                finish(self)
+        if finishes:
+            report('\nAltered Ingredients:')
+            for ingredient in self.ingredients:
+                report(ingredient)
+        report('\nAltered Steps:')
         for step in self.steps:
-            print(step)
-
-    def make_unhealthy(self):
-        # change recipe from healthy to unhealthy
-        print('\nMaking unhealthy...')
-        # Baking substitutions
-        if self.bake:
-            # substitution dictionaries
-            global unhealthy_baking_substitutions_names
-            global unhealthy_baking_substitutions_adjectives
-            global unhealthy_baking_substitutions_categories
-            global unhealthy_baking_substitutions_exceptions
-            global unhealthy_baking_substitutions_methods
-            for step in self.steps:
-                make_substitutions_with(step.ingredients,
-                                        self.ingredient_switches,
-                                        unhealthy_baking_substitutions_names,
-                                        unhealthy_baking_substitutions_adjectives,
-                                        unhealthy_baking_substitutions_categories,
-                                        unhealthy_baking_substitutions_exceptions,
-                                        False)
-                for method in step.methods:
-                    # find method substitutions to be made
-                    if method in unhealthy_baking_substitutions_methods:
-                        self.method_switches[method] = unhealthy_baking_substitutions_methods[method]
-                # make the substitution in the method list
-                step.methods = [self.method_switches[x] if x in self.method_switches else x for x in step.methods]
-        else:  # non-baking substitution dictionaries
-            global unhealthy_substitutions_names
-            global unhealthy_substitutions_adjectives
-            global unhealthy_substitutions_categories
-            global unhealthy_substitutions_exceptions
-            global unhealthy_substitutions_methods
-            for step in self.steps:
-                # substitute ingredients
-                make_substitutions_with(step.ingredients,
-                                        self.ingredient_switches,
-                                        unhealthy_substitutions_names,
-                                        unhealthy_substitutions_adjectives,
-                                        unhealthy_substitutions_categories,
-                                        unhealthy_substitutions_exceptions,
-                                        False)
-                # substitute methods
-                for method in step.methods:
-                    if method in unhealthy_substitutions_methods:
-                        self.method_switches[method] = unhealthy_substitutions_methods[method]
-                step.methods = [self.method_switches[x] if x in self.method_switches else x for x in step.methods]
-        self.alter_steps()
+            report(step)
+        self.applicability = None  # the recipe changed, find applicable transformations again when asked
+        self.rules_hash = version['hash']
+        self.degraded = sorted(set(self.degraded) | set(budget.fired()) | set(memory.fired()))
+
+    def applicable(self, *transformations, version=None):
+        # get the transformations (keys of TRANSFORMATIONS) that would change the recipe, all of them if none given
+        # version: rule version to check with, the one in use by default
+        global RULES
+        version = version or RULES
+        if self.applicability is None or self.applicability_rules != version['hash']:
+            self.applicability = rule_applicability(self, version)
+            self.applicability_rules = version['hash']
+        entries = version['transformations']
+        return [transformation for transformation in transformations or entries
+                if entries[transformation]['finish'] or any(self.applicability[transformation].values())]
+
+    def get_rules(self, transformation, version=None):
+        # get the substitution dictionaries of a transformation, using the baking ones for baking recipes
+        global RULES
+        entries = (version or RULES)['transformations']
+        if transformation not in entries:
+            raise ValueError('Unknown transformation: ' + str(transformation))
+        if self.bake and entries[transformation]['baking_rules']:
+            return entries[transformation]['baking_rules']
+        return entries[transformation]['rules']
+
+    def add_unhealthy_step(self):
+        # finish an unhealthy transformation with an extra step and ingredient
         next_count = int(self.steps[-1].text[0]) + 1
         if not self.bake:
             # if non-baking recipe, add extra salt step/ingredient
@@ -278,162 +339,194 @@ class Recipe:
             new_step = Step(step_text, [frosting])
             new_step.methods = ['spread']
             self.steps.append(new_step)
-        print('\nAltered Ingredients:')
-        for ingredient in self.ingredients:
-            print(ingredient)
-        print('\nAltered Steps:')
-        for step in self.steps:
-            print(step)
+
+    def make_healthy(self):
+        # change recipe from unhealthy to healthy
+        self.transform('healthy')
+
+    def make_unhealthy(self):
+        # change recipe from healthy to unhealthy
+        self.transform('unhealthy')
 
     def make_vegetarian(self):
         # change recipe from non vegetarian to vegetarian
-        # vegetarian substitution dictionaries
-        global vegetarian_substitutions_names
-        global vegetarian_substitutions_adjectives
-        global vegetarian_substitutions_categories
-        global vegetarian_substitutions_exceptions
-        print('\nMaking vegetarian...')
-        for step in self.steps:
-            # make all ingredient substitutions
-            make_substitutions_with(step.ingredients,
-                                    self.ingredient_switches,
-                                    vegetarian_substitutions_names,
-                                    vegetarian_substitutions_adjectives,
-                                    vegetarian_substitutions_categories,
-                                    vegetarian_substitutions_exceptions,
-                                    True)
-        self.alter_steps()
-        print('\nAltered Steps:')
-        for step in self.steps:
-            print(step)
+        self.transform('vegetarian')
 
     def make_non_vegetarian(self):
         # change recipe from vegetarian to non vegetarian
-        # meatify substitution dictionaries
-        global non_vegetarian_substitutions_names
-        global non_vegetarian_substitutions_adjectives
-        global non_vegetarian_substitutions_categories
-        global non_vegetarian_substitutions_exceptions
-        print('\nMaking non-vegetarian...')
-        for step in self.steps:
-            # make all ingredient substitutions
-            make_substitutions_with(step.ingredients,
-                                    self.ingredient_switches,
-                                    non_vegetarian_substitutions_names,
-                                    non_vegetarian_substitutions_adjectives,
-                                    non_vegetarian_substitutions_categories,
-                                    non_vegetarian_substitutions_exceptions,
-                                    False)
-        self.alter_steps()
-        print('\nAltered Steps:')
-        for step in self.steps:
-            print(step)
+        self.transform('meatify')
 
     def make_thai(self):
         # change recipe to thai style of cuisine
-        # thai substitution dictionaries
-        global thai_substitutions_names
-        global thai_substitutions_adjectives
-        global thai_substitutions_categories
-        global thai_substitutions_exceptions
-        print('\nMaking Thai...')
-        for step in self.steps:
-            # make all ingredient substitutions
-            make_substitutions_with(step.ingredients,
-                                    self.ingredient_switches,
-                                    thai_substitutions_names,
-                                    thai_substitutions_adjectives,
-                                    thai_substitutions_categories,
-                                    thai_substitutions_exceptions,
-                                    False)
-        self.alter_steps()
-        print('\nAltered Steps:')
-        for step in self.steps:
-            print(step)
+        self.transform('thai')
 
     def make_mediterranean(self):
         # change recipe to mediterranean style of cuisine
-        # mediterranean substitution dictionaries
-        global mediterranean_substitutions_names
-        global mediterranean_substitutions_adjectives
-        global mediterranean_substitutions_categories
-        global mediterranean_substitutions_exceptions
-        print('\nMaking Mediterranean...')
-        for step in self.steps:
-            # make all ingredient substitutions
-            make_substitutions_with(step.ingredients,
-                                    self.ingredient_switches,
-                                    mediterranean_substitutions_names,
-                                    mediterranean_substitutions_adjectives,
-                                    mediterranean_substitutions_categories,
-                                    mediterranean_substitutions_exceptions,
-                                    False)
-        self.alter_steps()
-        print('\nAltered Steps:')
-        for step in self.steps:
-            print(step)
+        self.transform('mediterranean')
 
     def print_recipe(self):
         # print information of a recipe
-        print('\nName:', self.name)
-        print('\nIngredients:')
+        report('\nName:', self.name)
+        report('\nIngredients:')
         for ingredient in self.ingredients:
-            print(ingredient)
-        print('\nTools:', self.tools)
-        print('\nPrimary Method:', self.primary_method)
-        print('\nOther Methods:', self.other_methods)
-        print('\nBaking?:', self.bake)
-        print('\nSteps:')
+            report(ingredient)
+        report('\nTools:', self.tools)
+        report('\nPrimary Method:', self.primary_method)
+        report('\nOther Methods:', self.other_methods)
+        report('\nBaking?:', self.bake)
+        report('\nSteps:')
         for step in self.steps:
-            print(step)
+            report(step)
+
+    def to_dict(self):
+        # make a recipe into plain dictionaries, lists, and strings
+        return {'name': self.name,
+                'ingredients': [ingredient.to_dict() for ingredient in self.ingredients],
+                'tools': list(self.tools),
+                'primary_method': self.primary_method,
+                'other_methods': list(self.other_methods),
+                'bake': self.bake,
+                'steps': [step.text for step in self.steps],
+                'degraded': list(self.degraded),
+                'rules': self.rules_hash}
 
     def jsonify(self):
         # make a recipe into a json format
-        recipe = {'ingredients': self.ingredients,
-                  'tools': self.tools,
-                  'primary_method': self.primary_method,
-                  'other_methods': self.other_methods,
-                  'steps': self.steps}
-        serializable = json.dumps(recipe)
+        serializable = json.dumps(self.to_dict())
         # pprint(serializable)
         return serializable
 
+    def copy(self):
+        # make an independent copy (ingredients, steps, switches) to transform without touching this recipe
+        return copy.deepcopy(self)
+
 
 # step class definition
 
+# edit of a span of a step's text, replacing text[start:end] (original) with replacement
+# kind is 'ingredient' or 'method' and rule is the rule that made the edit, as table:key ('names:chicken',
+# 'categories:meat', 'methods:fry')
+
+Edit = collections.namedtuple('Edit', ['start', 'end', 'original', 'replacement', 'kind', 'rule'])
+
+
+# span of a step's source text mentioning an ingredient or method
+# kind is 'ingredient' (ref is the Ingredient) or 'method' (ref is the method name)
+
+Span = collections.namedtuple('Span', ['start', 'end', 'kind', 'ref'])
+
+
 class Step:
     def __init__(self, step_text, ingredients):
-        # each step has text, ingredients used in it, and methods used in it
-        self.text = step_text
-        self.ingredients = []
+        # each step has text, ingredients used in it, methods used in it, and spans where they are mentioned
+        # the text is kept as its source plus revisions (lists of span edits) and only rendered when asked for
+        self.source = step_text
+        self.revisions = []
+        self.rendered = step_text
+        self.ingredients = IngredientList()
         self.methods = None
-        ingredients_dict = {}
-        # group ingredients by core name (excluding unique adjectives)
-        for ingredient in ingredients:
-            if ingredient.name in ingredients_dict:
-                ingredients_dict[ingredient.name].append(ingredient)
-            else:
-                ingredients_dict[ingredient.name] = [ingredient]
-        unique_ingredients_dict = {}
-        # get all unique ingredient names by including adjectives
-        for ingredient in ingredients_dict:
-            if len(ingredients_dict[ingredient]) == 1:
-                unique_ingredients_dict[ingredient] = ingredients_dict[ingredient][0]
-            else:
-                for ingredient_ref in ingredients_dict[ingredient]:
-                    if ingredient_ref.adjective:
-                        full_name = ingredient_ref.adjective + ' ' + ingredient
-                        unique_ingredients_dict[full_name] = ingredient_ref
-                    else:
-                        unique_ingredients_dict[ingredient] = ingredient_ref
+        self.spans = []
+        # the recipe's ingredient list keeps the names its ingredients are mentioned by, shared by all of its steps
+        if not isinstance(ingredients, IngredientList):
+            ingredients = IngredientList(ingredients)
+        unique_ingredients_dict = ingredients.mention_names()
+        lowered = step_text.lower()
+        lemma_positions = None
         for ingredient in unique_ingredients_dict:
-            # if an ingredient is in the current step, add to the step's ingredient list
-            if ingredient in step_text.lower():
+            # if an ingredient is in the current step, add to the step's ingredient list and annotate its mentions
+            start = lowered.find(ingredient)
+            if start != -1:
+                self.ingredients.append(unique_ingredients_dict[ingredient])
+                while start != -1:
+                    self.spans.append(Span(start, start + len(ingredient), 'ingredient',
+                                           unique_ingredients_dict[ingredient]))
+                    start = lowered.find(ingredient, start + 1)
+                continue
+            # otherwise match on lemmas, so 'egg' in the text finds an ingredient named 'eggs' and vice versa
+            if lemma_positions is None:
+                tokens = [(match.start(), match.end(), lexicon.lemma(match.group()))
+                          for match in WORD.finditer(lowered)]
+                lemma_positions = {}
+                for position, token in enumerate(tokens):
+                    lemma_positions.setdefault(token[2], []).append(position)
+            target = lexicon.normalize(ingredient).split()
+            mentions = [position for position in lemma_positions.get(target[0], [])
+                        if [token[2] for token in tokens[position:position + len(target)]] == target]
+            if mentions:
                 self.ingredients.append(unique_ingredients_dict[ingredient])
+            for position in mentions:
+                self.spans.append(Span(tokens[position][0], tokens[position + len(target) - 1][1], 'ingredient',
+                                       unique_ingredients_dict[ingredient]))
+
+    @classmethod
+    def from_parts(cls, step_text, ingredients, methods, spans):
+        # make a step from parts found earlier (i.e. read back from an archive), without matching ingredients again
+        step = cls.__new__(cls)
+        step.source = step_text
+        step.revisions = []
+        step.rendered = step_text
+        step.ingredients = IngredientList(ingredients)
+        step.methods = methods
+        step.spans = spans
+        return step
+
+    @property
+    def text(self):
+        # render the text from its source and revisions on demand
+        if self.rendered is None:
+            text = self.source
+            for edits in self.revisions:
+                text = apply_edits(text, edits)
+            self.rendered = text
+        return self.rendered
+
+    @text.setter
+    def text(self, step_text):
+        # replacing the text outright starts a new source with no revisions
+        self.source = step_text
+        self.revisions = []
+        self.rendered = step_text
+
+    def edit(self, pattern, switches, ranks):
+        # add a revision replacing the switches matched by pattern (see switch_pattern) in the current text
+        # switches: switch: (replacement, kind, rule), see Recipe.alter_steps
+        # where matches overlap the switch ranked first wins, as if the switches were replaced one after another
+        global STOPWORDS
+        text = self.text
+        matches = sorted(((ranks[match.group(1)], match.start(), match.start() + len(match.group(1)))
+                          for match in pattern.finditer(text)))
+        taken = []
+        for rank, start, end in matches:
+            if not any(start < taken_end and taken_start < end for taken_start, taken_end in taken):
+                taken.append((start, end))
+        edits = []
+        for start, end in sorted(taken):
+            if edits and start < edits[-1].end:  # already swallowed by the previous edit
+                continue
+            replacement, kind, rule = switches[text[start:end]]
+            words = replacement.split()
+            # swallow a neighbouring word the replacement already has, i.e. "olive" + "olive oil"
+            if words and words[-1] not in STOPWORDS:
+                following = REPEATED_WORD.match(text, end)
+                if following and following.group(1) == words[-1]:
+                    end = following.end()
+            if words and words[0] not in STOPWORDS:
+                previous_end = edits[-1].end if edits else 0
+                preceding = re.search(r'(\w+) $', text[previous_end:start])
+                if preceding and preceding.group(1) == words[0]:
+                    start = previous_end + preceding.start()
+            edits.append(Edit(start, end, text[start:end], replacement, kind, rule))
+        if edits:
+            self.revisions.append(edits)
+            self.rendered = None
+
+    def diff(self):
+        # get the span edits of every revision as dictionaries, offsets are into the text the revision was made on
+        return [dict(edit._asdict(), revision=count) for count, edits in enumerate(self.revisions) for edit in edits]
 
     def __str__(self):
         # print out ingredients and methods separately
-        if debugging:
+        if DEBUGGING.get():
             output = self.text + '\nStep Ingredients:  '
             for ingredient in self.ingredients:
                 output += str(ingredient) + ', '
@@ -449,6 +542,7 @@ class Step:
 class Ingredient:
     def __init__(self, name, adjective, category, amount, unit):
         # each ingredient can have a core name, adjective descriptor, food category, amount, and unit
+        self.lists = weakref.WeakSet()  # ingredient lists holding the ingredient, see IngredientList
         self.name = name
         self.adjective = adjective
         self.category = category
@@ -467,11 +561,161 @@ class Ingredient:
             output += self.adjective + ' '
         return output + self.name
 
+    def __setattr__(self, attribute, value):
+        # re-key the ingredient in the lists holding it when a substitution changes its name, adjective or category
+        ingredient_lists = self.__dict__.get('lists')
+        if attribute in INDEXED_ATTRIBUTES and ingredient_lists:
+            for ingredient_list in ingredient_lists:
+                ingredient_list.unindex(self)
+            object.__setattr__(self, attribute, value)
+            for ingredient_list in ingredient_lists:
+                ingredient_list.index(self)
+        else:
+            object.__setattr__(self, attribute, value)
+
+    def __getstate__(self):
+        # copies and pickles start out of every list, the lists they are copied with take them back
+        state = dict(self.__dict__)
+        del state['lists']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lists = weakref.WeakSet()
+
+    def to_dict(self):
+        return {'name': self.name, 'adjective': self.adjective, 'category': self.category, 'amount': self.amount,
+                'unit': self.unit}
+
+
+# ingredient attributes IngredientList indexes on
+INDEXED_ATTRIBUTES = frozenset(['name', 'adjective', 'category'])
+
+
+# ordered ingredient collection, indexed by identity, (name, adjective), and category
+# used for the ingredients of recipes and steps, so substitutions look up, remove, and merge ingredients in O(1) rather
+# than scanning the list; it reads like a list (iteration, len, indexing, in, append, remove)
+# an ingredient knows the lists holding it and re-keys itself in them when its name, adjective or category changes,
+# since one Ingredient object is shared by its recipe's list and the lists of every step using it
+
+class IngredientList:
+    def __init__(self, ingredients=()):
+        self.members = {}  # id(ingredient): ingredient, in list order
+        self.keys = {}  # (name, adjective): {id(ingredient): ingredient}
+        self.categories = {}  # category: {id(ingredient): ingredient}
+        self.mentions = None  # cached mention_names()
+        for ingredient in ingredients:
+            self.append(ingredient)
+
+    def __reduce__(self):
+        # copy and pickle as the ingredients in order, rebuilding the indexes on the copies
+        return IngredientList, (list(self.members.values()),)
+
+    def __iter__(self):
+        return iter(list(self.members.values()))  # a snapshot, so the list can change while it is walked
+
+    def __len__(self):
+        return len(self.members)
+
+    def __getitem__(self, index):
+        return list(self.members.values())[index]
+
+    def __contains__(self, ingredient):
+        return self.members.get(id(ingredient)) is ingredient
+
+    def __repr__(self):
+        return 'IngredientList([' + ', '.join(str(ingredient) for ingredient in self.members.values()) + '])'
+
+    def append(self, ingredient):
+        # add an ingredient at the end, an ingredient already in the list is left where it is
+        if ingredient in self:
+            return
+        self.members[id(ingredient)] = ingredient
+        ingredient.lists.add(self)
+        self.index(ingredient)
+
+    def extend(self, ingredients):
+        for ingredient in ingredients:
+            self.append(ingredient)
+
+    def remove(self, ingredient):
+        if ingredient not in self:
+            raise ValueError('ingredient not in list: ' + str(ingredient))
+        self.unindex(ingredient)
+        del self.members[id(ingredient)]
+        ingredient.lists.discard(self)
+
+    def index(self, ingredient):
+        self.keys.setdefault((ingredient.name, ingredient.adjective), {})[id(ingredient)] = ingredient
+        self.categories.setdefault(ingredient.category, {})[id(ingredient)] = ingredient
+        self.mentions = None
+
+    def unindex(self, ingredient):
+        for table, key in ((self.keys, (ingredient.name, ingredient.adjective)),
+                           (self.categories, ingredient.category)):
+            group = table[key]
+            del group[id(ingredient)]
+            if not group:
+                del table[key]
+        self.mentions = None
+
+    def ordered(self, group):
+        # ingredients of an index group in list order (groups of more than one are rare)
+        if len(group) < 2:
+            return list(group.values())
+        return [ingredient for key, ingredient in self.members.items() if key in group]
+
+    def find(self, name, adjective):
+        # get the ingredients with a name and adjective, in list order
+        return self.ordered(self.keys.get((name, adjective), {}))
+
+    def in_category(self, category):
+        # get the ingredients of a food category, in list order
+        return self.ordered(self.categories.get(category, {}))
+
+    def merge(self, added_ingredient):
+        # combine an ingredient into one with the same name and adjective, returns False if there is none it combines
+        # with (none, or only ones measured in units of another kind)
+        for ingredient in self.find(added_ingredient.name, added_ingredient.adjective):
+            if ingredient.amount is None or added_ingredient.amount is None:  # "to taste" on either side
+                ingredient.amount = ingredient.amount if ingredient.amount is not None else added_ingredient.amount
+                return True
+            amount = units.combine(ingredient.amount, ingredient.unit, added_ingredient.amount, added_ingredient.unit)
+            if amount is not None:  # otherwise the units measure different things and are kept apart
+                ingredient.amount = amount
+                return True
+        return False
+
+    def mention_names(self):
+        # get {name an ingredient is mentioned by in step text: ingredient}, its core name, or adjective and name when
+        # ingredients share a core name; worked out once for all steps until the list changes
+        if self.mentions is None:
+            ingredients_dict = {}
+            # group ingredients by core name (excluding unique adjectives)
+            for ingredient in self.members.values():
+                ingredients_dict.setdefault(ingredient.name, []).append(ingredient)
+            unique_ingredients_dict = {}
+            # get all unique ingredient names by including adjectives
+            for ingredient in ingredients_dict:
+                if len(ingredients_dict[ingredient]) == 1:
+                    unique_ingredients_dict[ingredient] = ingredients_dict[ingredient][0]
+                else:
+                    for ingredient_ref in ingredients_dict[ingredient]:
+                        if ingredient_ref.adjective:
+                            full_name = ingredient_ref.adjective + ' ' + ingredient
+                            unique_ingredients_dict[full_name] = ingredient_ref
+                        else:
+                            unique_ingredients_dict[ingredient] = ingredient_ref
+            self.mentions = unique_ingredients_dict
+        return self.mentions
+
 
 # ingredient instantiation functions
 
-# create an ingredient which is the base of the source ingredient's adjective
+# create an ingredient which is the base of the source ingredient's adjective, None if it has no adjective
 def ingredient_base(ingredient):
+    if not ingredient.adjective:
+        return None
     ingredient.name = ingredient.adjective
     ingredient.adjective = None
     return ingredient_categorize(ingredient)
@@ -487,7 +731,8 @@ def ingredient_categorize(ingredient):
 
 # make a new ingredient with a linearly proportionate amount
 def ingredient_delta(name, adjective, category, delta, ingredient):
-    return Ingredient(name, adjective, category, ingredient.amount*delta, ingredient.unit)
+    amount = ingredient.amount*delta if ingredient.amount is not None else None
+    return Ingredient(name, adjective, category, amount, ingredient.unit)
 
 
 # make a completely new ingredient
@@ -523,7 +768,8 @@ def change_category(category, ingredient):
 
 # change the amount of the ingredient and return the name, adjective full name
 def change_amount(delta, ingredient):
-    ingredient.amount *= delta
+    if ingredient.amount is not None:  # leave "to taste" ingredients without an amount
+        ingredient.amount *= delta
     if ingredient.adjective:
         return ingredient.adjective + ' ' + ingredient.name
     return ingredient.name
@@ -537,417 +783,273 @@ def change_unit(unit, ingredient):
     return ingredient.name
 
 
-# healthy substitutions dictionaries
-# key: material to be replaced
-# value: dictionary of partial functions later called with ingredient arguments to substitute/add/remove ingredients
-
-healthy_substitutions_names = {
-    'shortening': {'substitutions': [functools.partial(change_amount, 0.5)],
-                   'additions': [functools.partial(ingredient_delta, 'applesauce', 'unsweetened', 'sauce', 1)],
-                   'remove': None},
-    'oil': {'substitutions': [functools.partial(change_adjective, 'olive')]},
-    'butter': {'substitutions': [functools.partial(change_amount, 0.5)],
-               'additions': [functools.partial(ingredient_delta, 'oil', 'olive', 'oil', 1)],
-               'remove': None},
-    'sugar': {'substitutions': [functools.partial(change_name, 'stevia')]},
-    'salt': {'substitutions': [functools.partial(change_adjective, 'himalayan')]},
-    'pasta': {'substitutions': [functools.partial(change_adjective, 'whole-wheat')]},
-    'milk': {'substitutions': [functools.partial(change_adjective, 'almond')]},
-    'cheese': {'substitutions': [functools.partial(change_amount, 0.5)]},
-    'jelly': {'additions': [ingredient_base],
-              'remove': None},
-    'egg': {'substitutions': [functools.partial(change_adjective, 'substitute'),
-                              functools.partial(change_amount, 0.25),
-                              functools.partial(change_unit, 'cup')]},
-    'rice': {'substitutions': [functools.partial(change_name, 'quinoa')]},
-    'flour': {'substitutions': [functools.partial(change_adjective, 'whole-wheat')]},
-    'chocolate': {'substitutions': [functools.partial(change_name, 'nibs'),
-                                    functools.partial(change_adjective, 'cocoa')]},
-    'beef': {'substitutions': [functools.partial(change_name, 'chicken')]},
-    'steak': {'substitutions': [functools.partial(change_name, 'chicken')]},
-    'bacon': {'substitutions': [functools.partial(change_adjective, 'turkey')]},
-}
-healthy_substitutions_adjectives = {
-    'iceberg': {'substitutions': [functools.partial(change_adjective, 'romaine')]},
-    'peanut': {'substitutions': [functools.partial(change_adjective, 'almond')]},
-}
-healthy_substitutions_categories = {
-    'topping': {'remove': None},
-    'condiment': {'remove': None},
-    'vegetable': {'substitutions': [functools.partial(change_amount, 2)]},
-}
-healthy_substitutions_exceptions = {
-    'peanut butter': {'substitutions': [functools.partial(change_adjective, 'almond')]},
-    'sour cream': {'substitutions': [functools.partial(change_name, 'yogurt'),
-                                     functools.partial(change_adjective, 'greek')]},
-}
-healthy_substitutions_methods = {
-    'fry': 'saute'
+# key the ingredient dictionaries of a set of rules on normalized forms (see lexicon.normalize)
+# when keys collide ('onion' and 'onions'), the key already in normalized form wins
+def normalize_rules(rules):
+    normalized = dict(rules)
+    for table in ['names', 'adjectives', 'categories', 'exceptions']:
+        normalized[table] = {}
+        for key, value in rules[table].items():
+            normal_key = lexicon.normalize(key)
+            if normal_key not in normalized[table] or key == normal_key:
+                normalized[table][normal_key] = value
+    return normalized
+
+
+# make a set of rules read-only: dictionaries become mapping proxies and lists of partials become tuples
+def freeze_rules(rules):
+    frozen = {'vegetarian': rules['vegetarian']}
+    for table in ['names', 'adjectives', 'categories', 'exceptions', 'methods']:
+        frozen[table] = types.MappingProxyType({key: freeze_rule(value) for key, value in rules[table].items()})
+    return types.MappingProxyType(frozen)
+
+
+# make a single rule read-only
+def freeze_rule(rule):
+    if isinstance(rule, dict):
+        return types.MappingProxyType({key: tuple(value) if isinstance(value, list) else value
+                                       for key, value in rule.items()})
+    if isinstance(rule, list):
+        return tuple(rule)
+    return rule
+
+
+# rule files
+# the substitution rules of every transformation are read from a JSON rule file (rules.json next to this module, or
+# the file RECIPE_RULES names) and compiled into read-only tables when loaded; a file has the transformations and
+# the transformations that undo each other and cannot be combined:
+#   {"conflicts": [["healthy", "unhealthy"], ...],
+#    "transformations": {"healthy": {"label": "healthy", "finish": null, "rules": {...}, "baking_rules": null}, ...}}
+# a set of rules has the "names", "adjectives", "categories" and "exceptions" (full name) rule tables, the "methods"
+# table (method: method replacing it) and "vegetarian"; each rule is an object with any of
+#   "substitutions": operations changing the ingredient, i.e. [["name", "stevia"], ["amount", 0.5]]
+#   "additions": operations making a new ingredient from it, i.e. [["delta", "oil", "olive", "oil", 1]]
+#   "remove": true to take the ingredient out of its step
+
+RULES_PATH = os.environ.get('RECIPE_RULES') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+
+# argument types of operations
+NAME = (str,)
+TEXT = (str, type(None))
+NUMBER = (int, float)
+
+# operations of rule files
+# key: operation name
+# value: (function called with the arguments and then the ingredient, argument types)
+
+SUBSTITUTION_OPERATIONS = {
+    'name': (change_name, [NAME]),
+    'adjective': (change_adjective, [TEXT]),
+    'category': (change_category, [TEXT]),
+    'amount': (change_amount, [NUMBER]),
+    'unit': (change_unit, [TEXT]),
 }
 
-
-# healthy baking substitutions dictionaries
-
-healthy_baking_substitutions_names = {
-    'shortening': {'substitutions': [functools.partial(change_amount, 0.5)],
-                   'additions': [functools.partial(ingredient_delta, 'applesauce', 'unsweetened', 'sauce', 1)],
-                   'remove': None},
-    'oil': {'substitutions': [functools.partial(change_amount, 0.5)],
-            'additions': [functools.partial(ingredient_delta, 'applesauce', 'unsweetened', 'sauce', 1)],
-            'remove': None},
-    'butter': {'substitutions': [functools.partial(change_amount, 0.5)],
-               'additions': [functools.partial(ingredient_delta, 'applesauce', 'unsweetened', 'sauce', 1)],
-               'remove': None},
-    'sugar': {'substitutions': [functools.partial(change_name, 'stevia')]},
-    'salt': {'substitutions': [functools.partial(change_adjective, 'himalayan')]},
-    'milk': {'substitutions': [functools.partial(change_adjective, 'almond')]},
-    'cheese': {'substitutions': [functools.partial(change_amount, 0.5)]},
-    'jelly': {'additions': [ingredient_base],
-              'remove': None},
-    'egg': {'substitutions': [functools.partial(change_adjective, 'substitute'),
-                              functools.partial(change_amount, 0.25),
-                              functools.partial(change_unit, 'cup')]},
-    'flour': {'substitutions': [functools.partial(change_adjective, 'whole-wheat')]},
-    'chocolate': {'substitutions': [functools.partial(change_name, 'nibs'),
-                                    functools.partial(change_adjective, 'cacao')]},
-    'beef': {'substitutions': [functools.partial(change_name, 'chicken')]},
-    'steak': {'substitutions': [functools.partial(change_name, 'chicken')]},
-    'bacon': {'substitutions': [functools.partial(change_adjective, 'turkey')]},
-}
-healthy_baking_substitutions_adjectives = {
-    'peanut': {'substitutions': [functools.partial(change_adjective, 'almond')]},
-}
-healthy_baking_substitutions_categories = {
-    'topping': {'remove': None},
-}
-healthy_baking_substitutions_exceptions = {
-    'peanut butter': {'substitutions': [functools.partial(change_adjective, 'almond')]},
-}
-healthy_baking_substitutions_methods = {
-    'fry': 'bake'
+ADDITION_OPERATIONS = {
+    'base': (ingredient_base, []),
+    'categorize': (ingredient_categorize, []),
+    'delta': (ingredient_delta, [NAME, TEXT, TEXT, NUMBER]),
+    'ignore': (ingredient_ignore, [NAME, TEXT, TEXT, NUMBER + (type(None),), TEXT]),
 }
 
+# Recipe methods that finish a transformation once its steps are altered, by name
+FINISHES = {'add_unhealthy_step': Recipe.add_unhealthy_step}
+
+# ingredient rule tables of a set of rules
+RULE_TABLES = ['names', 'adjectives', 'categories', 'exceptions']
+
+
+# make the error raised for an invalid entry of a rule file
+def rule_error(where, message):
+    return ValueError('Invalid rules at ' + where + ': ' + message)
+
+
+# check that an entry of a rule file is an object with the given keys (and no others)
+def check_entry(entry, keys, where, optional=()):
+    if not isinstance(entry, dict):
+        raise rule_error(where, 'expected an object')
+    missing = [key for key in keys if key not in entry]
+    unknown = [key for key in entry if key not in keys and key not in optional]
+    if missing or unknown:
+        raise rule_error(where, 'missing ' + str(missing) if missing else 'unknown ' + str(unknown))
+
+
+# compile the contents of a rule file into a rule version, raising ValueError at the first invalid entry
+# a rule version is a read-only dictionary of the 'hash' of the rules, the 'path' they were loaded from,
+# 'transformations' (see TRANSFORMATIONS) and 'conflicts' (sets of transformations that cannot be combined)
+def compile_rules(data, path=None):
+    check_entry(data, ['conflicts', 'transformations'], 'top level')
+    if not isinstance(data['transformations'], dict) or not data['transformations']:
+        raise rule_error('transformations', 'expected an object of transformations')
+    transformations = {}
+    for name, entry in data['transformations'].items():
+        where = 'transformations.' + name
+        check_entry(entry, ['label', 'rules', 'baking_rules', 'finish'], where)
+        if not isinstance(entry['label'], str):
+            raise rule_error(where + '.label', 'expected a string')
+        if entry['finish'] is not None and entry['finish'] not in FINISHES:
+            raise rule_error(where + '.finish', 'unknown finish ' + repr(entry['finish']))
+        transformation = {'label': entry['label'],
+                          'rules': compile_rule_set(entry['rules'], where + '.rules'),
+                          'baking_rules': None,
+                          'finish': FINISHES[entry['finish']] if entry['finish'] else None}
+        if entry['baking_rules'] is not None:
+            transformation['baking_rules'] = compile_rule_set(entry['baking_rules'], where + '.baking_rules')
+        transformations[name] = types.MappingProxyType(transformation)
+    conflicts = []
+    for conflict in data['conflicts']:
+        if not isinstance(conflict, list) or any(name not in transformations for name in conflict):
+            raise rule_error('conflicts', 'expected lists of transformations, got ' + repr(conflict))
+        conflicts.append(frozenset(conflict))
+    rules_hash = hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return types.MappingProxyType({'hash': rules_hash, 'path': path,
+                                   'transformations': types.MappingProxyType(transformations),
+                                   'conflicts': tuple(conflicts)})
+
+
+# compile a set of rules of a rule file, keyed on normalized forms (so plural and singular variants hit the same
+# rule) and read-only (so it can be shared between threads)
+def compile_rule_set(rule_set, where):
+    check_entry(rule_set, RULE_TABLES + ['methods', 'vegetarian'], where)
+    if not isinstance(rule_set['vegetarian'], bool):
+        raise rule_error(where + '.vegetarian', 'expected true or false')
+    rules = {'vegetarian': rule_set['vegetarian']}
+    for table in RULE_TABLES + ['methods']:
+        if not isinstance(rule_set[table], dict):
+            raise rule_error(where + '.' + table, 'expected an object')
+    for method, replacement in rule_set['methods'].items():
+        if not isinstance(replacement, str):
+            raise rule_error(where + '.methods.' + method, 'expected a method')
+    rules['methods'] = dict(rule_set['methods'])
+    for table in RULE_TABLES:
+        rules[table] = {key: compile_rule(rule, where + '.' + table + '.' + key)
+                        for key, rule in rule_set[table].items()}
+    return freeze_rules(normalize_rules(rules))
+
+
+# compile a rule of a rule file into the dictionary of partial functions make_substitutions calls
+def compile_rule(rule, where):
+    check_entry(rule, [], where, optional=['substitutions', 'additions', 'remove'])
+    compiled = {}
+    for kind, operations in [('substitutions', SUBSTITUTION_OPERATIONS), ('additions', ADDITION_OPERATIONS)]:
+        if kind in rule:
+            if not isinstance(rule[kind], list):
+                raise rule_error(where + '.' + kind, 'expected a list of operations')
+            compiled[kind] = [compile_operation(operation, operations, where + '.' + kind)
+                              for operation in rule[kind]]
+    if 'remove' in rule:
+        if rule['remove'] is not True:
+            raise rule_error(where + '.remove', 'expected true')
+        compiled['remove'] = None
+    return compiled
+
+
+# compile an operation ([name, arguments...]) into a partial function taking the ingredient
+def compile_operation(operation, operations, where):
+    if not isinstance(operation, list) or not operation or operation[0] not in operations:
+        raise rule_error(where, 'unknown operation ' + repr(operation) + ', expected one of ' + str(list(operations)))
+    function, argument_types = operations[operation[0]]
+    arguments = operation[1:]
+    if len(arguments) != len(argument_types) or any(
+            not isinstance(argument, types_) or isinstance(argument, bool)
+            for argument, types_ in zip(arguments, argument_types)):
+        raise rule_error(where, 'bad arguments for ' + repr(operation[0]) + ': ' + repr(arguments))
+    if not arguments:
+        return function
+    return functools.partial(function, *arguments)
+
+
+# read and compile a rule file (RULES_PATH by default)
+def load_rules(path=None):
+    path = path or RULES_PATH
+    with open(path) as rules_file:
+        try:
+            data = json.load(rules_file)
+        except json.JSONDecodeError as e:
+            raise ValueError('Invalid rules in ' + path + ': ' + str(e))
+    return compile_rules(data, path)
+
+
+# the rule version in use
+# install_rules replaces it whole, and everything that applies rules reads it once and keeps using that version
+# (see Recipe.transform), so a request in flight is not affected by a version installed meanwhile
+# TRANSFORMATIONS and CONFLICTING_TRANSFORMATIONS follow it for code that only lists or looks up transformations:
+# TRANSFORMATIONS key: transformation name, as typed by the user
+#                 value: dictionary with the label printed while transforming, the substitution dictionaries for
+#                        non-baking recipes ('rules') and baking recipes ('baking_rules', None if the same), and an
+#                        optional Recipe method that finishes the recipe once its steps are altered
+
+RULES = None
+TRANSFORMATIONS = None
+CONFLICTING_TRANSFORMATIONS = None
+RULES_LOCK = threading.Lock()
+
+
+# install a compiled rule version for requests starting from now on, returns the version it replaces
+def install_rules(rules):
+    global RULES
+    global TRANSFORMATIONS
+    global CONFLICTING_TRANSFORMATIONS
+    with RULES_LOCK:
+        previous = RULES
+        RULES = rules
+        TRANSFORMATIONS = rules['transformations']
+        CONFLICTING_TRANSFORMATIONS = rules['conflicts']
+    return previous
+
+
+# load and install a rule file (RULES_PATH by default), returns the hash of the version in use
+# an invalid file raises ValueError and leaves the installed version in use
+def reload_rules(path=None):
+    rules = load_rules(path)
+    if RULES is None or rules['hash'] != RULES['hash']:
+        install_rules(rules)
+    return rules['hash']
+
+
+# reload a rule file whenever it changes, checking every interval seconds on a daemon thread
+# returns an event, set it to stop watching; edits that do not load are reported and the version in use is kept
+def watch_rules(path=None, interval=1.0):
+    path = path or RULES_PATH
+    stop = threading.Event()
+    modified = [os.stat(path).st_mtime_ns]
+
+    def watch():
+        while not stop.wait(interval):
+            try:
+                current = os.stat(path).st_mtime_ns
+                if current != modified[0]:
+                    modified[0] = current
+                    report('\nLoaded rules', reload_rules(path), 'from', path)
+            except (OSError, ValueError) as e:
+                report('\nCould not reload rules:', e)
 
-# unhealthy substitutions dictionaries
-
-unhealthy_substitutions_names = {
-    'applesauce': {'substitutions': [functools.partial(change_amount, 3)],
-                   'additions': [functools.partial(ingredient_delta, 'shortening', '', '', 1)],
-                   'remove': None},
-    'oil': {'substitutions': [functools.partial(change_amount, 3)],
-            'additions': [functools.partial(ingredient_delta, 'butter', '', '', 1)],
-            'remove': None},
-    'stevia': {'substitutions': [functools.partial(change_name, 'sugar'),
-                                 functools.partial(change_amount, 2)]},
-    'salt': {'substitutions': [functools.partial(change_adjective, 'table'),
-                               functools.partial(change_amount, 2)]},
-    'pasta': {'substitutions': [functools.partial(change_adjective, '')]},
-    'milk': {'substitutions': [functools.partial(change_adjective, 'whole')]},
-    'cheese': {'substitutions': [functools.partial(change_amount, 2)]},
-    'eggs': {'substitutions': [functools.partial(change_adjective, ''),
-                               functools.partial(change_amount, 1),
-                               functools.partial(change_unit, 'egg')]},
-    'quinoa': {'substitutions': [functools.partial(change_name, 'rice'),
-                                 functools.partial(change_adjective, 'white')]},
-    'flour': {'substitutions': [functools.partial(change_adjective, '')]},
-    'cacao': {'substitutions': [functools.partial(change_name, 'chocolate'),
-                                functools.partial(change_adjective, '')]},
-    'zoodles': {'additions': [functools.partial(ingredient_delta, 'pasta', '', '', 1)],
-                'remove': None},
-    'flaxseed': {'additions': [functools.partial(ingredient_delta, 'crumbs', 'bread', '', 1)],
-                 'remove': None},
-    'chicken': {'substitutions': [functools.partial(change_name, 'beef')]},
-}
-unhealthy_substitutions_adjectives = {
-    'romaine': {'substitutions': [functools.partial(change_adjective, 'iceberg')]},
-    'almond': {'substitutions': [functools.partial(change_adjective, 'peanut')]},
-    'corn': {'substitutions': [functools.partial(change_adjective, 'flour')]},
-    'fresh': {'substitutions': [functools.partial(change_adjective, 'canned')]},
-}
-unhealthy_substitutions_categories = {
-    'vegetable': {'remove': None},
-}
-unhealthy_substitutions_exceptions = {
-    'greek yogurt': {'substitutions': [functools.partial(change_name, 'sour'),
-                                       functools.partial(change_adjective, 'cream')]},
-}
-unhealthy_substitutions_methods = {
-    'saute': 'fry',
-    'sauté': 'fry',
-    'steam': 'fry',
-    'grill': 'fry',
-    'roast': 'fry',
-    'bake': 'fry',
-    'cook': 'fry'
-}
-
+    threading.Thread(target=watch, daemon=True).start()
+    return stop
 
-# unhealthy baking substitutions dictionaries
-
-unhealthy_baking_substitutions_names = {
-    'applesauce': {'substitutions': [functools.partial(change_amount, 3)],
-                   'additions': [functools.partial(ingredient_delta, 'shortening', '', '', 1)],
-                   'remove': None},
-    'oil': {'substitutions': [functools.partial(change_amount, 3)],
-            'additions': [functools.partial(ingredient_delta, 'butter', '', '', 1)],
-            'remove': None},
-    'stevia': {'substitutions': [functools.partial(change_name, 'sugar'),
-                                 functools.partial(change_amount, 2)]},
-    'salt': {'substitutions': [functools.partial(change_adjective, 'table'),
-                               functools.partial(change_amount, 2)]},
-    'pasta': {'substitutions': [functools.partial(change_adjective, '')]},
-    'milk': {'substitutions': [functools.partial(change_adjective, 'whole')]},
-    'cheese': {'substitutions': [functools.partial(change_amount, 2)]},
-    'egg': {'substitutions': [functools.partial(change_adjective, ''),
-                              functools.partial(change_amount, 1),
-                              functools.partial(change_unit, 'egg')]},
-    'quinoa': {'substitutions': [functools.partial(change_name, 'rice'),
-                                 functools.partial(change_adjective, 'white')]},
-    'flour': {'substitutions': [functools.partial(change_adjective, '')]},
-    'cacao': {'substitutions': [functools.partial(change_name, 'chocolate'),
-                                functools.partial(change_adjective, '')]},
-    'zoodles': {'additions': [functools.partial(ingredient_delta, 'pasta', '', '', 1)],
-                'remove': None},
-    'flaxseed': {'additions': [functools.partial(ingredient_delta, 'crumbs', 'bread', '', 1)],
-                 'remove': None},
-    'chicken': {'substitutions': [functools.partial(change_name, 'beef')]},
-}
-unhealthy_baking_substitutions_adjectives = {
-    'romaine': {'substitutions': [functools.partial(change_adjective, 'iceberg')]},
-    'almond': {'substitutions': [functools.partial(change_adjective, 'peanut')]},
-    'corn': {'substitutions': [functools.partial(change_adjective, 'flour')]},
-    'fresh': {'substitutions': [functools.partial(change_adjective, 'canned')]},
-}
-unhealthy_baking_substitutions_categories = {
-    'vegetable': {'remove': None},
-}
-unhealthy_baking_substitutions_exceptions = {
-    'greek yogurt': {'substitutions': [functools.partial(change_name, 'sour'),
-                                       functools.partial(change_adjective, 'cream')]},
-}
-unhealthy_baking_substitutions_methods = {
-    'saute': 'fry',
-    'sauté': 'fry',
-    'steam': 'fry',
-    'grill': 'fry',
-    'roast': 'fry',
-    'cook': 'fry'
-}
 
+install_rules(load_rules())
 
-# vegetarian substitutions dictionaries
 
-vegetarian_substitutions_names = {
-    'broth': {'substitutions': [functools.partial(change_adjective, 'vegetable'),
-                                functools.partial(change_category, 'broth')]},
-}
-vegetarian_substitutions_adjectives = {}
-vegetarian_substitutions_categories = {
-    'chicken': {'substitutions': [functools.partial(change_name, 'eggplant'),
-                                  functools.partial(change_adjective, None),
-                                  functools.partial(change_category, 'vegetable')]},
-    'pork': {'substitutions': [functools.partial(change_name, 'tofu'),
-                               functools.partial(change_adjective, None),
-                               functools.partial(change_category, 'curd')]},
-    'beef': {'substitutions': [functools.partial(change_name, 'lentils'),
-                               functools.partial(change_adjective, None),
-                               functools.partial(change_category, 'vegetable')]},
-    'sausage': {'substitutions': [functools.partial(change_name, 'seitan'),
-                                  functools.partial(change_adjective, None),
-                                  functools.partial(change_category, 'vegetable')]},
-    'steak': {'substitutions': [functools.partial(change_name, 'mushroom'),
-                                functools.partial(change_adjective, 'portobello'),
-                                functools.partial(change_category, 'vegetable')]},
-    'bacon': {'substitutions': [functools.partial(change_adjective, 'seitan'),
-                                functools.partial(change_adjective, None),
-                                functools.partial(change_category, 'vegetable')]},
-    'fish': {'substitutions': [functools.partial(change_name, 'tofu'),
-                               functools.partial(change_adjective, None),
-                               functools.partial(change_category, 'curd')]},
-    'crawfish': {'substitutions': [functools.partial(change_name, 'tofu'),
-                                   functools.partial(change_adjective, None),
-                                   functools.partial(change_category, 'curd')]},
-    'crayfish': {'substitutions': [functools.partial(change_name, 'tofu'),
-                                   functools.partial(change_adjective, None),
-                                   functools.partial(change_category, 'curd')]},
-    'tuna': {'substitutions': [functools.partial(change_name, 'tofuna'),
-                               functools.partial(change_adjective, None),
-                               functools.partial(change_category, 'curd')]},
-    'trout': {'substitutions': [functools.partial(change_name, 'tempeh'),
-                                functools.partial(change_adjective, None),
-                                functools.partial(change_category, 'vegetable')]},
-    'carp': {'substitutions': [functools.partial(change_name, 'tempeh'),
-                               functools.partial(change_adjective, None),
-                               functools.partial(change_category, 'vegetable')]},
-    'flounder': {'substitutions': [functools.partial(change_name, 'tofu'),
-                                   functools.partial(change_adjective, None),
-                                   functools.partial(change_category, 'curd')]},
-    'bass': {'substitutions': [functools.partial(change_name, 'tofu'),
-                               functools.partial(change_adjective, None),
-                               functools.partial(change_category, 'curd')]},
-    'sturgeon': {'substitutions': [functools.partial(change_name, 'tofu'),
-                                   functools.partial(change_adjective, None),
-                                   functools.partial(change_category, 'curd')]},
-    'shrimp': {'substitutions': [functools.partial(change_name, 'shrimp'),
-                                 functools.partial(change_adjective, 'vegan'),
-                                 functools.partial(change_category, 'curd')]},
-    'salmon': {'substitutions': [functools.partial(change_name, 'salmon'),
-                                 functools.partial(change_adjective, 'vegan'),
-                                 functools.partial(change_category, 'vegetable')]},
-    'lobster': {'substitutions': [functools.partial(change_name, 'lobster'),
-                                  functools.partial(change_adjective, 'vegan'),
-                                  functools.partial(change_category, 'curd')]},
-    'scallops': {'substitutions': [functools.partial(change_name, 'tofu'),
-                                   functools.partial(change_adjective, None),
-                                   functools.partial(change_category, 'curd')]},
-    'lamb': {'substitutions': [functools.partial(change_name, 'seitan'),
-                               functools.partial(change_adjective, None),
-                               functools.partial(change_category, 'vegetable')]},
-    'crab': {'substitutions': [functools.partial(change_name, 'crab'),
-                               functools.partial(change_adjective, 'vegan'),
-                               functools.partial(change_category, 'vegetable')]},
-    'turkey': {'substitutions': [functools.partial(change_name, 'tofurkey'),
-                                 functools.partial(change_adjective, None),
-                                 functools.partial(change_category, 'curd')]},
-    'duck': {'substitutions': [functools.partial(change_name, 'duck'),
-                               functools.partial(change_adjective, 'mock'),
-                               functools.partial(change_category, 'vegetable')]},
-    'liver': {'substitutions': [functools.partial(change_name, 'liver'),
-                                functools.partial(change_adjective, 'mock'),
-                                functools.partial(change_category, 'vegetable')]},
-    'ribs': {'substitutions': [functools.partial(change_name, 'seitan'),
-                               functools.partial(change_adjective, None),
-                               functools.partial(change_category, 'vegetable')]},
-    'pheasant': {'substitutions': [functools.partial(change_name, 'eggplant'),
-                                   functools.partial(change_adjective, None),
-                                   functools.partial(change_category, 'vegetable')]},
-    'quail': {'substitutions': [functools.partial(change_name, 'eggplant'),
-                                functools.partial(change_adjective, None),
-                                functools.partial(change_category, 'vegetable')]},
-    'goose': {'substitutions': [functools.partial(change_name, 'eggplant'),
-                                functools.partial(change_adjective, None),
-                                functools.partial(change_category, 'vegetable')]},
-    'escargot': {'substitutions': [functools.partial(change_name, 'tofu'),
-                                   functools.partial(change_adjective, None),
-                                   functools.partial(change_category, 'curd')]},
-    'snail': {'substitutions': [functools.partial(change_name, 'tofu'),
-                                functools.partial(change_adjective, None),
-                                functools.partial(change_category, 'curd')]},
-}
-vegetarian_substitutions_exceptions = {}
-
-
-# non-vegetarian substitutions dictionaries
-
-non_vegetarian_substitutions_names = {
-    'eggplant': {'substitutions': [functools.partial(change_name, 'chicken'),
-                                   functools.partial(change_adjective, 'fried'),
-                                   functools.partial(change_category, 'meat')]},
-    'tofu': {'substitutions': [functools.partial(change_name, 'pork'),
-                               functools.partial(change_category, 'meat')]},
-    'lentils': {'substitutions': [functools.partial(change_name, 'beef'),
-                                  functools.partial(change_category, 'meat')]},
-    'mushroom': {'substitutions': [functools.partial(change_name, 'steak'),
-                                   functools.partial(change_adjective, ''),
-                                   functools.partial(change_category, 'meat')]},
-    'seitan': {'substitutions': [functools.partial(change_name, 'bacon'),
-                                 functools.partial(change_category, 'meat')]},
-    'tempeh': {'substitutions': [functools.partial(change_name, 'fish'),
-                                 functools.partial(change_category, 'meat')]},
-}
-non_vegetarian_substitutions_adjectives = {}
-non_vegetarian_substitutions_categories = {}
-non_vegetarian_substitutions_exceptions = {}
-
-
-# thai substitutions dictionaries
-
-thai_substitutions_names = {
-    'salt': {'substitutions': [functools.partial(change_name, 'fish sauce'),
-                               functools.partial(change_adjective, 'thai'),
-                               functools.partial(change_amount, 1),
-                               functools.partial(change_unit, 'tablespoon')]},
-    'broccoli': {'substitutions': [functools.partial(change_adjective, 'chinese')]},
-    'pasta': {'substitutions': [functools.partial(change_adjective, 'rice'),
-                                functools.partial(change_name, 'noodles')]},
-    'noodles': {'substitutions': [functools.partial(change_adjective, 'rice')]},
-    'milk': {'substitutions': [functools.partial(change_adjective, 'coconut')]},
-    'cream': {'substitutions': [functools.partial(change_adjective, 'coconut'),
-                                functools.partial(change_name, 'milk')]},
-    'onions': {'substitutions': [functools.partial(change_name, 'shallots')]},
-    'onion': {'substitutions': [functools.partial(change_name, 'shallot')]},
-    'basil': {'substitutions': [functools.partial(change_adjective, 'thai')]},
-    'sugar': {'substitutions': [functools.partial(change_adjective, 'palm')]},
-    'apple': {'substitutions': [functools.partial(change_name, 'mango'),
-                                functools.partial(change_adjective, 'green')]},
-    'turnip': {'substitutions': [functools.partial(change_name, 'radish'),
-                                 functools.partial(change_adjective, 'white')]},
-}
-thai_substitutions_adjectives = {
-    'whole-wheat': {'substitutions': [functools.partial(change_adjective, 'rice')]},
-}
-thai_substitutions_categories = {
-    'pepper': {'substitutions': [functools.partial(change_adjective, 'chili')]}
-}
-thai_substitutions_exceptions = {
-    'soy sauce': [functools.partial(change_name, 'fish sauce'),
-                  functools.partial(change_adjective, 'thai')],
-    'lemon zest': [functools.partial(change_name, 'lemongrass'),
-                   functools.partial(change_adjective, None),
-                   functools.partial(change_category, 'herb')],
-    'large onion': {'substitutions': [functools.partial(change_name, 'shallots')]}
-}
+# helper functions
 
+# print output of the command line app, unless turned off for the current thread or task (see VERBOSE)
+def report(*args):
+    if VERBOSE.get():
+        print(*args)
 
-# mediterranean substitutions dictionaries
-
-mediterranean_substitutions_names = {
-    'broth': {'substitutions': [functools.partial(change_adjective, 'vegetable'),
-                                functools.partial(change_category, 'broth')]},
-    'tofu': {'substitutions': [functools.partial(change_name, 'fish'),
-                               functools.partial(change_category, 'meat')]},
-    'butter': {'substitutions': [functools.partial(change_name, 'olive oil'),
-                                 functools.partial(change_category, 'healthy_fats')]},
-    'soybean oil': {'substitutions': [functools.partial(change_name, 'sesame oil')]},
-    'corn oil': {'substitutions': [functools.partial(change_name, 'olive oil')]},
-    'vegetable oil': {'substitutions': [functools.partial(change_name, 'olive oil')]},
-    'cottonseed oil': {'substitutions': [functools.partial(change_name, 'flaxseed oil')]},
-    'bread': {'substitutions': [functools.partial(change_name, 'pita')]},
-    'jelly': {'substitutions': [functools.partial(change_name, 'berries'),
-                                functools.partial(change_adjective, 'fresh')]},
-    'rice': {'substitutions': [functools.partial(change_adjective, 'wild'),
-                               functools.partial(change_category, 'healthy_grains')]},
-    'pasta': {'substitutions': [functools.partial(change_adjective, 'whole-wheat'),
-                                functools.partial(change_category, 'healthy_grains')]},
-    'flour': {'substitutions': [functools.partial(change_adjective, 'whole-wheat')]},
-}
-mediterranean_substitutions_adjectives = {}
-mediterranean_substitutions_categories = {
-    'unhealthy_fats': {'substitutions': [functools.partial(change_name, 'olive oil'),
-                                         functools.partial(change_category, 'healthy_fats')]},
-    'unhealthy_dairy': {'substitutions': [functools.partial(change_name, 'yogurt'),
-                                          functools.partial(change_adjective, 'greek'),
-                                          functools.partial(change_category, 'healthy_dairy')]},
-    'beef': {'substitutions': [functools.partial(change_name, 'salmon'),
-                               functools.partial(change_adjective, 'fillet')]},
-    'chicken': {'substitutions': [functools.partial(change_name, 'tuna'),
-                                  functools.partial(change_adjective, 'fillet')]},
-    'turkey': {'substitutions': [functools.partial(change_name, 'beans'),
-                                 functools.partial(change_adjective, None)]},
-    'pork': {'substitutions': [functools.partial(change_name, 'trout'),
-                               functools.partial(change_adjective, 'fillet')]},
-    'bacon': {'substitutions': [functools.partial(change_name, 'salmon'),
-                                functools.partial(change_adjective, None)]},
-    'sausage': {'substitutions': [functools.partial(change_name, 'lentils')]},
-}
-mediterranean_substitutions_exceptions = {}
 
+# transform a copy of a parsed recipe, leaving the parsed recipe as is so it can be shared between threads
+def transform_recipe(recipe, *transformations):
+    transformed = recipe.copy()
+    transformed.transform(*transformations)
+    return transformed
 
-# helper functions
 
 # create ingredient instance from information of ingredient_text
 def add_ingredient(ingredient_text):
     global INGREDIENT_CATEGORIES
+    global CATEGORY_INDEX
     global SYNONYMS
     adjective = None
     category = None
@@ -958,37 +1060,34 @@ def add_ingredient(ingredient_text):
     if len(ingredient_parts) > 1:
         ingredient_style = ingredient_parts[1]  # add latter phrase as style
     if 'to taste' in ingredient:
-        if debugging:
+        if DEBUGGING.get():
             print('\ningred name:', ingredient.replace(' to taste', ''))
         return Ingredient(ingredient.replace(' to taste', ''), None, None, None, None)  # adjust for salt and pepper
     ingredient_words = ingredient.split()  # split ingredient into words
     name = ingredient_words[-1]  # assign last word to name
     ingredient_words = ingredient_words[:-1]
-    if ingredient_words and ingredient_words[0][0].isdigit():  # if words start with a number, make it the amount
-        if '/' in ingredient_words[0]:  # fractions
-            amount_split = ingredient_words[0].split('/')
-            amount = int(amount_split[0]) / int(amount_split[1])
-        else:
-            amount = float(ingredient_words[0])
-        ingredient_words = ingredient_words[1:]
+    amount, used = units.parse_amount(ingredient_words)  # if words start with a number, make it the amount
+    ingredient_words = ingredient_words[used:]
     if ingredient_words and amount:
-        if ingredient_words[0][0] == '(' and ingredient_words[0][1].isdigit():  # account for alternative measurements
-            amount = ingredient_words[0][1:]
-            unit = ingredient_words[1][:-1]
-            ingredient_words = ingredient_words[2:]
-        else:
-            pos = set()
-            for synset in nltk.corpus.wordnet.synsets(ingredient_words[0]):  # get POS tagging for the word
-                if synset.name().split('.')[0] == ingredient_words[0]:
-                    pos.add(synset.pos())
+        closing = next((count for count, word in enumerate(ingredient_words) if word.endswith(')')), None)
+        if ingredient_words[0][0] == '(' and closing is not None:  # account for alternative measurements
+            # i.e. "1 (16 ounce) can": the amount is the number of packages times their size
+            size_words = ' '.join(ingredient_words[:closing + 1])[1:-1].split()
+            size, used = units.parse_amount(size_words)
+            if size is not None:
+                amount *= size
+                unit = units.parse_unit(size_words[used:], True)[0] or ' '.join(size_words[used:]) or None
+                ingredient_words = ingredient_words[closing + 1:]
+        if unit is None:
+            unit, used = units.parse_unit(ingredient_words, True)  # known units, abbreviations and plurals
+            ingredient_words = ingredient_words[used:]
+        if unit is None and ingredient_words:
+            pos = lexicon.pos_tags(ingredient_words[0])  # get POS tagging for the word
             if 'a' not in pos and 's' not in pos:  # if not an adjective, add it as the amount
                 unit = ingredient_words[0]
                 ingredient_words = ingredient_words[1:]
     for word in ingredient_words:
-        pos = set()
-        for synset in nltk.corpus.wordnet.synsets(word):  # POS tagging
-            if synset.name().split('.')[0] == word:
-                pos.add(synset.pos())
+        pos = lexicon.pos_tags(word)  # POS tagging
         if not pos or 'a' in pos or 's' in pos or 'v' in pos:  # if word is an adjective or verb, add to adjective
             if not adjective:
                 adjective = word
@@ -1015,10 +1114,12 @@ def add_ingredient(ingredient_text):
     for meat in INGREDIENT_CATEGORIES['meat']:  # categorize meats
         if meat in full_name:
             category = meat
-    for key, val in INGREDIENT_CATEGORIES.items():  # categorize other types of ingredients
-        if (full_name in val or name in val) and category is None:
-            category = key
-    if debugging:
+    if category is None:  # categorize other types of ingredients, earliest listing category wins
+        keys = [lexicon.normalize(full_name), lexicon.normalize(name)]
+        matches = [CATEGORY_INDEX[key] for key in keys if key in CATEGORY_INDEX]
+        if matches:
+            category = min(matches)[1]
+    if DEBUGGING.get():
         print('\ningred amt:', str(amount))
         print('ingred unit:', unit)
         print('ingred adj:', adjective)
@@ -1027,9 +1128,77 @@ def add_ingredient(ingredient_text):
     return Ingredient(name, adjective, category, amount, unit)
 
 
+# merge the substitution dictionaries of several transformations into one fused set of rules
+# precedence: when transformations have a rule for the same key, the one listed first wins
+# ingredients still cascade through the exception, name, adjective and category dictionaries as they do for one
+def fuse_rules(rule_sets):
+    if len(rule_sets) == 1:
+        return rule_sets[0]
+    fused = {'names': {}, 'adjectives': {}, 'categories': {}, 'exceptions': {}, 'methods': {}, 'vegetarian': False}
+    for rules in rule_sets:
+        for table in ['names', 'adjectives', 'categories', 'exceptions', 'methods']:
+            for key, value in rules[table].items():
+                fused[table].setdefault(key, value)
+        fused['vegetarian'] = fused['vegetarian'] or rules['vegetarian']
+    return fused
+
+
+# find the rule keys of every transformation that match a recipe's step ingredients and methods
+# returns a dictionary of transformation to {'exceptions', 'names', 'adjectives', 'categories', 'methods'} lists of
+# matching keys, a transformation with no matching keys (and no finish) leaves the recipe unchanged
+# version: rule version to check with, the one in use by default
+def rule_applicability(recipe, version=None):
+    global RULES
+    version = version or RULES
+    ingredients = {}  # distinct step ingredients, keyed on identity
+    methods = set()
+    for step in recipe.steps:
+        for ingredient in step.ingredients:
+            ingredients[id(ingredient)] = ingredient
+        methods.update(step.methods or ())
+    keys = []  # (full name, name, adjective, category) keys of every ingredient, as make_substitutions_with uses them
+    for ingredient in ingredients.values():
+        full_name = ingredient.adjective + ' ' + ingredient.name if ingredient.adjective else ingredient.name
+        keys.append((lexicon.normalize(full_name), lexicon.normalize(ingredient.name),
+                     lexicon.normalize(ingredient.adjective) if ingredient.adjective else None,
+                     lexicon.normalize(ingredient.category) if ingredient.category else None))
+    applicability = {}
+    for transformation in version['transformations']:
+        rules = recipe.get_rules(transformation, version)
+        matches = {'exceptions': [], 'names': [], 'adjectives': [], 'categories': [],
+                   'methods': sorted(method for method in methods if method in rules['methods'])}
+        for full_name_key, name_key, adjective_key, category_key in keys:
+            if full_name_key in rules['exceptions']:
+                matches['exceptions'].append(full_name_key)
+                continue
+            for kind, key in [('names', name_key), ('adjectives', adjective_key), ('categories', category_key)]:
+                if key in rules[kind] and key not in matches[kind]:
+                    matches[kind].append(key)
+        applicability[transformation] = matches
+    return applicability
+
+
+# check that transformations exist and can be combined (with the rule version in use by default), returns them as a
+# list
+def check_transformations(transformations, version=None):
+    global RULES
+    version = version or RULES
+    for transformation in transformations:
+        if transformation not in version['transformations']:
+            raise ValueError('Unknown transformation: ' + str(transformation))
+    for conflict in version['conflicts']:
+        if conflict <= set(transformations):
+            raise ValueError('Cannot combine ' + ' and '.join(sorted(conflict)))
+    return list(transformations)
+
+
 # substitute ingredients, parametrized with ingredients and substitution dictionaries
-def make_substitutions_with(ingredients, ingredient_switches, names, adjectives, categories, exceptions, vegetarian):
+# switch_rules (if given) gets the rule that made every ingredient switch, as table:key
+def make_substitutions_with(ingredients, ingredient_switches, names, adjectives, categories, exceptions, vegetarian,
+                            switch_rules=None):
     global INGREDIENT_CATEGORIES
+    if switch_rules is None:
+        switch_rules = {}
     added_ingredients = []
     removed_ingredients = []
     for ingredient in ingredients:  # for every ingredient
@@ -1037,52 +1206,97 @@ def make_substitutions_with(ingredients, ingredient_switches, names, adjectives,
         full_name = name
         if ingredient.adjective:
             full_name = ingredient.adjective + ' ' + full_name
-        if full_name in exceptions:  # make exceptions substitutions
-            removed, new_name = make_substitutions(ingredient, exceptions[full_name], added_ingredients)
+        # rule dictionaries are keyed on normalized forms (see normalize_rules)
+        name_key = lexicon.normalize(name)
+        full_name_key = lexicon.normalize(full_name)
+        if full_name_key in exceptions:  # make exceptions substitutions
+            removed, new_name = make_substitutions(ingredient, exceptions[full_name_key], added_ingredients)
             ingredient_switches[full_name] = new_name  # add full name to ingredient_switches dict
             ingredient_switches[name] = new_name  # and after, name (full name is triggered first)
+            switch_rules[full_name] = switch_rules[name] = 'exceptions:' + full_name_key
             if removed:
                 removed_ingredients.append(ingredient)
             continue
-        if name in names:  # name substitutions
-            removed, new_name = make_substitutions(ingredient, names[name], added_ingredients)
+        if name_key in names:  # name substitutions
+            removed, new_name = make_substitutions(ingredient, names[name_key], added_ingredients)
             ingredient_switches[full_name] = new_name
             ingredient_switches[name] = new_name
+            switch_rules[full_name] = switch_rules[name] = 'names:' + name_key
             if removed:
                 removed_ingredients.append(ingredient)
                 continue
-        if ingredient.adjective in adjectives:  # adjective substitutions
-            removed, new_name = make_substitutions(ingredient, adjectives[ingredient.adjective], added_ingredients)
+        adjective_key = lexicon.normalize(ingredient.adjective) if ingredient.adjective else ingredient.adjective
+        if adjective_key in adjectives:  # adjective substitutions
+            removed, new_name = make_substitutions(ingredient, adjectives[adjective_key], added_ingredients)
             ingredient_switches[full_name] = new_name
             ingredient_switches[name] = new_name
+            switch_rules[full_name] = switch_rules[name] = 'adjectives:' + adjective_key
             if removed:
                 removed_ingredients.append(ingredient)
                 continue
-        if ingredient.category in categories:  # category substitutions
+        category_key = lexicon.normalize(ingredient.category) if ingredient.category else ingredient.category
+        if category_key in categories:  # category substitutions
             category = ingredient.category
-            removed, new_name = make_substitutions(ingredient, categories[category], added_ingredients)
+            removed, new_name = make_substitutions(ingredient, categories[category_key], added_ingredients)
             ingredient_switches[full_name] = new_name
             ingredient_switches[name] = new_name
+            switch_rules[full_name] = switch_rules[name] = 'categories:' + category_key
             if vegetarian and category in INGREDIENT_CATEGORIES['meat']:  # exception for vegetarian
                 ingredient_switches['meat'] = new_name
+                switch_rules['meat'] = 'categories:' + category_key
                 if new_name.split(' ')[-1] != category:  # len(new_name.split(' ')) > 2:
                     ingredient_switches[' ' + category] = ''
+                    switch_rules[' ' + category] = 'categories:' + category_key
             if removed:
                 removed_ingredients.append(ingredient)
                 continue
     for ingredient in removed_ingredients:  # remove ingredients
         ingredients.remove(ingredient)
     for added_ingredient in added_ingredients:  # add ingredients, combining if the same
-        combined = False
-        for ingredient in ingredients:
-            if ingredient.name == added_ingredient.name and ingredient.adjective == added_ingredient.adjective:
-                ingredient.amount += added_ingredient.amount
-                combined = True
-                break
-        if not combined:
+        if not ingredients.merge(added_ingredient):
             ingredients.append(added_ingredient)
 
 
+# match a word, used to tokenize step text for lemma matching
+WORD = re.compile(r'\w+')
+
+# match a word or punctuation mark, the tokenizer used instead of NLTK's past a request's latency budget
+TOKEN = re.compile(r"\w+(?:'\w+)?|[^\w\s]")
+
+
+# match a single following word, used to find repeated words around span edits
+REPEATED_WORD = re.compile(r' (\w+)\b')
+
+
+# compile a pattern finding, at every position, the first switch (in the order given) that starts there and ends in a
+# space, period, or comma, as group 1 of an empty match so that overlapping switches are all found
+# switches starting with a letter must also start a word, returns None if there are no switches
+def switch_pattern(switches):
+    alternatives = []
+    for switch in switches:
+        if not switch:
+            continue
+        if switch[0].isalnum():
+            alternatives.append(r'(?<!\w)' + re.escape(switch))
+        else:
+            alternatives.append(re.escape(switch))
+    if not alternatives:
+        return None
+    return re.compile('(?=(' + '|'.join(alternatives) + ')(?=[ .,]))')
+
+
+# render text with a list of non-overlapping span edits sorted by start
+def apply_edits(text, edits):
+    pieces = []
+    position = 0
+    for edit in edits:
+        pieces.append(text[position:edit.start])
+        pieces.append(edit.replacement)
+        position = edit.end
+    pieces.append(text[position:])
+    return ''.join(pieces)
+
+
 # use partial functions in substitution dictionaries to modify, add, or remove ingredients
 def make_substitutions(ingredient, substitutions, added_ingredients):
     new_name = ''
@@ -1092,28 +1306,29 @@ def make_substitutions(ingredient, substitutions, added_ingredients):
     if 'additions' in substitutions:
         for addition in substitutions['additions']:
             new_ingredient = addition(ingredient)
-            added_ingredients.append(new_ingredient)
+            if new_ingredient is not None:
+                added_ingredients.append(new_ingredient)
     if 'remove' in substitutions:
         return True, ''
     return False, new_name
 
 
 if __name__ == '__main__':
-    debugging = True
+    DEBUGGING.set(True)
     # get URL from user input
     while True:
-        if debugging:
+        if DEBUGGING.get():
             # url = 'https://www.allrecipes.com/recipe/173906/cajun-roasted-pork-loin/'
             # url = 'https://www.allrecipes.com/recipe/269944/shrimp-and-smoked-sausage-jambalaya/'
             url = str(input('Please provide a recipe URL: '))
         else:
             url = str(input('Please provide a recipe URL: '))
-        if len(url) > 40 and url[:34] == 'https://www.allrecipes.com/recipe/':
+        if adapters.adapter_for(url):  # a site with an adapter
             try:
                 # take url and load recipe using beautiful soup
                 soup = BeautifulSoup(urllib.request.urlopen(url), 'html.parser')
                 # instantiate recipe object using soup
-                recipe = Recipe(soup)
+                recipe = Recipe(soup, url)
                 break
             except Exception as e:
                 print(e)
@@ -1124,23 +1339,11 @@ if __name__ == '__main__':
         #     transformation = 'mediterranean'
         # else:
         transformation = input('\nHow would you like to transform your recipe? Type "healthy", "unhealthy",'
-                                   '"vegetarian", "meatify", "mediterranean", or "thai" (without quotes): ')
-        if transformation == 'healthy':
-            recipe.make_healthy()
-            break
-        elif transformation == 'unhealthy':
-            recipe.make_unhealthy()
-            break
-        elif transformation == 'vegetarian':
-            recipe.make_vegetarian()
-            break
-        elif transformation == 'meatify':
-            recipe.make_non_vegetarian()
-            break
-        elif transformation == 'thai':
-            recipe.make_thai()
-            break
-        elif transformation == 'mediterranean':
-            recipe.make_mediterranean()
+                                   '"vegetarian", "meatify", "mediterranean", or "thai" (without quotes), or combine '
+                                   'them with "and" (e.g. "vegetarian and healthy"): ')
+        try:
+            recipe.transform(*[part.strip() for part in transformation.split(' and ')])
             break
+        except ValueError as e:
+            print(e)
         print('Invalid input, please try again.')
@@ -0,0 +1,525 @@
+import http.server
+import json
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import numpy as np
+import recipe_transform
+
+
+# fuzzy type-ahead search over ingredient names and recipe names
+# names are split into words, and every distinct word into character trigrams (each padded, '  egg ' gives '  e',
+# ' eg', 'egg', 'gg '); a query word is matched to the words sharing most of its trigrams, so misspellings
+# ('parmesian', 'cayene') and prefixes still find their words, and names are ranked by how well their words match
+# the query's words, shorter names first on ties
+# the index is numpy CSR tables: the trigrams of every word and the words of every trigram, the words of every name
+# and the names of every word
+
+KINDS = ['ingredient', 'recipe']
+
+# most names scored for a query, so it costs about the same however many names the index holds: the names of the
+# query word matching fewest names are narrowed to those also matching the other query words, then to the shortest
+# ones, until there are no more than this many
+CANDIDATE_BUDGET = 4000
+
+# words a query word is matched to (at most WORD_MATCHES, scoring at least MIN_WORD_SCORE)
+WORD_MATCHES = 8
+MIN_WORD_SCORE = 0.3
+
+# most query words whose matches are kept (type-ahead queries repeat their words on every keystroke), the cache is
+# emptied when full and whenever words are added
+WORD_CACHE_SIZE = 100000
+
+# weight of a word's trigrams missing from the query word, against the query word's trigrams missing from the word
+# (low, so a word a query word is the start of scores close to an exact match)
+EXTRA_TRIGRAM_WEIGHT = 0.1
+
+WORDS = re.compile(r'[^\W_]+')
+
+
+# normalize a name for the index: lowercase words separated by single spaces
+def normalize(text):
+    return ' '.join(WORDS.findall(text.lower()))
+
+
+# get the set of trigrams of a word
+def trigrams(word):
+    padded = '  ' + word + ' '
+    return {padded[position:position + 3] for position in range(len(padded) - 2)}
+
+
+# get a query and its spellings with words replaced through SYNONYMS, i.e. 'chicken stock' and 'chicken broth'
+def expansions(query):
+    words = normalize(query).split()
+    expanded = ' '.join(normalize(recipe_transform.SYNONYMS.get(word, word)) for word in words)
+    return [' '.join(words)] if expanded == ' '.join(words) else [' '.join(words), expanded]
+
+
+# gather the items of some rows of a CSR table, returns them flat with the number taken from each row
+def gather(indptr, items, rows, limit=None):
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    if limit is not None:
+        counts = np.minimum(counts, limit)
+    positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return items[positions], counts
+
+
+# get the distinct values of an array, sorted (faster than np.unique for the short arrays of a query)
+def unique(values):
+    values = np.sort(values)
+    return values[np.concatenate([[True], values[1:] != values[:-1]])] if len(values) else values
+
+
+# append values to the items of a growable array (its length is its capacity, count the items in use), doubling it
+# when full so appending is amortized constant time; returns the array, a new one if it grew (items in use are never
+# moved or changed, so views of them stay valid)
+def append(array, count, values):
+    if count + len(values) > len(array):
+        grown = np.empty(max(2 * len(array), count + len(values), 16), dtype=array.dtype)
+        grown[:count] = array[:count]
+        array = grown
+    array[count:count + len(values)] = values
+    return array
+
+
+# build a segment of the index: the word posting tables of the names from first_entry on, and the trigram tables of
+# the words from first_word on (both over the ids of the whole index)
+def build_segment(words, entry_indptr, entry_words, first_entry, first_word):
+    segment = {'first_entry': first_entry, 'entries': len(entry_indptr) - 1, 'first_word': first_word,
+               'words': len(words)}
+    # names of every word, in entry order
+    held = entry_words[entry_indptr[first_entry]:entry_indptr[-1]]
+    entries = np.repeat(np.arange(first_entry, len(entry_indptr) - 1, dtype=np.int32),
+                        np.diff(entry_indptr[first_entry:]))
+    segment['word_entries'] = entries[np.argsort(held, kind='stable')]
+    segment['word_entry_indptr'] = np.concatenate([[0], np.cumsum(np.bincount(held, minlength=len(words)))])
+    # trigrams of every word, and words of every trigram
+    trigram_ids = {}
+    word_trigrams = [sorted(trigram_ids.setdefault(trigram, len(trigram_ids)) for trigram in trigrams(word))
+                     for word in words[first_word:]]
+    segment['trigram_ids'] = trigram_ids
+    segment['trigram_counts'] = np.array([len(ids) for ids in word_trigrams], dtype=np.int64)
+    trigram_held = np.fromiter((trigram_id for ids in word_trigrams for trigram_id in ids), dtype=np.int32,
+                               count=int(segment['trigram_counts'].sum()))
+    owners = np.repeat(np.arange(first_word, len(words), dtype=np.int32), segment['trigram_counts'])
+    segment['trigram_words'] = owners[np.argsort(trigram_held, kind='stable')]
+    segment['trigram_indptr'] = np.concatenate([[0], np.cumsum(np.bincount(trigram_held,
+                                                                           minlength=len(trigram_ids)))])
+    return segment
+
+
+# get the names of some words in the segments of the index, in entry order for a single word
+def word_entries(segments, word_ids):
+    found = []
+    for segment in segments:
+        indptr = segment['word_entry_indptr']
+        found.append(gather(indptr, segment['word_entries'], word_ids[word_ids < len(indptr) - 1])[0])
+    return np.concatenate(found)
+
+
+# count the names of some words in the segments of the index
+def word_entry_count(segments, word_ids):
+    count = 0
+    for segment in segments:
+        indptr = segment['word_entry_indptr']
+        word_ids = word_ids[word_ids < len(indptr) - 1]
+        count += int((indptr[word_ids + 1] - indptr[word_ids]).sum())
+    return count
+
+
+# trigram index of names
+# names are added one at a time (pending) and appended to the arrays on the next search; a name added again (same
+# kind and normalized text) is only kept once, and a name can stand for another one (its canonical name, i.e. a
+# SYNONYMS key for its value), which results then report instead
+# the word trigram and posting tables are split in segments: the main one, built once for the names there were (see
+# build), and a delta one for the names added since, rebuilt on the next search after adds (it costs what the added
+# names do, so adding never makes a search rebuild the whole index); once the delta holds COMPACT_SIZE names or
+# COMPACT_WORDS new words a background thread builds a new main segment off the lock and swaps it in, so searches go
+# on meanwhile
+
+# names and new words in the delta segment when it is compacted into the main one (the trigrams of its words are
+# found in python, so they cost more than its names)
+COMPACT_SIZE = 20000
+COMPACT_WORDS = 2000
+
+# arrays of the names: kind, canonical entry id and length of every name, and the words of every name (CSR)
+ARRAYS = ['kinds', 'canonical', 'lengths', 'entry_indptr', 'entry_words']
+
+
+class SearchIndex:
+    def __init__(self, texts=None, kinds=None, canonical=None, words=None, entry_indptr=None, entry_words=None):
+        self.texts = list(texts or [])
+        self.kinds = np.zeros(0, dtype=np.int8) if kinds is None else kinds
+        self.canonical = np.zeros(0, dtype=np.int32) if canonical is None else canonical
+        self.lengths = np.array([len(text) for text in self.texts], dtype=np.int32)
+        self.words = list(words or [])
+        self.entry_indptr = np.zeros(1, dtype=np.int64) if entry_indptr is None else entry_indptr
+        self.entry_words = np.zeros(0, dtype=np.int32) if entry_words is None else entry_words
+        # growable arrays the ones above are views of (see append)
+        self.arrays = {name: getattr(self, name) for name in ARRAYS}
+        self.entry_ids = {(kind, text): entry_id for entry_id, (text, kind)
+                          in enumerate(zip(self.texts, self.kinds.tolist()))}
+        self.word_ids = {word: word_id for word_id, word in enumerate(self.words)}
+        # names added since the arrays were last appended to: (kind, canonical entry id, word ids)
+        self.pending = []
+        # segments searched and the query words matched in them ({query word: match_word result}), see build
+        self.tables = None
+        self.compacting = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, text, kind='ingredient', canonical=None):
+        # add a name of a kind (see KINDS), canonical: name of the same kind that results report instead
+        # returns the entry id, or None if the name has no words
+        text = normalize(text or '')
+        if not text:
+            return None
+        with self.lock:
+            return self.add_entry(text, KINDS.index(kind), normalize(canonical) if canonical else None)
+
+    def add_entry(self, text, kind, canonical):
+        entry_id = self.entry_ids.get((kind, text))
+        if entry_id is not None:
+            return entry_id
+        canonical_id = self.add_entry(canonical, kind, None) if canonical and canonical != text else None
+        entry_id = self.entry_ids[(kind, text)] = len(self.texts)
+        self.texts.append(text)
+        word_ids = []
+        for word in text.split():
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                word_id = self.word_ids[word] = len(self.words)
+                self.words.append(word)
+            word_ids.append(word_id)
+        self.pending.append((kind, entry_id if canonical_id is None else canonical_id, word_ids))
+        return entry_id
+
+    def add_recipe(self, recipe):
+        # add a parsed recipe's name and the names of its ingredients (as add_ingredient found them)
+        self.add(recipe.name, 'recipe')
+        for ingredient in recipe.ingredients:
+            self.add(ingredient.name, 'ingredient')
+            if ingredient.adjective and ingredient.name:
+                self.add(ingredient.adjective + ' ' + ingredient.name, 'ingredient')
+
+    def add_vocabulary(self):
+        # add every SYNONYMS key as a stand-in for its value (first, since add_ingredient never keeps a key as a
+        # name even if it is categorized), and every categorized ingredient name
+        for name, synonym in recipe_transform.SYNONYMS.items():
+            self.add(name, 'ingredient', synonym)
+        for names in recipe_transform.INGREDIENT_CATEGORIES.values():
+            for name in names:
+                self.add(name, 'ingredient')
+
+    def flush(self):
+        # append the pending names to the arrays (holding the lock)
+        if not self.pending:
+            return
+        entry_count, held_count = len(self.kinds), len(self.entry_words)
+        counts = np.array([len(word_ids) for _, _, word_ids in self.pending], dtype=np.int64)
+        added = {'kinds': np.array([kind for kind, _, _ in self.pending], dtype=np.int8),
+                 'canonical': np.array([canonical for _, canonical, _ in self.pending], dtype=np.int32),
+                 'lengths': np.array([len(text) for text in self.texts[entry_count:]], dtype=np.int32),
+                 'entry_indptr': self.entry_indptr[-1] + np.cumsum(counts),
+                 'entry_words': np.fromiter((word_id for _, _, word_ids in self.pending for word_id in word_ids),
+                                            dtype=np.int32, count=int(counts.sum()))}
+        self.pending = []
+        for name in ARRAYS:
+            count = held_count if name == 'entry_words' else entry_count + (name == 'entry_indptr')
+            self.arrays[name] = append(self.arrays[name], count, added[name])
+            setattr(self, name, self.arrays[name][:count + len(added[name])])
+
+    def install(self, main):
+        # search a main segment and a delta segment of the names added since it was built (holding the lock)
+        # the query words matched are kept while the words are the same
+        segments = [main]
+        if main['entries'] < len(self.kinds):
+            segments.append(build_segment(self.words, self.entry_indptr, self.entry_words, main['entries'],
+                                          main['words']))
+        words = segments[-1]['words']
+        same = self.tables is not None and self.tables['words'] == words
+        self.tables = {'segments': segments, 'words': words,
+                       'word_matches': self.tables['word_matches'] if same else {}}
+
+    def build(self):
+        # append the pending names to the arrays and build the main segment of all of them
+        with self.lock:
+            self.flush()
+            self.install(build_segment(self.words, self.entry_indptr, self.entry_words, 0, 0))
+
+    def compact(self):
+        # build the main segment of the names there are off the lock, then swap it in
+        with self.lock:
+            self.flush()
+            words, entry_indptr, entry_words = list(self.words), self.entry_indptr, self.entry_words
+        try:
+            main = build_segment(words, entry_indptr, entry_words, 0, 0)
+            with self.lock:
+                self.flush()
+                self.install(main)
+        finally:
+            self.compacting = False
+
+    def refresh(self):
+        # get the tables to search, building the main segment on the first search and the delta segment on the
+        # first search after adds, and compacting a full delta in the background
+        with self.lock:
+            if self.tables is None:
+                self.flush()
+                self.install(build_segment(self.words, self.entry_indptr, self.entry_words, 0, 0))
+            elif self.pending:
+                self.flush()
+                main = self.tables['segments'][0]
+                self.install(main)
+                if not self.compacting and (len(self.kinds) - main['entries'] >= COMPACT_SIZE
+                                            or len(self.words) - main['words'] >= COMPACT_WORDS):
+                    self.compacting = True
+                    threading.Thread(target=self.compact, daemon=True).start()
+            return self.tables
+
+    def match_word(self, word, tables):
+        # find the words best matching a query word
+        # returns arrays of word ids and scores (1.0 for the word itself), best first
+        matches = tables['word_matches'].get(word)
+        if matches is None:
+            if len(tables['word_matches']) >= WORD_CACHE_SIZE:
+                tables['word_matches'].clear()
+            matches = tables['word_matches'][word] = self.find_words(word, tables['segments'])
+        return matches
+
+    def find_words(self, word, segments):
+        query = trigrams(word)
+        found_ids, found_scores = [], []
+        for segment in segments:
+            known = np.array(sorted(segment['trigram_ids'][trigram] for trigram in query
+                                    if trigram in segment['trigram_ids']), dtype=np.int64)
+            if not len(known):
+                continue
+            # count the query trigrams every word has (a word is listed once in the words of a trigram), a word
+            # sharing fewer than MIN_WORD_SCORE of them cannot score MIN_WORD_SCORE
+            shared = np.bincount(gather(segment['trigram_indptr'], segment['trigram_words'], known)[0]
+                                 - segment['first_word'], minlength=len(segment['trigram_counts']))
+            candidates = np.flatnonzero(shared >= max(1.0, MIN_WORD_SCORE * len(query)))
+            shared = shared[candidates]
+            found_scores.append(shared / (len(query) + EXTRA_TRIGRAM_WEIGHT
+                                          * (segment['trigram_counts'][candidates] - shared)))
+            found_ids.append(candidates + segment['first_word'])
+        if not found_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        candidates, scores = np.concatenate(found_ids), np.concatenate(found_scores)
+        best = np.argsort(-scores, kind='stable')[:WORD_MATCHES]
+        best = best[scores[best] >= MIN_WORD_SCORE]
+        return candidates[best], scores[best]
+
+    def match(self, text, kind, tables):
+        # score the names matching a normalized query: the mean, over the query's words, of the best score of a
+        # word of the name for it
+        # returns arrays of entry ids and scores
+        segments = tables['segments']
+        matches = [self.match_word(word, tables) for word in text.split()]
+        matched = [(word_ids, scores) for word_ids, scores in matches if len(word_ids)]
+        if not matched:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        # candidates: the names of the query word whose words have fewest names, narrowed within the budget
+        groups = sorted((word_ids for word_ids, _ in matched), key=lambda ids: word_entry_count(segments, ids))
+        candidates = unique(word_entries(segments, groups[0]))
+        if kind is not None:
+            candidates = candidates[self.kinds[candidates] == KINDS.index(kind)]
+        for word_ids in groups[1:]:
+            if len(candidates) <= CANDIDATE_BUDGET:
+                break
+            keep = np.zeros(len(candidates), dtype=bool)
+            for word_id in word_ids.tolist():
+                postings = word_entries(segments, np.array([word_id]))
+                if not len(postings):
+                    continue
+                found = np.searchsorted(postings, candidates).clip(0, len(postings) - 1)
+                keep |= postings[found] == candidates
+            if keep.any():
+                candidates = candidates[keep]
+        if len(candidates) > CANDIDATE_BUDGET:
+            candidates = np.sort(candidates[np.argpartition(self.lengths[candidates],
+                                                            CANDIDATE_BUDGET)[:CANDIDATE_BUDGET]])
+        if not len(candidates):
+            return candidates, np.zeros(0)
+        held, counts = gather(self.entry_indptr, self.entry_words, candidates)
+        starts = np.cumsum(counts) - counts
+        total = np.zeros(len(candidates))
+        word_scores = np.zeros(len(self.words))
+        for word_ids, scores in matched:
+            word_scores[word_ids] = scores
+            total += np.maximum.reduceat(word_scores[held], starts)
+            word_scores[word_ids] = 0.0
+        return candidates, total / len(matches)
+
+    def search(self, query, k=10, kind=None):
+        # find the k names best matching a query (and its SYNONYMS spellings), kind: 'ingredient', 'recipe' or None
+        # for both; names standing for another are reported as the other
+        # returns a list of (name, kind, score), best first
+        tables = self.refresh()
+        best = {}
+        for text in expansions(query):
+            candidates, scores = self.match(text, kind, tables)
+            # room for names reporting the same canonical name
+            top = np.lexsort((self.lengths[candidates], -scores))[:k * 2]
+            for entry_id, score in zip(self.canonical[candidates[top]].tolist(), scores[top].tolist()):
+                if score > best.get(entry_id, 0.0):
+                    best[entry_id] = score
+        ranked = sorted(best.items(), key=lambda item: (-item[1], len(self.texts[item[0]]), item[0]))[:k]
+        return [(self.texts[entry_id], KINDS[self.kinds[entry_id]], score) for entry_id, score in ranked]
+
+    def save(self, path):
+        # write the index to an .npz file (the word trigram and posting tables are rebuilt on load)
+        self.refresh()
+        np.savez(path, texts=np.array(self.texts, dtype=str), kinds=self.kinds, canonical=self.canonical,
+                 words=np.array(self.words, dtype=str), entry_indptr=self.entry_indptr, entry_words=self.entry_words)
+
+    @classmethod
+    def load(cls, path):
+        # read an index written by save
+        with np.load(path) as arrays:
+            return cls(arrays['texts'].tolist(), arrays['kinds'], arrays['canonical'], arrays['words'].tolist(),
+                       arrays['entry_indptr'], arrays['entry_words'])
+
+
+# search endpoint
+# GET /search?q=QUERY[&k=10][&kind=ingredient|recipe] answers {"results": [{"name", "kind", "score"}, ...]}
+# returns the server (stop it with server.shutdown()) and its base URL
+
+def serve(index, host='127.0.0.1', port=8000):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            parameters = urllib.parse.parse_qs(url.query)
+            try:
+                if url.path != '/search' or 'q' not in parameters:
+                    raise LookupError('usage: /search?q=QUERY[&k=10][&kind=ingredient|recipe]')
+                kind = parameters.get('kind', [None])[0]
+                if kind not in KINDS + [None]:
+                    raise ValueError('kind must be one of ' + ', '.join(KINDS))
+                results = index.search(parameters['q'][0], int(parameters.get('k', ['10'])[0]), kind)
+                status, body = 200, {'results': [{'name': name, 'kind': result_kind, 'score': round(score, 4)}
+                                                 for name, result_kind, score in results]}
+            except LookupError as e:
+                status, body = 404, {'error': str(e)}
+            except ValueError as e:
+                status, body = 400, {'error': str(e)}
+            encoded = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://{0}:{1}'.format(*server.server_address[:2])
+
+
+# misspell a name by deleting, doubling, or replacing one of its letters
+def misspell(text, generator):
+    position = int(generator.integers(1, len(text)))
+    edit = int(generator.integers(0, 3))
+    if edit == 0:
+        return text[:position] + text[position + 1:]
+    if edit == 1:
+        return text[:position] + text[position] + text[position:]
+    return text[:position] + 'aeiou'[int(generator.integers(0, 5))] + text[position + 1:]
+
+
+# time building an index of entry_count names, searching it for misspelled names, and searching it for names just
+# added (each search after an add updates the delta segment); hits count the queries finding their name among the
+# top k
+# names are two to four words drawn with Zipf frequencies (as in real titles) from word_count words: the words of
+# the ingredient vocabulary, most common first, then made up ones
+def benchmark(entry_count=1000000, word_count=50000, queries=200, k=10, seed=0):
+    import synthetic
+    generator = np.random.default_rng(seed)
+    words = sorted({word for name in synthetic.ingredient_vocabulary() for word in normalize(name).split()})
+    syllables = [consonant + vowel for consonant in 'bcdfghklmnprstvz' for vowel in 'aeiou']
+    known = set(words)
+    while len(words) < word_count:
+        word = ''.join(syllables[int(position)] for position in generator.integers(0, len(syllables),
+                                                                                    int(generator.integers(2, 5))))
+        if word not in known:
+            known.add(word)
+            words.append(word)
+    frequencies = 1.0 / np.arange(1, len(words) + 1)
+
+    def names(count):
+        picks = generator.choice(len(words), (count, 4), p=frequencies / frequencies.sum())
+        sizes = generator.integers(2, 5, count)
+        return [' '.join(words[word] for word in row[:size]) for row, size in zip(picks.tolist(), sizes.tolist())]
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.add_vocabulary()
+    while len(index) < entry_count:
+        for name in names(entry_count):
+            index.add(name, 'recipe')
+            if len(index) == entry_count:
+                break
+    added = time.perf_counter()
+    index.build()
+    print('build: {0:.2f}s adding {1} names, {2:.2f}s building the index of them and {3} words'.format(
+        added - start, len(index), time.perf_counter() - added, len(index.words)))
+    targets = generator.integers(0, len(index), queries).tolist()
+    latencies = []
+    hits = 0
+    for target in targets:
+        query = misspell(index.texts[target], generator)
+        start = time.perf_counter()
+        results = index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(name == index.texts[index.canonical[target]] for name, _, _ in results)
+    latencies.sort()
+    print('search: median {0:.3f}ms, p95 {1:.3f}ms, {2}/{3} misspelled entries found in the top {4}'.format(
+        latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000, hits, queries, k))
+    latencies = []
+    hits = 0
+    for name in names(queries):
+        name = normalize(name + ' ' + misspell(words[int(generator.integers(0, len(words)))], generator))
+        index.add(name, 'recipe')
+        start = time.perf_counter()
+        results = index.search(name, k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(result == name for result, _, _ in results)
+    latencies.sort()
+    print('search after an add: median {0:.3f}ms, p95 {1:.3f}ms, {2}/{3} added names found in the top {4}'.format(
+        latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000, hits, queries, k))
+
+
+if __name__ == '__main__':
+    # usage: python search.py benchmark [ENTRY_COUNT]
+    #        python search.py serve [PORT] [INDEX.npz]  (the ingredient vocabulary if no index is given)
+    #        python search.py QUERY
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1000000)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        if len(sys.argv) > 3:
+            search_index = SearchIndex.load(sys.argv[3])
+        else:
+            search_index = SearchIndex()
+            search_index.add_vocabulary()
+        search_server, base_url = serve(search_index, port=int(sys.argv[2]) if len(sys.argv) > 2 else 8000)
+        print('Serving', base_url + '/search?q=...')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            search_server.shutdown()
+    elif len(sys.argv) > 1:
+        search_index = SearchIndex()
+        search_index.add_vocabulary()
+        for result_name, result_kind, result_score in search_index.search(' '.join(sys.argv[1:])):
+            print('{0:.3f}  {1}  ({2})'.format(result_score, result_name, result_kind))
+    else:
+        print('usage: python search.py benchmark [ENTRY_COUNT] | serve [PORT] [INDEX.npz] | QUERY')
+        sys.exit(1)
@@ -0,0 +1,275 @@
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from bs4 import BeautifulSoup
+import lexicon
+import recipe_transform
+
+
+# feature weights: every ingredient name, ingredient category, and method a recipe uses is one feature
+INGREDIENT_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.5
+METHOD_WEIGHT = 0.5
+
+# normalized names of meat ingredients, a recipe using none of them is vegetarian
+MEAT_NAMES = frozenset(lexicon.normalize(name) for name in recipe_transform.INGREDIENT_CATEGORIES['meat'])
+
+
+# get the normalized names the vegetarian transformation replaces ingredients with ('vegan shrimp', 'mock duck',
+# 'tofu'), by applying the substitutions of its rules to a stand-in for each rule key
+def vegetarian_replacements():
+    names = set()
+    transformation = recipe_transform.TRANSFORMATIONS['vegetarian']
+    for rules in (transformation['rules'], transformation['baking_rules']):
+        for table in ('names', 'adjectives', 'categories', 'exceptions'):
+            for key, rule in (rules or {}).get(table, {}).items():
+                ingredient = recipe_transform.Ingredient(key, None, None, None, None)
+                for substitution in rule['substitutions']:
+                    substitution(ingredient)
+                names.add(lexicon.normalize(' '.join(filter(None, [ingredient.adjective, ingredient.name]))))
+    return frozenset(names - MEAT_NAMES)
+
+
+# normalized names of the vegetarian stand-ins for meat, vegetarian though they contain meat words
+VEGETARIAN_NAMES = vegetarian_replacements()
+
+
+# get the features of a parsed recipe
+# returns a dictionary of feature ('ingredient:name', 'category:name', 'method:name') to weight
+def recipe_features(recipe):
+    features = {}
+    for ingredient in recipe.ingredients:
+        if ingredient.name:
+            features['ingredient:' + lexicon.normalize(ingredient.name)] = INGREDIENT_WEIGHT
+        if ingredient.category:
+            features['category:' + ingredient.category] = CATEGORY_WEIGHT
+    for method in filter(None, [recipe.primary_method] + list(recipe.other_methods)):
+        features['method:' + method] = METHOD_WEIGHT
+    return features
+
+
+# check if a parsed recipe has no meat ingredients (the stand-ins the vegetarian transformation uses are not meat)
+def is_vegetarian(recipe):
+    for ingredient in recipe.ingredients:
+        name = lexicon.normalize(' '.join(filter(None, [ingredient.adjective, ingredient.name])))
+        if name not in VEGETARIAN_NAMES and any(word in MEAT_NAMES for word in name.split()):
+            return False
+    return True
+
+
+# in-memory recipe similarity index
+# recipes are rows of a sparse matrix in CSR form (indptr, indices, data) over a feature vocabulary, with every row
+# scaled to unit length, so the cosine similarity of a query with every recipe is one vectorized dot product
+
+class RecipeIndex:
+    def __init__(self, features=None, names=None, vegetarian=None, indptr=None, indices=None, data=None):
+        self.features = list(features or [])
+        self.feature_ids = {feature: feature_id for feature_id, feature in enumerate(self.features)}
+        self.names = list(names or [])
+        self.vegetarian = np.zeros(0, dtype=bool) if vegetarian is None else vegetarian
+        self.indptr = np.zeros(1, dtype=np.int64) if indptr is None else indptr
+        self.indices = np.zeros(0, dtype=np.int32) if indices is None else indices
+        self.data = np.zeros(0, dtype=np.float64) if data is None else data
+        # rows added since the arrays were last built: (name, {feature id: weight}, vegetarian)
+        self.pending = []
+        self.rows = None
+
+    def __len__(self):
+        return len(self.names) + len(self.pending)
+
+    def add(self, recipe, name=None):
+        # add a parsed recipe
+        self.add_features(name or recipe.name, recipe_features(recipe), is_vegetarian(recipe))
+
+    def add_features(self, name, features, vegetarian):
+        # add a recipe by its features (see recipe_features)
+        row = {}
+        for feature, weight in features.items():
+            feature_id = self.feature_ids.get(feature)
+            if feature_id is None:
+                feature_id = self.feature_ids[feature] = len(self.features)
+                self.features.append(feature)
+            row[feature_id] = row.get(feature_id, 0.0) + weight
+        self.pending.append((name, row, vegetarian))
+
+    def build(self):
+        # append the pending rows to the arrays
+        if not self.pending:
+            return
+        counts = [len(row) for _, row, _ in self.pending]
+        indices = np.fromiter((feature_id for _, row, _ in self.pending for feature_id in row), dtype=np.int32,
+                              count=sum(counts))
+        data = np.fromiter((weight for _, row, _ in self.pending for weight in row.values()), dtype=np.float64,
+                           count=sum(counts))
+        self.extend(np.array(counts, dtype=np.int64), indices, data, [name for name, _, _ in self.pending],
+                    np.array([vegetarian for _, _, vegetarian in self.pending], dtype=bool))
+        self.pending = []
+
+    def extend(self, counts, indices, data, names, vegetarian):
+        # append rows given as arrays: number of features of each row, then their feature ids and weights
+        rows = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+        lengths = np.sqrt(np.bincount(rows, weights=data * data, minlength=len(counts)))
+        data = data / np.where(lengths > 0, lengths, 1.0)[rows]
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(counts)])
+        self.indices = np.concatenate([self.indices, indices.astype(np.int32)])
+        self.data = np.concatenate([self.data, data])
+        self.names.extend(names)
+        self.vegetarian = np.concatenate([self.vegetarian, vegetarian])
+        self.rows = None
+
+    def vector(self, features):
+        # make a dense unit length query vector, features the index has never seen are left out
+        vector = np.zeros(len(self.features), dtype=np.float64)
+        for feature, weight in features.items():
+            if feature in self.feature_ids:
+                vector[self.feature_ids[feature]] += weight
+        length = np.sqrt(np.dot(vector, vector))
+        return vector / length if length else vector
+
+    def scores(self, features):
+        # cosine similarity of features with every recipe
+        self.build()
+        if self.rows is None:
+            self.rows = np.repeat(np.arange(len(self.names), dtype=np.int64), np.diff(self.indptr))
+        return np.bincount(self.rows, weights=self.data * self.vector(features)[self.indices],
+                           minlength=len(self.names))
+
+    def query(self, recipe, k=10, vegetarian=None, exclude=None):
+        # find the k recipes most similar to a parsed recipe (or a features dictionary)
+        # vegetarian: True/False to only return vegetarian/non vegetarian recipes, None for any
+        # exclude: name of a recipe to leave out (i.e. the query recipe itself)
+        # returns a list of (name, similarity), most similar first
+        features = recipe if isinstance(recipe, dict) else recipe_features(recipe)
+        scores = self.scores(features)
+        if vegetarian is not None:
+            scores = np.where(self.vegetarian == vegetarian, scores, -np.inf)
+        if exclude is not None:
+            scores = np.where(np.array(self.names, dtype=object) == exclude, -np.inf, scores)
+        k = min(k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.names[row], float(scores[row])) for row in top if scores[row] > -np.inf]
+
+    def save(self, path):
+        # write the index to an .npz file
+        self.build()
+        np.savez(path, features=np.array(self.features, dtype=str), names=np.array(self.names, dtype=str),
+                 vegetarian=self.vegetarian, indptr=self.indptr, indices=self.indices, data=self.data)
+
+    @classmethod
+    def load(cls, path):
+        # read an index written by save
+        with np.load(path) as arrays:
+            return cls(arrays['features'].tolist(), arrays['names'].tolist(), arrays['vegetarian'],
+                       arrays['indptr'], arrays['indices'], arrays['data'])
+
+
+# transform a copy of a recipe and find the closest recipes in the index that share the transformed recipe's diet
+# i.e. the existing vegetarian recipes closest to the output of make_vegetarian
+def closest_to_transformed(index, recipe, transformation, k=5):
+    verbose = recipe_transform.VERBOSE.set(False)
+    try:
+        transformed = recipe_transform.transform_recipe(recipe, transformation)
+    finally:
+        recipe_transform.VERBOSE.reset(verbose)
+    return index.query(transformed, k, vegetarian=is_vegetarian(transformed))
+
+
+# build an index of recipe_count random recipes over the features of the synthetic vocabulary
+# every recipe has ingredient_count ingredients (with their categories) and method_count methods
+def random_index(recipe_count, ingredient_count=10, method_count=3, seed=0):
+    import synthetic
+    generator = np.random.default_rng(seed)
+    index = RecipeIndex()
+    ingredients = [lexicon.normalize(name) for name in synthetic.ingredient_vocabulary()]
+    categories = [recipe_transform.CATEGORY_INDEX.get(name, (None, None))[1] for name in ingredients]
+    methods = sorted(set(recipe_transform.METHODS))
+    for feature in (['ingredient:' + name for name in ingredients] +
+                    ['category:' + category for category in recipe_transform.INGREDIENT_CATEGORIES] +
+                    ['method:' + method for method in methods]):
+        if feature not in index.feature_ids:
+            index.feature_ids[feature] = len(index.features)
+            index.features.append(feature)
+    ingredient_ids = np.array([index.feature_ids['ingredient:' + name] for name in ingredients])
+    category_ids = np.array([index.feature_ids['category:' + category] if category else -1
+                             for category in categories])
+    method_ids = np.array([index.feature_ids['method:' + method] for method in methods])
+    meat = np.array([name in MEAT_NAMES for name in ingredients])
+    # sampled with replacement, so the (recipe, feature) pairs are made unique before adding
+    picks = generator.integers(0, len(ingredients), (recipe_count, ingredient_count))
+    method_picks = generator.integers(0, len(methods), (recipe_count, method_count))
+    rows = np.repeat(np.arange(recipe_count), ingredient_count)
+    columns = [(rows, ingredient_ids[picks.ravel()], INGREDIENT_WEIGHT),
+               (rows, category_ids[picks.ravel()], CATEGORY_WEIGHT),
+               (np.repeat(np.arange(recipe_count), method_count), method_ids[method_picks.ravel()], METHOD_WEIGHT)]
+    keys, weights = [], []
+    for column_rows, column_features, weight in columns:
+        keep = column_features >= 0
+        keys.append(column_rows[keep] * len(index.features) + column_features[keep])
+        weights.append(np.full(keep.sum(), weight))
+    keys, first = np.unique(np.concatenate(keys), return_index=True)
+    recipe_rows, indices = np.divmod(keys, len(index.features))
+    index.extend(np.bincount(recipe_rows, minlength=recipe_count), indices, np.concatenate(weights)[first],
+                 ['recipe {0}'.format(row) for row in range(recipe_count)], ~meat[picks].any(axis=1))
+    return index
+
+
+# time building, saving, loading, and querying an index of recipe_count random recipes (saved to path, or to a
+# temporary directory removed afterwards)
+def benchmark(recipe_count=100000, queries=100, k=10, path=None):
+    start = time.perf_counter()
+    index = random_index(recipe_count)
+    print('build: {0:.3f}s for {1} recipes, {2} features, {3} nonzeros'.format(
+        time.perf_counter() - start, len(index), len(index.features), len(index.data)))
+    with tempfile.TemporaryDirectory() as directory:
+        path = path or os.path.join(directory, 'similarity_benchmark.npz')
+        start = time.perf_counter()
+        index.save(path)
+        print('save: {0:.3f}s'.format(time.perf_counter() - start))
+        start = time.perf_counter()
+        index = RecipeIndex.load(path)
+        print('load: {0:.3f}s'.format(time.perf_counter() - start))
+    generator = np.random.default_rng(1)
+    query_rows = generator.integers(0, len(index), queries)
+    for vegetarian in (None, True):
+        latencies = []
+        for row in query_rows.tolist():
+            features = {index.features[feature]: weight for feature, weight in
+                        zip(index.indices[index.indptr[row]:index.indptr[row + 1]].tolist(),
+                            index.data[index.indptr[row]:index.indptr[row + 1]].tolist())}
+            start = time.perf_counter()
+            index.query(features, k, vegetarian)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print('query (vegetarian={0}): median {1:.2f}ms, p95 {2:.2f}ms'.format(
+            vegetarian, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000))
+
+
+if __name__ == '__main__':
+    # usage: python similarity.py benchmark [RECIPE_COUNT]
+    #        python similarity.py INDEX.npz PAGE.html [PAGE.html ...]  (add pages, then list each one's neighbours)
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    elif len(sys.argv) > 2:
+        recipe_transform.VERBOSE.set(False)
+        try:
+            recipe_index = RecipeIndex.load(sys.argv[1])
+        except FileNotFoundError:
+            recipe_index = RecipeIndex()
+        parsed = []
+        for page_path in sys.argv[2:]:
+            with open(page_path) as page_file:
+                parsed.append(recipe_transform.Recipe(BeautifulSoup(page_file.read(), 'html.parser')))
+            recipe_index.add(parsed[-1])
+        recipe_index.save(sys.argv[1])
+        for parsed_recipe in parsed:
+            print(parsed_recipe.name)
+            for neighbour, similarity in recipe_index.query(parsed_recipe, 5, exclude=parsed_recipe.name):
+                print('    {0:.3f}  {1}'.format(similarity, neighbour))
+    else:
+        print('usage: python similarity.py benchmark [RECIPE_COUNT] | INDEX.npz PAGE.html [PAGE.html ...]')
+        sys.exit(1)
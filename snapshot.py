@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import pickle
+import statistics
+import struct
+import subprocess
+import sys
+import time
+
+
+# runtime snapshot of derived lookup state (stopwords, method/tool sets, POS lexicon, lemma table,
+# category reverse index)
+# file layout: magic, format version, sha256 of the source files the state is derived from, payload length, pickle
+# a snapshot is only loaded if its version and source hash match, so editing the source, the units or the rule file
+# invalidates it; a snapshot that cannot be read (empty, truncated, corrupt) is ignored like a stale one, so the
+# state is rebuilt
+
+SNAPSHOT_MAGIC = b'RTSNAP'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('<6sH32sQ')
+SNAPSHOT_SOURCES = ['recipe_transform.py', 'lexicon.py', 'units.py']
+SNAPSHOT_KEYS = ['stopwords', 'methods', 'tools', 'pos_lexicon', 'lemmas', 'category_index']
+
+
+# get the paths of the files the snapshot state is derived from: the sources and the rule file in use (whose rule
+# keys are pre-tagged, see snapshot_vocabulary; found as recipe_transform.RULES_PATH does)
+def source_paths():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    rules_path = os.environ.get('RECIPE_RULES') or os.path.join(directory, 'rules.json')
+    return [os.path.join(directory, source) for source in SNAPSHOT_SOURCES] + [rules_path]
+
+
+# hash the files the snapshot state is derived from
+def source_hash():
+    digest = hashlib.sha256()
+    for path in source_paths():
+        with open(path, 'rb') as source_file:
+            digest.update(source_file.read())
+    return digest.digest()
+
+
+# load a snapshot from path, returns None if there is no snapshot or it is stale or unreadable
+def load_snapshot(path):
+    if not path:
+        return None
+    try:
+        with open(path, 'rb') as snapshot_file:
+            header = snapshot_file.read(SNAPSHOT_HEADER.size)
+            if len(header) < SNAPSHOT_HEADER.size:
+                return None
+            magic, version, digest, length = SNAPSHOT_HEADER.unpack(header)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or digest != source_hash():
+                return None
+            payload = snapshot_file.read(length)
+        if len(payload) < length:
+            return None
+        state = pickle.loads(payload)
+    except Exception:  # missing or unreadable file, corrupt pickle
+        return None
+    if not isinstance(state, dict) or any(key not in state for key in SNAPSHOT_KEYS):
+        return None
+    return state
+
+
+# collect every word the ingredient parser is likely to ask wordnet about
+def snapshot_vocabulary(recipe_transform, extra_words=()):
+    words = set(extra_words)
+    for phrases in recipe_transform.INGREDIENT_CATEGORIES.values():
+        for phrase in phrases:
+            words.update(phrase.split())
+    for phrase in list(recipe_transform.SYNONYMS) + list(recipe_transform.SYNONYMS.values()):
+        words.update(phrase.split())
+    words.update(recipe_transform.UNITS)
+    words.update(recipe_transform.METHODS)
+    words.update(recipe_transform.TOOLS)
+    with open(recipe_transform.RULES['path']) as rules_file:  # keys of every rule table, as written in the file
+        rules = json.load(rules_file)
+    for transformation in rules['transformations'].values():
+        for rule_set in (transformation['rules'], transformation['baking_rules'] or {}):
+            for table in rule_set.values():
+                if isinstance(table, dict):
+                    for key in table:
+                        words.update(key.split())
+    return sorted(words)
+
+
+# build the derived state from scratch and write it to path
+def build_snapshot(path, extra_words=()):
+    # importing here keeps load_snapshot usable while recipe_transform is still being imported
+    import lexicon
+    import recipe_transform
+    for word in snapshot_vocabulary(recipe_transform, extra_words):
+        lexicon.pos_tags(word)
+        lexicon.lemma(word)
+    state = {'stopwords': recipe_transform.STOPWORDS,
+             'methods': recipe_transform.METHOD_SET,
+             'tools': recipe_transform.TOOL_SET,
+             'pos_lexicon': dict(lexicon.POS_LEXICON),
+             'lemmas': dict(lexicon.LEMMAS),
+             'category_index': recipe_transform.CATEGORY_INDEX}
+    payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, source_hash(), len(payload))
+    # write to a temporary file and rename so running workers never see a half written snapshot
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as snapshot_file:
+        snapshot_file.write(header)
+        snapshot_file.write(payload)
+    os.replace(temporary_path, path)
+    return len(state['pos_lexicon'])
+
+
+# time a fresh interpreter importing recipe_transform and parsing an ingredient, with and without a snapshot
+def benchmark_startup(path, runs=10):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    code = 'import recipe_transform; recipe_transform.add_ingredient("2 large eggs")'
+    results = {}
+    for label, snapshot_path in [('cold', ''), ('snapshot', path)]:
+        environment = dict(os.environ, RECIPE_SNAPSHOT=snapshot_path)
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=directory, env=environment, check=True,
+                           stdout=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        results[label] = timings
+        print('{0:>8}: median {1:.3f}s, min {2:.3f}s over {3} runs'.format(
+            label, statistics.median(timings), min(timings), runs))
+    return results
+
+
+if __name__ == '__main__':
+    # usage: python snapshot.py build PATH [WORDS_FILE]
+    #        python snapshot.py benchmark PATH [RUNS]
+    if len(sys.argv) < 3 or sys.argv[1] not in ('build', 'benchmark'):
+        print('usage: python snapshot.py build PATH [WORDS_FILE] | benchmark PATH [RUNS]')
+        sys.exit(1)
+    if sys.argv[1] == 'build':
+        words = []
+        if len(sys.argv) > 3:
+            with open(sys.argv[3]) as words_file:
+                words = words_file.read().split()
+        count = build_snapshot(sys.argv[2], words)
+        print('Wrote snapshot with {0} lexicon entries to {1}'.format(count, sys.argv[2]))
+    else:
+        benchmark_startup(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 10)
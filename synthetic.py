@@ -0,0 +1,245 @@
+import html
+import math
+import random
+import sys
+import time
+from bs4 import BeautifulSoup
+import recipe_transform
+
+
+# synthetic recipe generator
+# recipes are drawn deterministically from a seed, using the ingredient categories, methods, tools, units and
+# substitution rule keys of recipe_transform, and can be rendered as allrecipes shaped pages for Recipe to parse
+
+ADJECTIVES = ['fresh', 'chopped', 'large', 'small', 'minced', 'sliced', 'ground', 'dried', 'white', 'brown', 'whole',
+              'unsalted', 'shredded', 'grated', 'diced', 'frozen']
+AMOUNTS = ['1', '2', '3', '4', '1/2', '1/4', '3/4', '1/3']
+CONNECTORS = ['and', 'with', 'into', 'over', 'then']
+
+
+# collect ingredient names to draw from: every categorized ingredient and every rule key of every transformation
+def ingredient_vocabulary():
+    names = set()
+    for phrases in recipe_transform.INGREDIENT_CATEGORIES.values():
+        names.update(phrases)
+    for transformation in recipe_transform.TRANSFORMATIONS.values():
+        for rules in (transformation['rules'], transformation['baking_rules']):
+            if rules:
+                names.update(rules['names'])
+                names.update(rules['exceptions'])
+    return sorted(names)
+
+
+# generate a structured recipe: name, ingredient lines, and step texts
+# overlap is the share of ingredients that reuse the core name of an earlier ingredient with another adjective
+# step_length is the rough number of words in each step
+def generate_recipe(seed, ingredient_count=10, step_count=6, step_length=25, overlap=0.3):
+    generator = random.Random(seed)
+    vocabulary = ingredient_vocabulary()
+    ingredients = []  # (adjective, name) pairs
+    while len(ingredients) < ingredient_count:
+        if ingredients and generator.random() < overlap:
+            name = generator.choice(ingredients)[1]
+        else:
+            name = generator.choice(vocabulary)
+        adjective = generator.choice(ADJECTIVES)
+        if (adjective, name) not in ingredients:
+            ingredients.append((adjective, name))
+    lines = []
+    for adjective, name in ingredients:
+        if generator.random() < 0.1:
+            lines.append(name + ' to taste')
+            continue
+        amount = generator.choice(AMOUNTS)
+        unit = generator.choice(recipe_transform.UNITS)
+        if amount not in ('1', '1/2', '1/4', '3/4', '1/3'):
+            unit += 's'
+        lines.append(' '.join([amount, unit, adjective, name]))
+    steps = []
+    for _ in range(step_count):
+        words = []
+        while len(words) < step_length:
+            method = generator.choice(recipe_transform.METHODS)
+            adjective, name = generator.choice(ingredients)
+            mention = name if generator.random() < 0.5 else adjective + ' ' + name
+            words.extend([method.capitalize() if not words else method, 'the', mention,
+                          generator.choice(CONNECTORS), 'the', generator.choice(ingredients)[1],
+                          'in', 'the', generator.choice(recipe_transform.TOOLS) + ','])
+        steps.append(' '.join(words).rstrip(',') + '.')
+    name = ' '.join(word.capitalize() for word in (ingredients[0][1] + ' ' + generator.choice(['bake', 'stew',
+                                                                                                 'skillet'])).split())
+    return {'name': name, 'ingredients': lines, 'steps': steps}
+
+
+# render a structured recipe as an allrecipes shaped page
+def recipe_html(recipe):
+    parts = ['<html><body>', '<h1 id="recipe-main-content">' + html.escape(recipe['name']) + '</h1>', '<ul>']
+    for line in recipe['ingredients']:
+        parts.append('<li><span class="recipe-ingred_txt added">' + html.escape(line) + '</span></li>')
+    parts.append('</ul><ol class="list-numbers recipe-directions__list">')
+    for step in recipe['steps']:
+        parts.append('<li><span>' + html.escape(step) + '</span></li>')
+    parts.append('</ol></body></html>')
+    return '\n'.join(parts)
+
+
+# generate count synthetic pages, recipe i uses seed + i
+def generate_corpus(count, seed=0, **sizes):
+    for index in range(count):
+        yield recipe_html(generate_recipe(seed + index, **sizes))
+
+
+# time each stage of parsing and transforming one synthetic page
+def time_stages(page, transformation='healthy'):
+    recipe_transform.VERBOSE.set(False)
+    timings = {}
+    start = time.perf_counter()
+    soup = BeautifulSoup(page, 'html.parser')
+    timings['soup'] = time.perf_counter() - start
+    start = time.perf_counter()
+    recipe = recipe_transform.Recipe(soup)
+    timings['recipe'] = time.perf_counter() - start
+    start = time.perf_counter()
+    for step in recipe.steps:
+        recipe_transform.Step(step.text, recipe.ingredients)
+    timings['steps'] = time.perf_counter() - start
+    rules = recipe.get_rules(transformation)
+    start = time.perf_counter()
+    for step in recipe.steps:
+        recipe_transform.make_substitutions_with(step.ingredients, recipe.ingredient_switches, rules['names'],
+                                                 rules['adjectives'], rules['categories'], rules['exceptions'],
+                                                 rules['vegetarian'])
+    timings['substitutions'] = time.perf_counter() - start
+    start = time.perf_counter()
+    recipe.alter_steps()
+    timings['alter_steps'] = time.perf_counter() - start
+    return timings
+
+
+# fit the exponent of runtime against size on a log-log scale (1 is linear, 2 is quadratic)
+def growth_exponent(sizes, timings):
+    points = [(math.log(size), math.log(max(timing, 1e-9))) for size, timing in zip(sizes, timings)]
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+# time every stage while scaling ingredient count (steps fixed) and step count (ingredients fixed)
+# stages growing faster than max_exponent are reported as complexity regressions
+# if matplotlib is installed and plot_path is given, runtime against size is plotted there
+def scaling_benchmark(sizes=(5, 10, 20, 40, 80), repeat=3, seed=0, max_exponent=1.5, plot_path=None):
+    sweeps = {'ingredients': lambda size: {'ingredient_count': size, 'step_count': 10},
+              'steps': lambda size: {'ingredient_count': 15, 'step_count': size}}
+    results = {}
+    regressions = []
+    for sweep, make_sizes in sweeps.items():
+        results[sweep] = {}
+        for size in sizes:
+            page = recipe_html(generate_recipe(seed, **make_sizes(size)))
+            runs = [time_stages(page) for _ in range(repeat)]
+            for stage in runs[0]:
+                results[sweep].setdefault(stage, []).append(min(run[stage] for run in runs))
+        print('\nScaling {0} count:'.format(sweep))
+        print('{0:>14}'.format('stage') + ''.join('{0:>10}'.format(size) for size in sizes) + '  exponent')
+        for stage, timings in results[sweep].items():
+            # fit the larger half of the sizes, where fixed overheads no longer hide the growth
+            half = len(sizes) // 2
+            exponent = growth_exponent(sizes[half:], timings[half:])
+            print('{0:>14}'.format(stage) + ''.join('{0:>9.2f}ms'.format(timing * 1000) for timing in timings) +
+                  '  {0:.2f}'.format(exponent))
+            if exponent > max_exponent:
+                regressions.append((sweep, stage, exponent))
+    for sweep, stage, exponent in regressions:
+        print('WARNING: {0} grows as {1} count^{2:.2f}'.format(stage, sweep, exponent))
+    if plot_path:
+        plot_scaling(sizes, results, plot_path)
+    return results, regressions
+
+
+# time substitution bookkeeping (removing a quarter of a recipe's ingredients and adding a quarter back, half of them
+# combining with ones already there) on synthetic recipes with hundreds of ingredients, scanning a plain list as the
+# substitution code used to and through IngredientList
+def ingredient_list_benchmark(sizes=(100, 200, 400, 800), repeat=3, seed=0):
+    recipe_transform.VERBOSE.set(False)
+
+    def scan(ingredients, removed, added):
+        for ingredient in removed:
+            ingredients.remove(ingredient)
+        for added_ingredient in added:
+            if not any(ingredient.name == added_ingredient.name and ingredient.adjective == added_ingredient.adjective
+                       for ingredient in ingredients):
+                ingredients.append(added_ingredient)
+
+    def keyed(ingredients, removed, added):
+        for ingredient in removed:
+            ingredients.remove(ingredient)
+        for added_ingredient in added:
+            if not ingredients.merge(added_ingredient):
+                ingredients.append(added_ingredient)
+
+    print('{0:>12}{1:>12}{2:>12}{3:>16}'.format('ingredients', 'list', 'keyed', 'substitutions'))
+    for size in sizes:
+        page = recipe_html(generate_recipe(seed, ingredient_count=size, step_count=10))
+        recipe = recipe_transform.Recipe(BeautifulSoup(page, 'html.parser'))
+        timings = {}
+        for name, run, make_list in (('list', scan, list), ('keyed', keyed, recipe_transform.IngredientList)):
+            best = None
+            for _ in range(repeat):
+                originals = [recipe_transform.Ingredient(ingredient.name, ingredient.adjective, ingredient.category,
+                                                         ingredient.amount, ingredient.unit)
+                             for ingredient in recipe.ingredients]
+                ingredients = make_list(originals)
+                removed = originals[::4]
+                added = [recipe_transform.Ingredient(ingredient.name, ingredient.adjective, ingredient.category,
+                                                     None, None) for ingredient in originals[1::8]]
+                added += [recipe_transform.Ingredient('extra ' + str(count), None, None, 1, 'cup')
+                          for count in range(len(added))]
+                start = time.perf_counter()
+                run(ingredients, removed, added)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+        substitutions = min(time_stages(page)['substitutions'] for _ in range(repeat))
+        print('{0:>12}{1:>10.2f}ms{2:>10.2f}ms{3:>14.2f}ms'.format(
+            len(recipe.ingredients), timings['list'] * 1000, timings['keyed'] * 1000, substitutions * 1000))
+
+
+# plot runtime against size for every sweep and stage (needs matplotlib)
+def plot_scaling(sizes, results, plot_path):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib is not installed, skipping plot')
+        return
+    figure, axes = plt.subplots(1, len(results), figsize=(6 * len(results), 4))
+    for axis, (sweep, stages) in zip(axes, results.items()):
+        for stage, timings in stages.items():
+            axis.loglog(sizes, [timing * 1000 for timing in timings], marker='o', label=stage)
+        axis.set_xlabel(sweep + ' count')
+        axis.set_ylabel('runtime (ms)')
+        axis.legend()
+    figure.tight_layout()
+    figure.savefig(plot_path)
+    print('Saved plot to', plot_path)
+
+
+if __name__ == '__main__':
+    # usage: python synthetic.py benchmark [PLOT.png]
+    #        python synthetic.py ingredients  (ingredient list benchmark)
+    #        python synthetic.py generate COUNT DIRECTORY [SEED]
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        failed = scaling_benchmark(plot_path=sys.argv[2] if len(sys.argv) > 2 else None)[1]
+        sys.exit(1 if failed else 0)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'ingredients':
+        ingredient_list_benchmark()
+    elif len(sys.argv) > 3 and sys.argv[1] == 'generate':
+        first_seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+        for count, page in enumerate(generate_corpus(int(sys.argv[2]), first_seed)):
+            with open('{0}/synthetic_{1:05d}.html'.format(sys.argv[3], first_seed + count), 'w') as page_file:
+                page_file.write(page)
+    else:
+        print('usage: python synthetic.py benchmark [PLOT.png] | ingredients | generate COUNT DIRECTORY [SEED]')
+        sys.exit(1)
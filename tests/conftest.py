@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+# the modules are flat files at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# keep recipes from printing themselves while tests parse and transform them
+@pytest.fixture(autouse=True)
+def quiet():
+    import recipe_transform
+    token = recipe_transform.VERBOSE.set(False)
+    yield
+    recipe_transform.VERBOSE.reset(token)
@@ -0,0 +1,56 @@
+import pytest
+from bs4 import BeautifulSoup
+import archive
+import golden
+import recipe_transform
+import synthetic
+
+
+# a recipe's parts, with step ingredients and ingredient spans given by the position of the ingredient in the recipe
+def parts(recipe):
+    positions = {id(ingredient): position for position, ingredient in enumerate(recipe.ingredients)}
+    return {'name': recipe.name, 'primary_method': recipe.primary_method, 'other_methods': list(recipe.other_methods),
+            'bake': recipe.bake, 'tools': sorted(recipe.tools),
+            'ingredients': [(ingredient.name, ingredient.adjective, ingredient.category, ingredient.amount,
+                             ingredient.unit) for ingredient in recipe.ingredients],
+            'steps': [(step.text, [positions[id(ingredient)] for ingredient in step.ingredients], list(step.methods),
+                       [(span.start, span.end, span.kind,
+                         positions[id(span.ref)] if span.kind == 'ingredient' else span.ref) for span in step.spans])
+                      for step in recipe.steps]}
+
+
+@pytest.fixture(scope='module')
+def parsed():
+    pages = list(golden.read_corpus(golden.GOLDEN_DIRECTORY).values()) + list(synthetic.generate_corpus(20))
+    pages.append(synthetic.recipe_html({'name': 'Melted Butter', 'ingredients': ['butter to taste'],
+                                        'steps': ['Melt the butter in a pan.']}))
+    token = recipe_transform.VERBOSE.set(False)
+    recipes = [recipe_transform.Recipe(BeautifulSoup(page, 'html.parser')) for page in pages]
+    recipe_transform.VERBOSE.reset(token)
+    return recipes
+
+
+def test_round_trip(parsed, tmp_path):
+    path = str(tmp_path / 'recipes.rtar')
+    assert archive.write_archive(parsed, path) == len(parsed)
+    with archive.Archive(path) as recipes:
+        assert len(recipes) == len(parsed)
+        for index, recipe in enumerate(parsed):
+            assert parts(recipes.recipe(index)) == parts(recipe)
+
+
+@pytest.mark.parametrize('transformation', list(recipe_transform.TRANSFORMATIONS))
+def test_archived_recipes_transform_like_parsed_ones(parsed, tmp_path, transformation):
+    path = str(tmp_path / 'recipes.rtar')
+    archive.write_archive(parsed, path)
+    with archive.Archive(path) as recipes:
+        for index, recipe in enumerate(parsed):
+            expected = recipe_transform.transform_recipe(recipe, transformation).to_dict()
+            assert recipe_transform.transform_recipe(recipes.recipe(index), transformation).to_dict() == expected
+
+
+def test_benchmark_leaves_no_files(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    archive.benchmark(200)
+    assert 'random access' in capsys.readouterr().out
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,54 @@
+import types
+import numpy as np
+import pytest
+from bs4 import BeautifulSoup
+import columnar
+import nutrition
+import recipe_transform
+import synthetic
+
+
+# ingredients of a recipe of a table as comparable tuples
+def rows(table, index):
+    return [(ingredient.name, ingredient.adjective, ingredient.category,
+             None if ingredient.amount is None else round(ingredient.amount, 6), ingredient.unit)
+            for ingredient in table.to_ingredients(index)]
+
+
+def test_transformation_removes_adds_and_renames_like_transform_recipe():
+    # every ingredient is used by exactly one step, so transforming the page changes each of them once
+    page = synthetic.recipe_html({
+        'name': 'Cheesy Rice',
+        'ingredients': ['1 cup butter', '2 cups rice', '1 cup cheese', '1 cup sugar', '1 pound beef'],
+        'steps': ['Melt the butter in a pan and stir.', 'Boil the rice in a pot.', 'Sprinkle the cheese on top.',
+                  'Stir the sugar into the sauce.', 'Fry the beef in a skillet.']})
+    recipe = recipe_transform.Recipe(BeautifulSoup(page, 'html.parser'))
+    table = columnar.IngredientTable.from_recipes([recipe]).apply_transformation('healthy')
+    expected = columnar.IngredientTable.from_recipes(
+        [types.SimpleNamespace(ingredients=nutrition.transformed_ingredients(recipe, 'healthy'))])
+    assert sorted(rows(table, 0)) == sorted(rows(expected, 0))
+    names = [row[:2] for row in rows(table, 0)]
+    assert ('butter', None) not in names and ('oil', 'olive') in names and ('quinoa', None) in names
+
+
+@pytest.mark.parametrize('transformation', ['healthy', 'unhealthy', 'vegetarian', 'meatify', 'thai', 'mediterranean'])
+def test_vectorized_outcomes_match_the_rules_run_on_every_recipe(transformation):
+    recipes = [types.SimpleNamespace(ingredients=[recipe_transform.add_ingredient(line) for line in
+                                                  synthetic.generate_recipe(seed)['ingredients']])
+               for seed in range(60)]
+    table = columnar.IngredientTable.from_recipes(recipes)
+    transformed = table.apply_transformation(transformation)
+    rules = columnar.transformation_rules(transformation)
+    for index in range(len(table)):
+        ingredients = recipe_transform.IngredientList(table.to_ingredients(index))
+        columnar.apply_rules(ingredients, rules)
+        expected = columnar.IngredientTable.from_recipes([types.SimpleNamespace(ingredients=ingredients)])
+        assert rows(transformed, index) == rows(expected, 0)
+    assert len(transformed) == len(table)
+    assert np.array_equal(table.amounts, columnar.IngredientTable.from_recipes(recipes).amounts,
+                          equal_nan=True)  # left as it was
+
+
+def test_unknown_transformation():
+    with pytest.raises(ValueError):
+        columnar.IngredientTable.from_recipes([]).apply_transformation('spicy')
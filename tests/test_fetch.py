@@ -0,0 +1,115 @@
+import threading
+import time
+import pytest
+import fetch
+import search
+import synthetic
+
+
+PAGE = synthetic.recipe_html({'name': 'Butter Noodles', 'ingredients': ['1 cup butter', '1 pound noodles'],
+                              'steps': ['Boil the noodles in a pot.', 'Fry the butter in a pan.']})
+
+
+# run function on count threads released together, returns their results (or exceptions) in thread order
+def concurrently(function, count):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(position):
+        barrier.wait()
+        try:
+            results[position] = function(position)
+        except Exception as e:
+            results[position] = e
+
+    threads = [threading.Thread(target=run, args=(position,)) for position in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# stub loader parsing PAGE slowly, recording the URLs it was called with
+class SlowLoader:
+    def __init__(self, delay=0.2, error=None):
+        self.delay = delay
+        self.error = error
+        self.urls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, url):
+        with self.lock:
+            self.urls.append(url)
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return fetch.parse_page(PAGE, url)
+
+
+def test_normalize_url():
+    assert (fetch.normalize_url('HTTP://Example.com:80/recipe/1/?utm_source=feed&b=2&a=1#reviews') ==
+            fetch.normalize_url('http://example.com/recipe/1?a=1&b=2') == 'http://example.com/recipe/1?a=1&b=2')
+
+
+def test_single_flight_shares_one_execution():
+    flight = fetch.SingleFlight()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        time.sleep(0.2)
+        return [value]
+
+    results = concurrently(lambda position: flight.do('key', slow, position), 8)
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    stats = flight.stats()
+    assert (stats['calls'], stats['executions'], stats['coalesced']) == (8, 1, 7)
+    assert not flight.flights
+
+
+def test_single_flight_fans_the_exception_out():
+    flight = fetch.SingleFlight()
+
+    def failing():
+        time.sleep(0.2)
+        raise OSError('unreachable')
+
+    results = concurrently(lambda position: flight.do('key', failing), 6)
+    assert all(isinstance(result, OSError) and str(result) == 'unreachable' for result in results)
+    assert flight.stats()['errors'] == 1
+    # the failure is not kept, the next call runs again
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_concurrent_fetches_of_one_url_load_once():
+    loader = SlowLoader()
+    fetcher = fetch.RecipeFetcher(loader)
+    spellings = ['http://example.com/recipe/1/', 'HTTP://example.com/recipe/1?utm_source=feed',
+                 'http://example.com/recipe/1#reviews']
+    recipes = concurrently(lambda position: fetcher.fetch(spellings[position % len(spellings)]), 12)
+    assert len(loader.urls) == 1
+    # the page is loaded from the URL as a caller spelled it, not from its normalized key
+    assert loader.urls[0] in spellings
+    assert all(recipe is recipes[0] for recipe in recipes)
+    assert fetcher.stats()['coalesced'] == 11
+
+
+def test_fetch_failure_reaches_every_caller():
+    fetcher = fetch.RecipeFetcher(SlowLoader(error=OSError('unreachable')))
+    results = concurrently(lambda position: fetcher.fetch('http://example.com/recipe/1'), 5)
+    assert all(isinstance(result, OSError) for result in results)
+
+
+def test_refetched_recipes_are_indexed_once(monkeypatch):
+    index = search.SearchIndex()
+    added = []
+    add_recipe = index.add_recipe
+    monkeypatch.setattr(index, 'add_recipe', lambda recipe: added.append(recipe) or add_recipe(recipe))
+    fetcher = fetch.RecipeFetcher(SlowLoader(delay=0), index)
+    fetcher.fetch('http://example.com/recipe/1')
+    fetcher.fetch('http://example.com/recipe/1/?utm_source=feed')
+    fetcher.fetch('http://example.com/recipe/2')
+    assert len(added) == 2
+    assert fetcher.search('butter noodles', kind='recipe')[0][0] == 'butter noodles'
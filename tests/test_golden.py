@@ -0,0 +1,35 @@
+import nltk
+import pytest
+import golden
+import lexicon
+
+
+# NLTK without its data: every lookup raises LookupError, as a stock install does
+class MissingData:
+    def __getattr__(self, name):
+        raise LookupError('Resource not found: ' + name)
+
+
+def missing_tokenizer(text, *args, **options):
+    raise LookupError('Resource punkt_tab not found')
+
+
+def test_golden_corpus_matches_without_nltk_data(monkeypatch, capsys):
+    monkeypatch.setattr(nltk.corpus, 'wordnet', MissingData())
+    monkeypatch.setattr(nltk.corpus, 'stopwords', MissingData())
+    monkeypatch.setattr(nltk, 'word_tokenize', missing_tokenizer)
+    pages = golden.read_corpus(golden.GOLDEN_DIRECTORY)
+    assert golden.check(pages, golden.ENGINES, golden.read_expected(golden.EXPECTED_PATH),
+                        golden.read_accepted(golden.ACCEPTED_PATH)) == 0
+    assert 'not in the recorded NLTK answers' not in capsys.readouterr().out
+
+
+def test_pinned_nltk_restores_nltk():
+    wordnet, stopwords, tokenize = nltk.corpus.wordnet, nltk.corpus.stopwords, nltk.word_tokenize
+    answers = golden.read_expected(golden.EXPECTED_PATH)[1]
+    tables = dict(lexicon.POS_LEXICON)
+    with golden.PinnedNltk(**answers) as pinned:
+        assert nltk.word_tokenize('Preheat the oven.') == ['Preheat', 'the', 'oven', '.']
+        assert pinned.misses == {'Preheat the oven.'}
+    assert (nltk.corpus.wordnet, nltk.corpus.stopwords, nltk.word_tokenize) == (wordnet, stopwords, tokenize)
+    assert lexicon.POS_LEXICON == tables
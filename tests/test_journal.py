@@ -0,0 +1,78 @@
+import json
+import pytest
+from bs4 import BeautifulSoup
+import journal
+import recipe_transform
+import synthetic
+
+
+URLS = ['http://example.com/recipe/{0}'.format(index) for index in range(6)]
+UNITS = [(url, transformation) for url in URLS for transformation in ('healthy', 'vegetarian,healthy')]
+
+
+# stub loader parsing a synthetic page per URL, failing for the URLs in failing
+def loader(failing=()):
+    def load(url):
+        if url in failing:
+            raise OSError('unreachable')
+        seed = URLS.index(url)
+        return recipe_transform.Recipe(BeautifulSoup(synthetic.recipe_html(synthetic.generate_recipe(seed)),
+                                                     'html.parser'))
+    return load
+
+
+def results(paths):
+    return sorted((result['url'], result['transformation']) for result in journal.read_results(*paths))
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'out.jsonl'), str(tmp_path / 'journal.jsonl')
+
+
+def test_run_then_rerun_skips_everything(paths):
+    counts = journal.run_batch(UNITS, *paths, load=loader(), fsync=False)
+    assert counts['run'] == len(UNITS) and counts['failed'] == 0
+    assert journal.run_batch(UNITS, *paths, load=loader(), fsync=False)['skipped'] == len(UNITS)
+    assert results(paths) == sorted(UNITS)
+
+
+def test_resume_after_truncation(paths):
+    output_path, journal_path = paths
+    journal.run_batch(UNITS, *paths, load=loader(), fsync=False)
+    # the run died while journaling: the last journal line is torn, and a result was written after the last one
+    # journaled
+    with open(journal_path, 'rb') as journal_file:
+        lines = journal_file.readlines()
+    kept = lines[:5]
+    with open(journal_path, 'wb') as journal_file:
+        journal_file.write(b''.join(kept) + lines[5][:len(lines[5]) // 2])
+    end = max(entry['offset'] + entry['length'] for entry in map(json.loads, kept))
+    with open(output_path, 'r+b') as output:
+        output.truncate(end + 40)  # half of the next result
+    counts = journal.run_batch(UNITS, *paths, load=loader(), fsync=False)
+    assert (counts['skipped'], counts['run']) == (5, len(UNITS) - 5)
+    assert results(paths) == sorted(UNITS)
+    # the torn line and the unjournaled partial result are gone, every line of both files is whole
+    for path in paths:
+        with open(path) as resumed:
+            assert [json.loads(line) for line in resumed.read().splitlines()]
+    with open(output_path) as output:
+        assert len(output.read().splitlines()) == len(UNITS)
+
+
+def test_failed_units_are_retried(paths):
+    counts = journal.run_batch(UNITS, *paths, load=loader(failing={URLS[2]}), fsync=False)
+    assert counts['failed'] == 2
+    counts = journal.run_batch(UNITS, *paths, load=loader(), fsync=False)
+    assert (counts['skipped'], counts['run']) == (len(UNITS) - 2, 2)
+    assert results(paths) == sorted(UNITS)
+
+
+def test_read_journal_stops_at_a_torn_line(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    whole = json.dumps({'url': 'a', 'transformation': 'healthy', 'offset': 0, 'length': 10}) + '\n'
+    path.write_text(whole + '{"url": "b", "transformation": "heal')
+    completed, valid = journal.read_journal(str(path))
+    assert completed == {('a', 'healthy'): (0, 10)}
+    assert valid == len(whole)
@@ -0,0 +1,47 @@
+import pytest
+import fetch
+import memory
+import synthetic
+
+
+def page(size):
+    return synthetic.recipe_html(synthetic.generate_recipe(0, ingredient_count=size, step_count=size))
+
+
+@pytest.mark.parametrize('mode', memory.MODES)
+def test_page_larger_than_the_ceiling_is_not_parsed(mode, monkeypatch):
+    html = page(50)
+    parsed = []
+    monkeypatch.setattr(fetch, 'BeautifulSoup', lambda *args: parsed.append(args))
+    with pytest.raises(memory.MemoryCeilingExceeded):
+        with memory.MemoryProfile(len(html) // 2, mode) as profile:
+            fetch.parse_page(html)
+    assert not parsed
+    assert profile.exceeded == 'parse'
+
+
+def test_parse_tree_over_the_ceiling_aborts_before_the_recipe():
+    html = page(50)
+    with pytest.raises(memory.MemoryCeilingExceeded, match='in parse'):
+        with memory.MemoryProfile(len(html) + 1):
+            fetch.parse_page(html)
+
+
+def test_fetch_reads_no_more_than_fits(tmp_path):
+    html = page(50)
+    path = tmp_path / 'page.html'
+    path.write_text(html)
+    with pytest.raises(memory.MemoryCeilingExceeded, match='in fetch'):
+        with memory.MemoryProfile(len(html) // 2):
+            fetch.fetch_page(path.as_uri())
+    with memory.MemoryProfile(100 * len(html)) as profile:
+        recipe = fetch.fetch_page(path.as_uri())
+    assert recipe.ingredients and profile.exceeded is None
+
+
+def test_stats_count_aborted_recipes():
+    aborted = memory.stats()['aborted']
+    with pytest.raises(memory.MemoryCeilingExceeded):
+        with memory.MemoryProfile(10):
+            fetch.parse_page(page(5))
+    assert memory.stats()['aborted'] == aborted + 1
@@ -0,0 +1,40 @@
+import pytest
+from bs4 import BeautifulSoup
+import nutrition
+import recipe_transform
+import synthetic
+
+
+# parse a page made from ingredient lines and step texts
+def parse(ingredients, steps, name='Test Recipe'):
+    page = synthetic.recipe_html({'name': name, 'ingredients': ingredients, 'steps': steps})
+    return recipe_transform.Recipe(BeautifulSoup(page, 'html.parser'))
+
+
+def test_healthy_swaps_butter_for_olive_oil():
+    recipe = parse(['1 cup butter', '1 pound noodles'],
+                   ['Boil the noodles in a pot.', 'Melt the butter in a pan and toss the noodles.'])
+    used = nutrition.transformed_ingredients(recipe, 'healthy')
+    assert [(ingredient.adjective, ingredient.name, ingredient.amount) for ingredient in used] == [
+        (None, 'noodles', 1.0), ('olive', 'oil', 0.5)]
+    deltas = nutrition.nutrition_deltas([recipe], 'healthy')
+    delta = dict(zip(nutrition.NUTRIENTS, deltas['delta'][0].tolist()))
+    # a cup of butter (184g fat, 1309mg sodium) out, half a cup of olive oil (8 tablespoons of 13.5g fat) in
+    assert delta['fat'] == pytest.approx(8 * 13.5 - 184)
+    assert delta['sodium'] == pytest.approx(8 * 0.3 - 1309)
+    assert deltas['after_coverage'][0] == 1.0
+    # the parsed recipe itself is left as it was
+    assert [ingredient.name for ingredient in recipe.ingredients] == ['butter', 'noodles']
+
+
+def test_ingredients_no_step_uses_are_kept():
+    recipe = parse(['1 cup butter', '1 teaspoon salt'], ['Fry the butter in a pan.'])
+    used = nutrition.transformed_ingredients(recipe, 'healthy')
+    assert sorted(ingredient.name for ingredient in used) == ['oil', 'salt']
+
+
+def test_finish_additions_are_counted():
+    recipe = parse(['1 pound chicken'], ['Fry the chicken in a pan.'])
+    deltas = nutrition.nutrition_deltas([recipe], 'unhealthy')
+    assert 'salt' in [ingredient.name for ingredient in nutrition.transformed_ingredients(recipe, 'unhealthy')]
+    assert deltas['delta'][0][nutrition.NUTRIENTS.index('sodium')] > 0
@@ -0,0 +1,60 @@
+import pytest
+import budget
+import memory
+import pipeline
+
+
+def double(value):
+    return value * 2
+
+
+def fail_on_six(value):
+    if value == 6:
+        raise ValueError('six')
+    return value
+
+
+def test_outputs_every_input_and_passes_failures_on():
+    stages = [pipeline.Stage('double', double, 3), pipeline.Stage('check', fail_on_six, 2)]
+    results = dict(pipeline.Pipeline(stages, queue_size=2).run(range(10)))
+    assert sorted(results) == list(range(10))
+    assert isinstance(results[3], pipeline.StageError) and results[3].stage == 'check'
+    assert all(results[index] == index * 2 for index in range(10) if index != 3)
+    assert stages[1].metrics['items'] == 10 and stages[1].metrics['errors'] == 1
+
+
+def test_failing_inputs_raise_after_the_items_fed():
+    def inputs():
+        yield from range(5)
+        raise OSError('listing failed')
+
+    run = pipeline.Pipeline([pipeline.Stage('double', double, 2)], queue_size=2).run(inputs())
+    results = []
+    with pytest.raises(OSError, match='listing failed'):
+        for item in run:
+            results.append(item)
+    assert sorted(results) == [(index, index * 2) for index in range(5)]
+
+
+def budgeted(value):
+    with budget.Budget(60):
+        return value
+
+
+def over_ceiling(value):
+    with memory.MemoryProfile(1000):
+        data = bytearray(100000)
+        memory.check('test')
+    return len(data)
+
+
+def test_process_stage_stats_reach_the_parent():
+    requests = budget.stats()['requests']
+    aborted = memory.stats()['aborted']
+    stages = [pipeline.Stage('budgeted', budgeted, 2, 'process'), pipeline.Stage('memory', over_ceiling, 2, 'process')]
+    results = dict(pipeline.Pipeline(stages).run(range(4)))
+    assert all(isinstance(result, pipeline.StageError) and isinstance(result.error, memory.MemoryCeilingExceeded)
+               for result in results.values())
+    assert budget.stats()['requests'] == requests + 4
+    assert memory.stats()['aborted'] == aborted + 4
+    assert memory.stats()['exceeded']['test'] >= 4
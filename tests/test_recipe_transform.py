@@ -0,0 +1,72 @@
+import pytest
+from bs4 import BeautifulSoup
+import recipe_transform
+import similarity
+import synthetic
+
+
+# parse a page made from ingredient lines and step texts
+def parse(ingredients, steps, name='Test Recipe'):
+    page = synthetic.recipe_html({'name': name, 'ingredients': ingredients, 'steps': steps})
+    return recipe_transform.Recipe(BeautifulSoup(page, 'html.parser'))
+
+
+@pytest.mark.parametrize('transformation', list(recipe_transform.TRANSFORMATIONS))
+def test_recipe_without_known_methods(transformation):
+    recipe = parse(['1 cup butter'], ['Melt the butter in a pan.'])
+    assert recipe.primary_method is None
+    assert recipe.other_methods == []
+    assert not recipe.bake
+    assert recipe.to_dict()['primary_method'] is None
+    assert 'method:None' not in similarity.recipe_features(recipe)
+    recipe_transform.transform_recipe(recipe, transformation)
+
+
+# check a list's (name, adjective) and category indexes against its members
+def assert_indexed(ingredients):
+    keys, categories = {}, {}
+    for ingredient in ingredients:
+        assert ingredients in ingredient.lists
+        keys.setdefault((ingredient.name, ingredient.adjective), set()).add(id(ingredient))
+        categories.setdefault(ingredient.category, set()).add(id(ingredient))
+    assert {key: set(group) for key, group in ingredients.keys.items()} == keys
+    assert {key: set(group) for key, group in ingredients.categories.items()} == categories
+
+
+def test_ingredient_list_rekeys_renamed_ingredients():
+    butter = recipe_transform.Ingredient('butter', 'unsalted', 'unhealthy_fats', 1, 'cup')
+    flour = recipe_transform.Ingredient('flour', None, 'unhealthy_grains', 2, 'cup')
+    recipe_list = recipe_transform.IngredientList([butter, flour])
+    step_list = recipe_transform.IngredientList([butter])
+    assert recipe_list.mention_names() == {'butter': butter, 'flour': flour}
+    butter.name = 'oil'
+    butter.adjective = 'olive'
+    butter.category = 'healthy_fats'
+    for ingredients in (recipe_list, step_list):
+        assert ingredients.find('butter', 'unsalted') == []
+        assert ingredients.find('oil', 'olive') == [butter]
+        assert ingredients.in_category('unhealthy_fats') == []
+        assert ingredients.in_category('healthy_fats') == [butter]
+        assert_indexed(ingredients)
+    # the cached mention names follow the rename too
+    assert recipe_list.mention_names() == {'oil': butter, 'flour': flour}
+    # merging goes by the new key
+    assert recipe_list.merge(recipe_transform.Ingredient('oil', 'olive', 'healthy_fats', 4, 'tablespoon'))
+    assert butter.amount == 1.25
+    assert not recipe_list.merge(recipe_transform.Ingredient('butter', 'unsalted', None, 1, 'cup'))
+    # an ingredient removed from a list is no longer re-keyed in it
+    step_list.remove(butter)
+    butter.name = 'ghee'
+    assert step_list.find('ghee', 'olive') == [] and recipe_list.find('ghee', 'olive') == [butter]
+    assert_indexed(recipe_list)
+    assert_indexed(step_list)
+
+
+@pytest.mark.parametrize('transformation', list(recipe_transform.TRANSFORMATIONS))
+def test_transformed_lists_stay_indexed(transformation):
+    for seed in range(10):
+        page = synthetic.recipe_html(synthetic.generate_recipe(seed))
+        recipe = recipe_transform.transform_recipe(recipe_transform.Recipe(BeautifulSoup(page, 'html.parser')),
+                                                   transformation)
+        for ingredients in [recipe.ingredients] + [step.ingredients for step in recipe.steps]:
+            assert_indexed(ingredients)
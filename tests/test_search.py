@@ -0,0 +1,100 @@
+import threading
+import numpy as np
+import pytest
+import search
+
+
+# made up two word recipe names, distinct from the vocabulary and from each other
+def made_up_names(count, seed=0):
+    generator = np.random.default_rng(seed)
+    syllables = [consonant + vowel for consonant in 'bdfgklmnprstvz' for vowel in 'aeiou']
+    names = set()
+    while len(names) < count:
+        names.add(' '.join(''.join(syllables[int(position)] for position in generator.integers(0, len(syllables), 3))
+                           for _ in range(2)))
+    return sorted(names)
+
+
+@pytest.fixture
+def index():
+    index = search.SearchIndex()
+    index.add_vocabulary()
+    for name in made_up_names(300):
+        index.add(name, 'recipe')
+    return index
+
+
+def test_misspelled_and_synonym_queries(index):
+    assert index.search('cayene pepper', 1)[0][:2] == ('cayenne pepper', 'ingredient')
+    name = made_up_names(300)[7]
+    assert index.search(name[:3] + name[4:], 1, 'recipe')[0][0] == name
+
+
+def test_names_added_after_a_build_are_found_through_the_delta(index):
+    index.search('butter')
+    main = index.tables['segments'][0]
+    added = made_up_names(20, seed=1)
+    for name in added:
+        index.add(name, 'recipe')
+    index.add('zucchini blossom', 'ingredient')
+    for name in added:
+        assert index.search(name, 1, 'recipe')[0][0] == name
+    assert index.search('zuchini blosom', 1)[0][0] == 'zucchini blossom'
+    # the main segment was kept, the added names are in a delta segment
+    assert index.tables['segments'][0] is main
+    assert len(index.tables['segments']) == 2
+    assert index.tables['segments'][1]['entries'] == len(index)
+
+
+def test_results_are_the_same_before_and_after_compacting(index):
+    index.search('butter')
+    added = made_up_names(200, seed=2)
+    for name in added:
+        index.add(name, 'recipe')
+    queries = ['chiken', 'olive oil', 'brown suger'] + [name[:-1] for name in added[::20]]
+    before = [index.search(query, 5) for query in queries]
+    assert len(index.tables['segments']) == 2
+    index.compact()
+    assert len(index.tables['segments']) == 1
+    assert [index.search(query, 5) for query in queries] == before
+    # and the same as an index built with all the names at once
+    rebuilt = search.SearchIndex()
+    rebuilt.add_vocabulary()
+    for name in made_up_names(300) + added:
+        rebuilt.add(name, 'recipe')
+    assert [rebuilt.search(query, 5) for query in queries] == before
+
+
+def test_search_while_adding(index, monkeypatch):
+    monkeypatch.setattr(search, 'COMPACT_SIZE', 50)  # compact in the background a few times along the way
+    index.search('butter')
+    added = made_up_names(400, seed=3)
+    errors = []
+    done = threading.Event()
+
+    def add():
+        try:
+            for name in added:
+                index.add(name, 'recipe')
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def query():
+        try:
+            while not done.is_set():
+                for name in added[::40]:
+                    for name_found, kind, score in index.search(name, 3):
+                        assert 0.0 < score <= 1.0 and kind in search.KINDS
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add)] + [threading.Thread(target=query) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    for name in added:
+        assert index.search(name, 1, 'recipe')[0][0] == name
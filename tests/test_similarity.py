@@ -0,0 +1,26 @@
+import pytest
+from bs4 import BeautifulSoup
+import recipe_transform
+import similarity
+import synthetic
+
+
+# parse a page made from ingredient lines and step texts
+def parse(ingredients, steps, name='Test Recipe'):
+    page = synthetic.recipe_html({'name': name, 'ingredients': ingredients, 'steps': steps})
+    return recipe_transform.Recipe(BeautifulSoup(page, 'html.parser'))
+
+
+@pytest.mark.parametrize('meat', ['shrimp', 'duck', 'chicken', 'salmon'])
+def test_vegetarian_transformation_output_is_vegetarian(meat):
+    recipe = parse(['1 pound ' + meat, '2 cups rice'], ['Fry the {0} in a pan.'.format(meat), 'Boil the rice.'])
+    assert not similarity.is_vegetarian(recipe)
+    transformed = recipe_transform.transform_recipe(recipe, 'vegetarian')
+    assert similarity.is_vegetarian(transformed)
+
+
+def test_stand_ins_are_vegetarian_and_meat_is_not():
+    assert {'vegan shrimp', 'mock duck', 'tofu'} <= similarity.VEGETARIAN_NAMES
+    assert not similarity.VEGETARIAN_NAMES & similarity.MEAT_NAMES
+    assert similarity.is_vegetarian(parse(['1 pound mock duck'], ['Fry the duck.']))
+    assert not similarity.is_vegetarian(parse(['1 pound smoked duck'], ['Fry the duck.']))
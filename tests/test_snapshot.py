@@ -0,0 +1,43 @@
+import pytest
+import snapshot
+
+
+@pytest.fixture(scope='module')
+def built(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('snapshot') / 'snapshot.bin')
+    snapshot.build_snapshot(path, ['eggs'])
+    return path
+
+
+def test_round_trip(built):
+    state = snapshot.load_snapshot(built)
+    assert set(snapshot.SNAPSHOT_KEYS) <= set(state)
+    assert 'eggs' in state['pos_lexicon']
+
+
+@pytest.mark.parametrize('damage', ['empty', 'header', 'truncated', 'corrupt', 'missing'])
+def test_unreadable_snapshot_is_ignored(built, tmp_path, damage):
+    with open(built, 'rb') as snapshot_file:
+        data = snapshot_file.read()
+    path = tmp_path / 'damaged.bin'
+    if damage == 'empty':
+        path.write_bytes(b'')
+    elif damage == 'header':
+        path.write_bytes(data[:snapshot.SNAPSHOT_HEADER.size - 1])
+    elif damage == 'truncated':
+        path.write_bytes(data[:len(data) // 2])
+    elif damage == 'corrupt':
+        header = data[:snapshot.SNAPSHOT_HEADER.size]
+        path.write_bytes(header + b'\x80\x05garbage' + bytes(len(data) - len(header) - 9))
+    assert snapshot.load_snapshot(str(path)) is None
+
+
+def test_rule_file_is_part_of_the_source_hash(built, tmp_path, monkeypatch):
+    rules_path = tmp_path / 'rules.json'
+    with open(snapshot.source_paths()[-1]) as rules_file:
+        rules_path.write_text(rules_file.read())
+    monkeypatch.setenv('RECIPE_RULES', str(rules_path))
+    assert snapshot.load_snapshot(built) is not None
+    rules_path.write_text(rules_path.read_text() + '\n')
+    assert snapshot.load_snapshot(built) is None
+
@@ -0,0 +1,66 @@
+import pytest
+from bs4 import BeautifulSoup
+import recipe_transform
+import synthetic
+import units
+
+
+@pytest.mark.parametrize('spelling, unit', [('tbsp', 'tablespoon'), ('Tbsp.', 'tablespoon'), ('TBSP', 'tablespoon'),
+                                            ('T', 'tablespoon'), ('t', 'teaspoon'), ('tsp', 'teaspoon'),
+                                            ('c', 'cup'), ('cups', 'cup'), ('lbs', 'pound'), ('fl oz', 'fluid ounce'),
+                                            ('G', None), ('envelope', None), ('', None)])
+def test_canonical_unit(spelling, unit):
+    assert units.canonical_unit(spelling) == unit
+
+
+@pytest.mark.parametrize('words, amount, used', [(['2'], 2, 1), (['1', '1/2'], 1.5, 2), (['1-1/2'], 1.5, 1),
+                                                 (['½'], 0.5, 1), (['1½'], 1.5, 1), (['1', '2'], 1, 1),
+                                                 (['a'], None, 0), (['1/0'], None, 0), ([], None, 0)])
+def test_parse_amount(words, amount, used):
+    assert units.parse_amount(words) == (amount, used)
+
+
+def test_single_letters_are_units_only_after_a_number():
+    assert units.parse_unit(['T', 'butter'], after_number=True) == ('tablespoon', 1)
+    assert units.parse_unit(['t', 'salt'], after_number=True) == ('teaspoon', 1)
+    assert units.parse_unit(['c', 'flour']) == (None, 0)
+    assert units.parse_unit(['fl', 'oz', 'milk']) == ('fluid ounce', 2)
+
+
+@pytest.mark.parametrize('line, amount, unit', [('1 T butter', 1, 'tablespoon'), ('2 t butter', 2, 'teaspoon'),
+                                                ('3 Tbsp butter', 3, 'tablespoon'), ('1 c butter', 1, 'cup'),
+                                                ('1 (16 ounce) can butter', 16, 'ounce')])
+def test_parsed_ingredient_units(line, amount, unit):
+    page = synthetic.recipe_html({'name': 'Test', 'ingredients': [line], 'steps': ['Fry the butter.']})
+    ingredient = recipe_transform.Recipe(BeautifulSoup(page, 'html.parser')).ingredients[0]
+    assert (ingredient.name, ingredient.amount, ingredient.unit) == ('butter', amount, unit)
+
+
+def test_convert():
+    assert units.convert(1, 'cup', 'tablespoon') == 16
+    assert units.convert(2, 'T', 'tsp') == 6
+    assert units.convert(1, 'pound', 'ounces') == 16
+    assert units.convert(1, 'liter', 'ml') == pytest.approx(1000)
+    assert units.convert(1, 'cup', 'pound') is None
+    assert units.convert(1, 'envelope', 'cup') is None
+    assert units.convert(None, 'cup', 'cup') is None
+
+
+def test_combine():
+    assert units.combine(1, 'cup', 4, 'tablespoon') == 1.25
+    assert units.combine(1, 'tablespoons', 1, 'tbsp') == 2
+    assert units.combine(2, 'envelope', 1, 'envelope') == 3
+    assert units.combine(2, None, 1, None) == 3
+    assert units.combine(1, 'cup', 1, 'pound') is None
+    assert units.combine(1, 'envelope', 1, 'cup') is None
+
+
+def test_conversion_array_matches_convert():
+    import numpy as np
+    codes = np.arange(len(units.UNITS))
+    source, target = np.meshgrid(codes, codes, indexing='ij')
+    converted = units.convert_array(np.ones(source.shape), source, target)
+    for a, b in zip(source.ravel().tolist(), target.ravel().tolist()):
+        expected = units.convert(1, units.UNITS[a], units.UNITS[b])
+        assert np.isnan(converted[a, b]) if expected is None else converted[a, b] == pytest.approx(expected)
+    assert np.isnan(units.convert_array(np.ones(1), np.array([-1]), np.array([0]))[0])
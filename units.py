@@ -0,0 +1,192 @@
+import re
+
+
+# canonical units
+# key: unit name
+# value: (dimension, size in the dimension's base unit), units can only be converted within a dimension
+# volume is measured in teaspoons and mass in ounces, count units (cloves, cans, ...) are each their own dimension
+
+UNIT_SIZES = {
+    'tablespoon': ('volume', 3),
+    'teaspoon': ('volume', 1),
+    'cup': ('volume', 48),
+    'clove': ('clove', 1),
+    'pound': ('mass', 16),
+    'pinch': ('volume', 1 / 16),
+    'dash': ('volume', 1 / 8),
+    'fluid ounce': ('volume', 6),
+    'pint': ('volume', 96),
+    'quart': ('volume', 192),
+    'gallon': ('volume', 768),
+    'milliliter': ('volume', 0.202884),
+    'liter': ('volume', 202.884),
+    'ounce': ('mass', 1),
+    'gram': ('mass', 0.035274),
+    'kilogram': ('mass', 35.274),
+    'can': ('can', 1),
+    'package': ('package', 1),
+    'slice': ('slice', 1),
+    'stick': ('stick', 1),
+    'head': ('head', 1),
+    'bunch': ('bunch', 1),
+    'sprig': ('sprig', 1),
+}
+BASE_UNITS = {'volume': 'teaspoon', 'mass': 'ounce'}
+
+# canonical unit names, the first five are the units the parser has always known
+UNITS = list(UNIT_SIZES)
+
+# unit codes, used as row/column indexes of the conversion matrix
+UNIT_CODES = {unit: code for code, unit in enumerate(UNITS)}
+
+
+# unit spellings
+# key: lowercase spelling (abbreviation or plural, without a trailing period)
+# value: canonical unit name
+
+UNIT_ALIASES = {
+    'tsp': 'teaspoon', 'tsps': 'teaspoon',
+    'tbsp': 'tablespoon', 'tbsps': 'tablespoon', 'tbs': 'tablespoon', 'tbl': 'tablespoon', 'tbls': 'tablespoon',
+    'lb': 'pound', 'lbs': 'pound',
+    'oz': 'ounce', 'fl oz': 'fluid ounce', 'fl. oz': 'fluid ounce',
+    'pt': 'pint', 'pts': 'pint', 'qt': 'quart', 'qts': 'quart', 'gal': 'gallon', 'gals': 'gallon',
+    'ml': 'milliliter', 'millilitre': 'milliliter', 'millilitres': 'milliliter',
+    'litre': 'liter', 'litres': 'liter',
+    'gr': 'gram', 'kg': 'kilogram', 'kgs': 'kilogram',
+    'pkg': 'package', 'pkgs': 'package',
+}
+for unit in UNITS:  # every canonical name and its plurals
+    UNIT_ALIASES[unit] = unit
+    UNIT_ALIASES[unit + 's'] = unit
+    UNIT_ALIASES[unit + 'es'] = unit
+UNIT_ALIASES['fluid ounces'] = 'fluid ounce'
+
+# single letter spellings, case sensitive (T is a tablespoon, t a teaspoon), and only taken as a unit right after an
+# amount when parsing (see parse_unit), since a lone letter elsewhere is rarely one
+LETTER_ALIASES = {'T': 'tablespoon', 't': 'teaspoon', 'c': 'cup', 'C': 'cup', 'l': 'liter', 'L': 'liter', 'g': 'gram'}
+
+
+# unicode vulgar fractions
+
+FRACTIONS = {'½': 1 / 2, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 1 / 4, '¾': 3 / 4, '⅕': 1 / 5, '⅖': 2 / 5, '⅗': 3 / 5,
+             '⅘': 4 / 5, '⅙': 1 / 6, '⅚': 5 / 6, '⅛': 1 / 8, '⅜': 3 / 8, '⅝': 5 / 8, '⅞': 7 / 8}
+
+# a number: whole ("2"), decimal ("1.5"), fraction ("1/2"), unicode fraction ("½"), or joined ("1½", "1-1/2")
+NUMBER = re.compile(r'^(\d+(?:\.\d+)?)?(?:[- ]?(\d+)/(\d+)|([' + ''.join(FRACTIONS) + r']))?$')
+
+
+# conversion matrix
+# CONVERSION[a][b] is the factor converting an amount in unit code a to unit code b, None across dimensions
+
+CONVERSION = [[UNIT_SIZES[source][1] / UNIT_SIZES[target][1]
+               if UNIT_SIZES[source][0] == UNIT_SIZES[target][0] else None
+               for target in UNITS] for source in UNITS]
+
+# NumPy copy of the conversion matrix, with nan across dimensions and an extra nan row and column for code -1
+conversion_array = None
+
+
+# get the canonical name of a unit spelling, None if it is not a unit (or is a single letter and letters is False)
+def canonical_unit(word, letters=True):
+    if not word:
+        return None
+    word = word.rstrip('.')
+    if word in LETTER_ALIASES:  # before lowercasing, which would make T a teaspoon
+        return LETTER_ALIASES[word] if letters else None
+    return UNIT_ALIASES.get(word.lower())
+
+
+# parse a single number word, None if it is not a number
+def parse_number(word):
+    match = NUMBER.match(word)
+    if not match or not any(match.groups()):
+        return None
+    whole, numerator, denominator, vulgar = match.groups()
+    amount = float(whole) if whole else 0.0
+    if numerator:
+        if int(denominator) == 0:
+            return None
+        amount += int(numerator) / int(denominator)
+    if vulgar:
+        amount += FRACTIONS[vulgar]
+    return amount
+
+
+# parse the amount at the start of a list of words, including mixed numbers split over two words ("1 1/2")
+# returns the amount (None if there is none) and how many words it used
+def parse_amount(words):
+    if not words:
+        return None, 0
+    amount = parse_number(words[0])
+    if amount is None:
+        return None, 0
+    if len(words) > 1 and amount == int(amount) and ('/' in words[1] or words[1] in FRACTIONS):
+        fraction = parse_number(words[1])
+        if fraction is not None and fraction < 1:
+            return amount + fraction, 2
+    return amount, 1
+
+
+# parse the unit at the start of a list of words, trying two word spellings ("fl oz") first
+# single letter spellings ("2 T butter") are only taken if after_number, when the words directly follow an amount
+# returns the canonical unit (None if there is none) and how many words it used
+def parse_unit(words, after_number=False):
+    if len(words) > 1 and canonical_unit(words[0] + ' ' + words[1], False):
+        return canonical_unit(words[0] + ' ' + words[1], False), 2
+    if words and canonical_unit(words[0], after_number):
+        return canonical_unit(words[0], after_number), 1
+    return None, 0
+
+
+# convert an amount between units, None if either is unknown or they measure different things
+def convert(amount, source, target):
+    source, target = canonical_unit(source), canonical_unit(target)
+    if amount is None or source is None or target is None:
+        return None
+    factor = CONVERSION[UNIT_CODES[source]][UNIT_CODES[target]]
+    return None if factor is None else amount * factor
+
+
+# add an amount in unit other_unit to an amount in unit, keeping unit
+# returns None if the units cannot be converted (the amounts then have to stay separate), units this module does not
+# know only combine with the very same unit ('envelope' with 'envelope', no unit with no unit)
+def combine(amount, unit, other_amount, other_unit):
+    canonical = canonical_unit(unit)
+    if unit == other_unit or (canonical is not None and canonical == canonical_unit(other_unit)):
+        return amount + other_amount
+    converted = convert(other_amount, other_unit, unit)
+    return None if converted is None else amount + converted
+
+
+# get the base unit of a unit's dimension (teaspoon for volume, ounce for mass, itself for count units)
+def base_unit(unit):
+    unit = canonical_unit(unit)
+    if unit is None:
+        return None
+    return BASE_UNITS.get(UNIT_SIZES[unit][0], unit)
+
+
+# get the NumPy conversion matrix (see conversion_array)
+def conversion_matrix():
+    global conversion_array
+    if conversion_array is None:
+        import numpy as np
+        matrix = np.full((len(UNITS) + 1, len(UNITS) + 1), np.nan)
+        for source, row in enumerate(CONVERSION):
+            for target, factor in enumerate(row):
+                if factor is not None:
+                    matrix[source, target] = factor
+        conversion_array = matrix
+    return conversion_array
+
+
+# convert arrays of amounts from unit codes to unit codes (-1 for unknown units) in one vectorized operation
+# amounts that cannot be converted become nan
+def convert_array(amounts, source_codes, target_codes):
+    return amounts * conversion_matrix()[source_codes, target_codes]
+
+
+# get the unit code of the base unit of every unit code, as a list indexed by code
+def base_codes():
+    return [UNIT_CODES[base_unit(unit)] for unit in UNITS]
+